@@ -0,0 +1,193 @@
+"""Precomputed aggregates of the product table.
+
+The dashboard figures only ever plot per-category (and per-category x store)
+metrics, so ingest computes all of them in one pass and persists them. The
+figure functions then look the metric up instead of grouping the full table
+on every Streamlit rerun.
+
+To rebuild the aggregates from the product store:
+    $ python aggregates.py
+
+For tables that do not fit in memory, ``stream_aggregates.py`` builds the same
+tables chunk by chunk, with sketches for the distinct counts and medians.
+"""
+
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from product_store import load_product_data
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+AGGREGATES_FOLDER = "aggregates"
+CATEGORY_COLUMN = "product_name_chinese_name"
+STORE_COLUMN = "Store Name"
+OTHER_STORES = "Other"
+
+value_columns = ["price", "Total Sales", "proceeds"]
+value_stats = ["sum", "median", "mean"]
+subsets = ["all", "with_sales"]
+
+# Columns of the product table the aggregates are computed from
+source_columns = [
+    CATEGORY_COLUMN,
+    STORE_COLUMN,
+    "Product URL",
+    "has_sales",
+] + value_columns
+
+
+def _metric_name(column: str, stat: str) -> str:
+    return f"{column}|{stat}"
+
+
+def build_category_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """Compute every per-category metric, for all products and those with sales.
+
+    Returns a frame indexed by (subset, category) with one ``column|stat``
+    column per metric.
+    """
+    # Ingest keeps one row per listing and category, so the distinct listings
+    # of a category are its rows
+    aggregations = {
+        _metric_name("Product URL", "count"): ("Product URL", "size"),
+        _metric_name("Product URL", "nunique"): ("Product URL", "size"),
+        _metric_name("has_sales", "mean"): ("has_sales", "mean"),
+    }
+    for col in value_columns:
+        for stat in value_stats:
+            aggregations[_metric_name(col, stat)] = (col, stat)
+
+    frames = {
+        "all": df.groupby(CATEGORY_COLUMN).agg(**aggregations),
+        "with_sales": df[df["has_sales"] == True]
+        .groupby(CATEGORY_COLUMN)
+        .agg(**aggregations),
+    }
+    return pd.concat(frames, names=["subset", CATEGORY_COLUMN])
+
+
+def build_category_store_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """Compute per category x store metrics, including the share of sales."""
+    category_store = (
+        df.groupby([CATEGORY_COLUMN, STORE_COLUMN])
+        .agg(
+            count=("Product URL", "size"),
+            unique_products=("Product URL", "size"),
+            total_sales=("Total Sales", "sum"),
+            proceeds=("proceeds", "sum"),
+            median_price=("price", "median"),
+        )
+        .reset_index()
+    )
+    category_total = category_store.groupby(CATEGORY_COLUMN)["total_sales"].transform(
+        "sum"
+    )
+    category_store["sales_share"] = (
+        category_store["total_sales"] / category_total.where(category_total > 0)
+    ).fillna(0.0)
+    return category_store
+
+
+def top_store_shares(
+    category_store: pd.DataFrame,
+    top_k: Optional[int] = 10,
+    cumulative_share: Optional[float] = None,
+) -> pd.DataFrame:
+    """Keep the leading stores of each category and bucket the rest as "Other".
+
+    Stores are kept while they are in the ``top_k`` of their category by sales
+    and, if ``cumulative_share`` is given, until the kept stores cover that share
+    of the category's sales. Only store x category pairs with sales are returned
+    (a sparse, long frame), so the size is bounded by categories x (top_k + 1).
+    """
+    shares = category_store.loc[
+        category_store["total_sales"] > 0,
+        [CATEGORY_COLUMN, STORE_COLUMN, "total_sales", "sales_share"],
+    ].sort_values([CATEGORY_COLUMN, "sales_share"], ascending=[True, False])
+    grouped = shares.groupby(CATEGORY_COLUMN)
+    # Stores already bucketed as Other (see stream_aggregates.py) stay there
+    keep = shares[STORE_COLUMN] != OTHER_STORES
+    if top_k is not None:
+        keep &= grouped.cumcount() < top_k
+    if cumulative_share is not None:
+        # Share covered by the stores ranked above this one
+        covered = grouped["sales_share"].cumsum() - shares["sales_share"]
+        keep &= covered < cumulative_share
+
+    other = (
+        shares[~keep]
+        .groupby(CATEGORY_COLUMN)[["total_sales", "sales_share"]]
+        .sum()
+        .reset_index()
+        .assign(**{STORE_COLUMN: OTHER_STORES})
+    )
+    return pd.concat([shares[keep], other], ignore_index=True)
+
+
+def build_aggregates(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Compute all the aggregates the dashboard figures read."""
+    return {
+        "category": build_category_aggregates(df),
+        "category_store": build_category_store_aggregates(df),
+    }
+
+
+def write_aggregates(aggregates: Dict[str, pd.DataFrame], output_folder: str):
+    """Persist the aggregates as one Parquet file per table."""
+    folder = os.path.join(output_folder, AGGREGATES_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    for name, df in aggregates.items():
+        df.to_parquet(os.path.join(folder, f"{name}.parquet"))
+    logging.info("Wrote aggregates to %s", folder)
+
+
+def index_metrics(
+    category: pd.DataFrame,
+) -> Dict[Tuple[str, str, str], pd.DataFrame]:
+    """Split the per-category table into one ready-to-plot frame per metric.
+
+    Keys are ``(subset, column, stat)``; each frame has the category column and
+    a value column named after the source column, like the groupbys it replaces.
+    """
+    metrics = {}
+    for subset in category.index.get_level_values("subset").unique():
+        rows = category.xs(subset, level="subset")
+        for name in rows.columns:
+            column, _, stat = name.partition("|")
+            metrics[(subset, column, stat)] = rows[name].rename(column).reset_index()
+    return metrics
+
+
+def load_aggregates(output_folder: str = output_folder) -> Dict:
+    """Load the aggregates, building them from the product store if missing."""
+    folder = os.path.join(output_folder, AGGREGATES_FOLDER)
+    if os.path.exists(folder):
+        aggregates = {
+            name: pd.read_parquet(os.path.join(folder, f"{name}.parquet"))
+            for name in ["category", "category_store"]
+        }
+    else:
+        logging.warning("No aggregates found, computing them from the product table")
+        aggregates = build_aggregates(
+            load_product_data(source_columns, output_folder=output_folder)
+        )
+    aggregates["metrics"] = index_metrics(aggregates["category"])
+    return aggregates
+
+
+def get_metric(
+    aggregates: Dict, column: str, stat: str, subset: str = "all"
+) -> pd.DataFrame:
+    """Look up a per-category metric, e.g. ``get_metric(cube, "price", "median")``."""
+    return aggregates["metrics"][(subset, column, stat)]
+
+
+if __name__ == "__main__":
+    write_aggregates(build_aggregates(load_product_data(source_columns)), output_folder)
@@ -0,0 +1,84 @@
+"""Check the dashboard's startup and rerun times against a budget.
+
+Runs ``streamlitapp.py`` headless with Streamlit's app test harness: once
+cold, then switching to every slide and rerunning it as a widget change
+would. Exits with status 1 if any run is over budget.
+
+Example usage:
+    $ python bench_startup.py
+    $ python bench_startup.py --startup-budget 2 --rerun-budget 0.5
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+app_file = os.path.join(current_directory, "streamlitapp.py")
+
+# Seconds, measured on the full dataset
+STARTUP_BUDGET = 1.5
+SWITCH_BUDGET = 2.0
+RERUN_BUDGET = 0.5
+
+
+def bench_app(app_file: str = app_file, timeout: float = 120) -> dict:
+    """Time the cold first run, then switching to and rerunning each slide."""
+    from streamlit.testing.v1 import AppTest
+
+    timings = {"startup": {}, "switch": {}, "rerun": {}}
+    app = AppTest.from_file(app_file, default_timeout=timeout)
+    start = time.perf_counter()
+    app.run()
+    timings["startup"]["cold"] = time.perf_counter() - start
+    navigation = app.sidebar.selectbox[0]
+    for slide in navigation.options:
+        start = time.perf_counter()
+        navigation.set_value(slide).run()
+        timings["switch"][slide] = time.perf_counter() - start
+        start = time.perf_counter()
+        app.run()
+        timings["rerun"][slide] = time.perf_counter() - start
+        if app.exception:
+            raise RuntimeError(f"{slide}: {app.exception[0].message}")
+        navigation = app.sidebar.selectbox[0]
+    return timings
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=app_file)
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET)
+    parser.add_argument("--switch-budget", type=float, default=SWITCH_BUDGET)
+    parser.add_argument("--rerun-budget", type=float, default=RERUN_BUDGET)
+    args = parser.parse_args(argv)
+    budgets = {
+        "startup": args.startup_budget,
+        "switch": args.switch_budget,
+        "rerun": args.rerun_budget,
+    }
+
+    over_budget = False
+    for kind, runs in bench_app(args.app).items():
+        for name, seconds in runs.items():
+            within = seconds <= budgets[kind]
+            over_budget |= not within
+            logging.log(
+                logging.INFO if within else logging.ERROR,
+                "%-7s %-28s %6.3fs (budget %.1fs)",
+                kind,
+                name,
+                seconds,
+                budgets[kind],
+            )
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+"""Time and memory-profile the analytics path on synthetic data.
+
+At each scale (a multiple of the real scrape's rows) a synthetic product
+table from ``synthetic.py`` is written to a temporary product store, then
+every step from the store to the dashboard figures is benchmarked:
+
+- ``load``: reading the store, as the full, the aggregate-source and the
+  compact table;
+- ``aggregate``: building, writing and loading the aggregate cube;
+- ``figure``: every figure in ``figures.figures``, from the cube.
+
+Each step runs ``--repeat`` times for the timings, then once more under
+tracemalloc for its peak memory. tracemalloc sees numpy and pandas buffers
+but not Arrow's memory pool, so reads of the store are undercounted.
+
+One JSON record per step and scale is written to ``bench_output.txt`` at the
+repository root, to diff against as a baseline.
+
+Example usage:
+    $ python benchmark.py
+    $ python benchmark.py --scales 1 10 100 1000 --repeat 1
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from aggregates import (
+    build_aggregates,
+    load_aggregates,
+    source_columns,
+    write_aggregates,
+)
+from compact import CompactProducts, load_compact
+from figures import calculate_sales_heatmap, figures
+from product_store import load_product_data, write_product_store
+from synthetic import BASE_ROWS, generate_product_data
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_file = os.path.join(current_directory, "../bench_output.txt")
+
+SCALES = [1, 10, 100]
+
+
+def result_bytes(result) -> Optional[int]:
+    """The memory held by a benchmarked step's result, if it is a table."""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=False, deep=True).sum())
+    if isinstance(result, CompactProducts):
+        return int(result.memory_usage().sum())
+    return None
+
+
+def measure(function: Callable, repeat: int) -> Dict:
+    """Time ``repeat`` runs of ``function``, then trace one for its peak memory."""
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    size = result_bytes(result)
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "repeat": repeat,
+        "min_s": min(seconds),
+        "median_s": statistics.median(seconds),
+        "peak_bytes": peak,
+        "result_bytes": size,
+    }
+
+
+def benchmark_steps(folder: str) -> Dict[str, Dict[str, Callable]]:
+    """The steps to benchmark against the product store in ``folder``."""
+    cube = load_aggregates(folder)
+    steps = {
+        "load": {
+            "load_product_data": lambda: load_product_data(output_folder=folder),
+            "load_product_data[source_columns]": lambda: load_product_data(
+                source_columns, output_folder=folder
+            ),
+            "load_compact": lambda: load_compact(output_folder=folder),
+        },
+        "aggregate": {
+            "build_aggregates": lambda: build_aggregates(
+                load_product_data(source_columns, output_folder=folder)
+            ),
+            "write_aggregates": lambda: write_aggregates(
+                build_aggregates(
+                    load_product_data(source_columns, output_folder=folder)
+                ),
+                folder,
+            ),
+            "load_aggregates": lambda: load_aggregates(folder),
+        },
+        "figure": {
+            name: (lambda function=function: function(cube))
+            for name, (function, _) in figures.items()
+        },
+    }
+    steps["figure"]["competitor_heatmap[cumulative_share=0.8]"] = (
+        lambda: calculate_sales_heatmap(cube, top_k=None, cumulative_share=0.8)
+    )
+    return steps
+
+
+def run_benchmarks(
+    scales: List[float] = SCALES, repeat: int = 3, seed: int = 0
+) -> List[Dict]:
+    """Benchmark every step at every scale, returning one record per step."""
+    records = []
+    for scale in scales:
+        rows = int(BASE_ROWS * scale)
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            df = generate_product_data(rows, seed)
+            write_product_store(df, folder)
+            del df
+            write_aggregates(
+                build_aggregates(
+                    load_product_data(source_columns, output_folder=folder)
+                ),
+                folder,
+            )
+            logging.info(
+                "Generated %d rows at %gx in %.1fs",
+                rows,
+                scale,
+                time.perf_counter() - start,
+            )
+            for group, steps in benchmark_steps(folder).items():
+                for name, function in steps.items():
+                    record = {
+                        "scale": scale,
+                        "rows": rows,
+                        "group": group,
+                        "name": name,
+                    }
+                    record.update(measure(function, repeat))
+                    logging.info(
+                        "%6gx %-10s %-48s %9.4fs %9.1f MB",
+                        scale,
+                        group,
+                        name,
+                        record["median_s"],
+                        record["peak_bytes"] / 1e6,
+                    )
+                    records.append(record)
+    return records
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=SCALES,
+        help="Multiples of the real scrape's row count.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=output_file)
+    args = parser.parse_args(argv)
+    records = run_benchmarks(args.scales, args.repeat, args.seed)
+    with open(args.output, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    logging.info("Wrote %d results to %s", len(records), args.output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,183 @@
+"""Memory-compact in-memory representation of the product table.
+
+``load_product_data`` returns text columns as Python strings and ``Tags`` as a
+list per row, which is what dominates a session's resident memory. The
+compact table instead keeps:
+
+- the low-cardinality text columns as categoricals;
+- the flags as real bools and the counts as int32;
+- the tags as one flat array of token IDs into a shared vocabulary, with row
+  ``i``'s tags at ``tag_ids[tag_offsets[i]:tag_offsets[i + 1]]``.
+
+Groupbys on the categorical columns also run on integer codes instead of
+hashing strings (pass ``observed=True``).
+
+To print the bytes per column against ``load_product_data``:
+    $ python compact.py
+"""
+
+import logging
+import os
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from product_store import (
+    CSV_FILE,
+    STORE_FOLDER,
+    count_columns,
+    flag_columns,
+    load_product_data,
+    read_store_table,
+    to_store_types,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+TAGS_COLUMN = "Tags"
+
+category_columns = [
+    "Store Name",
+    "Category",
+    "Ship From",
+    "search_term",
+    "product_name",
+    "product_name_chinese_name",
+]
+
+
+class CompactProducts:
+    """The product table with categorical columns and flattened tags."""
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        tag_vocabulary: pd.Index,
+        tag_ids: np.ndarray,
+        tag_offsets: np.ndarray,
+    ):
+        self.frame = frame
+        self.tag_vocabulary = tag_vocabulary
+        self.tag_ids = tag_ids
+        self.tag_offsets = tag_offsets
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def tags(self, row: int) -> List[str]:
+        """The tags of the row at position ``row``."""
+        start, end = self.tag_offsets[row], self.tag_offsets[row + 1]
+        return self.tag_vocabulary[self.tag_ids[start:end]].tolist()
+
+    def tag_rows(self) -> np.ndarray:
+        """The row position of every entry of ``tag_ids``."""
+        return np.repeat(
+            np.arange(len(self), dtype=np.int32), np.diff(self.tag_offsets)
+        )
+
+    def memory_usage(self) -> pd.Series:
+        """Bytes used by each column, the tag arrays included."""
+        usage = self.frame.memory_usage(index=False, deep=True)
+        tags = pd.Series(
+            {
+                "Tags (ids)": self.tag_ids.nbytes,
+                "Tags (offsets)": self.tag_offsets.nbytes,
+                "Tags (vocabulary)": self.tag_vocabulary.memory_usage(deep=True),
+            }
+        )
+        return pd.concat([usage, tags])
+
+
+def encode_tag_lists(tags: pa.ListArray) -> Tuple[pd.Index, np.ndarray, np.ndarray]:
+    """Dictionary encode an Arrow list-of-strings column.
+
+    Returns the vocabulary, the token IDs and the offsets of each row.
+    """
+    if isinstance(tags, pa.ChunkedArray):
+        tags = tags.combine_chunks()
+    offsets = tags.offsets.to_numpy().astype(np.int64)
+    encoded = tags.flatten().dictionary_encode()
+    vocabulary = pd.Index(encoded.dictionary.to_pandas())
+    ids = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+    return vocabulary, ids, offsets - offsets[0]
+
+
+def encode_tags(tags: pd.Series) -> Tuple[pd.Index, np.ndarray, np.ndarray]:
+    """Dictionary encode a column of tag lists, see ``encode_tag_lists``."""
+    return encode_tag_lists(pa.array(tags.tolist(), type=pa.list_(pa.string())))
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the text, flag and count columns to their compact types."""
+    df = df.copy()
+    for col in category_columns:
+        if col in df:
+            df[col] = df[col].astype("category")
+    for col in flag_columns:
+        if col in df:
+            df[col] = df[col].astype(bool)
+    for col in count_columns:
+        if col in df:
+            df[col] = df[col].astype("int32")
+    return df
+
+
+def load_compact(
+    columns: Optional[List[str]] = None,
+    product_names: Optional[List[str]] = None,
+    output_folder: str = output_folder,
+) -> CompactProducts:
+    """Load the product table in its compact representation.
+
+    Tags are encoded straight from the store's Arrow list column without
+    materializing a Python list per row. Falls back to the CSV if the store has
+    not been built yet.
+    """
+    if columns is not None and TAGS_COLUMN not in columns:
+        columns = columns + [TAGS_COLUMN]
+    if os.path.exists(os.path.join(output_folder, STORE_FOLDER)):
+        table = read_store_table(columns, product_names, output_folder)
+        vocabulary, ids, offsets = encode_tag_lists(table.column(TAGS_COLUMN))
+        df = table.drop_columns([TAGS_COLUMN]).to_pandas()
+    else:
+        logging.warning("No product store found, falling back to %s", CSV_FILE)
+        df = to_store_types(pd.read_csv(os.path.join(output_folder, CSV_FILE)))
+        if product_names is not None:
+            df = df[df["product_name"].isin(product_names)].reset_index(drop=True)
+        vocabulary, ids, offsets = encode_tags(df[TAGS_COLUMN])
+        df = df.drop(columns=TAGS_COLUMN)
+        if columns is not None:
+            df = df[[col for col in columns if col != TAGS_COLUMN]]
+    return CompactProducts(compact_frame(df), vocabulary, ids, offsets)
+
+
+def memory_report(output_folder: str = output_folder) -> pd.DataFrame:
+    """Bytes per column of ``load_product_data`` against the compact table."""
+    plain = load_product_data(output_folder=output_folder)
+    compact = load_compact(output_folder=output_folder)
+    plain_usage = plain.memory_usage(index=False, deep=True)
+    # pandas does not count the strings inside each row's tag list
+    plain_usage[TAGS_COLUMN] += sum(
+        sys.getsizeof(tags) + sum(sys.getsizeof(tag) for tag in tags)
+        for tags in plain[TAGS_COLUMN]
+    )
+    report = pd.DataFrame(
+        {
+            "plain": plain_usage,
+            "compact": compact.memory_usage(),
+        }
+    )
+    report.loc["total"] = report.sum()
+    return report
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else output_folder
+    with pd.option_context("display.float_format", "{:,.0f}".format):
+        print(memory_report(folder))
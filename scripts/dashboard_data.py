@@ -0,0 +1,298 @@
+"""Data access for the dashboard, independent of Streamlit.
+
+Everything the slides show is loaded through a process-wide cache keyed on
+the modification times of the files it is read from, so all sessions and
+reruns share one copy and a new ingest run is picked up on the next rerun.
+The loaders import their modules only when first called, so a slide pays
+only for the data it shows.
+
+Figures are shared across sessions the same way: ``figure_cache`` keeps each
+built figure per dataset version, which ingest publishes in
+``dataset_version.json`` once all its outputs are written. A dozen viewers on
+one slide cost one build, and a new version is picked up on the next rerun.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tracing
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+listing_columns = ["Title", "Store Name", "price", "Total Sales", "Product URL"]
+
+DATASET_VERSION_FILE = "dataset_version.json"
+# Figures kept per dataset version, the widget combinations of all slides
+MAX_FIGURES = 512
+
+
+def file_version(patterns: List[str]) -> Tuple:
+    """The paths and modification times of the files matching ``patterns``."""
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))
+    return tuple((path, os.stat(path).st_mtime_ns) for path in paths)
+
+
+class MtimeCache:
+    """Values loaded from files, reloaded when any of the files change.
+
+    Each value loads under its own lock, so concurrent sessions asking for the
+    same stale value load it once, while other values load in parallel. The
+    shared lock only guards the dicts. A loader can build on other cached
+    values, as long as two loaders do not wait on each other's values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple, Any]] = {}
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def get(self, name: str, loader: Callable[[], Any], patterns: List[str]) -> Any:
+        version = file_version(patterns)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            # Another session may have loaded it while this one waited
+            with self._lock:
+                entry = self._entries.get(name)
+            if entry is None or entry[0] != version:
+                tracing.count("dashboard_cache", result="miss", data=name)
+                with tracing.span("load", data=name):
+                    entry = (version, loader())
+                with self._lock:
+                    self._entries[name] = entry
+            return entry[1]
+
+    def name_of(self, value: Any) -> Optional[str]:
+        """The name a value is cached under, if it is this very object."""
+        with self._lock:
+            for name, (_, cached) in self._entries.items():
+                if cached is value:
+                    return name
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = MtimeCache()
+
+
+def publish_dataset_version(output_folder: str, version: str):
+    """Tell running dashboards the output folder holds a new dataset."""
+    path = os.path.join(output_folder, DATASET_VERSION_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": version, "published": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def dataset_version(output_folder: str = output_folder) -> str:
+    """The published dataset version, or the aggregates' mtimes before any."""
+    try:
+        with open(os.path.join(output_folder, DATASET_VERSION_FILE)) as f:
+            return json.load(f)["version"]
+    except FileNotFoundError:
+        from aggregates import AGGREGATES_FOLDER
+
+        version = file_version(_files(output_folder, AGGREGATES_FOLDER, "*.parquet"))
+        return hashlib.sha256(repr(version).encode()).hexdigest()
+
+
+def _arg_key(value: Any) -> Any:
+    """A hashable stand-in for a figure argument, from its content.
+
+    Values loaded through ``cache``, like the aggregate cube, are keyed by
+    their cache name: they are the dataset itself, which the version already
+    covers. Frames, arrays and containers are keyed on their content, and
+    anything else that is unhashable raises TypeError.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest = hashlib.sha256(",".join(map(str, columns)).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        return type(value).__name__, digest.hexdigest()
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha256(f"{value.dtype}:{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+        return "ndarray", digest.hexdigest()
+    name = cache.name_of(value)
+    if name is not None:
+        return "cached", name
+    try:
+        hash(value)
+    except TypeError:
+        pass
+    else:
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(_arg_key(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return "set", frozenset(_arg_key(item) for item in value)
+    if isinstance(value, dict):
+        items = ((_arg_key(key), _arg_key(item)) for key, item in value.items())
+        return "dict", tuple(sorted(items, key=repr))
+    raise TypeError(f"Cannot key a figure on a {type(value).__name__} argument")
+
+
+class FigureCache:
+    """Built figures shared by all sessions, for one dataset version at a time.
+
+    A figure is built once per version and arguments: sessions asking for a
+    figure that is being built wait for it instead of building it again.
+    Figures must not be modified once built, all sessions share them.
+    """
+
+    def __init__(self, max_entries: int = MAX_FIGURES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._entries: "OrderedDict[Tuple, Future]" = OrderedDict()
+
+    def get(self, version: str, build: Callable, *args, **kwargs) -> Any:
+        key = (
+            build.__module__,
+            build.__qualname__,
+            tuple(_arg_key(arg) for arg in args),
+            tuple(sorted((name, _arg_key(arg)) for name, arg in kwargs.items())),
+        )
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = self._entries[key] = Future()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+        tracing.count(
+            "figure_cache", result="miss" if owner else "hit", figure=build.__name__
+        )
+        if owner:
+            try:
+                with tracing.span("build_figure", figure=build.__name__):
+                    future.set_result(build(*args, **kwargs))
+            except BaseException as error:
+                # Let the next session try again rather than cache the failure
+                with self._lock:
+                    if self._entries.get(key) is future:
+                        del self._entries[key]
+                future.set_exception(error)
+                raise
+        return future.result()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+figure_cache = FigureCache()
+
+
+def _files(output_folder: str, *parts: str) -> List[str]:
+    return [os.path.join(output_folder, *parts)]
+
+
+def load_cube(output_folder: str = output_folder) -> Dict:
+    """The precomputed aggregates built by ingest.py."""
+    from aggregates import AGGREGATES_FOLDER, load_aggregates
+
+    return cache.get(
+        f"cube:{output_folder}",
+        lambda: load_aggregates(output_folder),
+        _files(output_folder, AGGREGATES_FOLDER, "*.parquet"),
+    )
+
+
+def load_tags(output_folder: str = output_folder):
+    """The tag index, and the listing details shown for its matches."""
+    from listing_index import INDEX_FOLDER, load_listing_index
+    from product_store import STORE_FOLDER
+    from tag_index import TAG_INDEX_FOLDER, load_tag_index
+
+    def load():
+        listings = load_listing_index(output_folder, listing_columns)["listings"]
+        return load_tag_index(output_folder), listings
+
+    return cache.get(
+        f"tags:{output_folder}",
+        load,
+        _files(output_folder, TAG_INDEX_FOLDER, "*.parquet")
+        + _files(output_folder, INDEX_FOLDER, "*.parquet")
+        + _files(output_folder, STORE_FOLDER, "*", "*.parquet"),
+    )
+
+
+def load_search(output_folder: str = output_folder):
+    """The full-text search index."""
+    from search_index import SEARCH_INDEX_FOLDER, load_search_index
+
+    return cache.get(
+        f"search:{output_folder}",
+        lambda: load_search_index(output_folder),
+        _files(output_folder, SEARCH_INDEX_FOLDER, "*", "*.parquet"),
+    )
+
+
+def load_collages(output_folder: str = output_folder) -> Optional[Dict[str, str]]:
+    """The top products collage of each category, built by thumbnails.py.
+
+    None if thumbnails.py has not run, empty if no listing had an image URL.
+    """
+    from thumbnails import COLLAGES_FILE, THUMBNAILS_FOLDER, load_collages
+
+    return cache.get(
+        f"collages:{output_folder}",
+        lambda: load_collages(output_folder),
+        _files(output_folder, THUMBNAILS_FOLDER, COLLAGES_FILE),
+    )
+
+
+def load_stores(output_folder: str = output_folder):
+    """The store profile index."""
+    from store_index import STORE_INDEX_FOLDER, load_store_index
+
+    return cache.get(
+        f"stores:{output_folder}",
+        lambda: load_store_index(output_folder),
+        _files(output_folder, STORE_INDEX_FOLDER, "*.parquet"),
+    )
+
+
+def load_opportunities(output_folder: str = output_folder) -> Dict:
+    """The opportunity scores of the categories and search terms."""
+    from aggregates import AGGREGATES_FOLDER
+    from listing_index import INDEX_FOLDER, load_listing_index
+    from opportunity import build_scores, listing_columns
+    from product_store import STORE_FOLDER
+
+    def load():
+        return build_scores(
+            load_cube(output_folder),
+            load_listing_index(output_folder, listing_columns),
+        )
+
+    return cache.get(
+        f"opportunities:{output_folder}",
+        load,
+        _files(output_folder, AGGREGATES_FOLDER, "*.parquet")
+        + _files(output_folder, INDEX_FOLDER, "*.parquet")
+        + _files(output_folder, STORE_FOLDER, "*", "*.parquet"),
+    )
@@ -0,0 +1,169 @@
+"""Wait for EtsyHunt exports to finish downloading and file them for ingest.
+
+Each scrape job downloads into its own folder. After clicking "All Page" the
+scraper snapshots the folder, waits until a new export is complete (no
+in-flight ``.part`` file and a stable size), detects whether it is really a
+spreadsheet or a CSV, and writes it as CSV straight into the category folder
+in ``data/products/`` that ``ingest.py`` reads.
+"""
+
+import csv
+import fnmatch
+import glob
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Set
+
+import pandas as pd
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(current_directory, "../data/products/")
+
+EXPORT_PATTERN = "product_detail_*"
+# Suffixes browsers use for downloads in flight
+PARTIAL_SUFFIXES = (".part", ".crdownload", ".download", ".tmp")
+
+
+class DownloadTimeout(Exception):
+    pass
+
+
+def snapshot(folder: str) -> Set[str]:
+    """The files in a download folder, to diff against after a download."""
+    return set(glob.glob(os.path.join(folder, "*")))
+
+
+def _in_flight(path: str, before: Set[str], started: float) -> bool:
+    if path not in before:
+        return True
+    try:
+        return os.path.getmtime(path) >= started
+    except FileNotFoundError:
+        # Renamed to the finished file in the meantime
+        return False
+
+
+def wait_for_download(
+    folder: str,
+    before: Set[str],
+    timeout: float = 60,
+    poll_interval: float = 0.25,
+    stable_for: float = 0.5,
+) -> str:
+    """Wait for a new export in folder to finish downloading and return its path.
+
+    A download is complete once there is no in-flight file (e.g. Firefox's
+    ``.part`` file) and its size has not changed for ``stable_for`` seconds.
+    Partial files left over by a crashed run (already in ``before`` and not
+    written to since) are ignored.
+    """
+    started = time.time()
+    deadline = time.monotonic() + timeout
+    sizes = {}
+    while time.monotonic() < deadline:
+        current = snapshot(folder)
+        # Each job has its own folder, so any in-flight file is our download
+        if any(
+            _in_flight(path, before, started)
+            for path in current
+            if path.endswith(PARTIAL_SUFFIXES)
+        ):
+            time.sleep(poll_interval)
+            continue
+        candidates = sorted(
+            (
+                path
+                for path in current - before
+                if fnmatch.fnmatch(os.path.basename(path), EXPORT_PATTERN)
+            ),
+            key=os.path.getmtime,
+        )
+        now = time.monotonic()
+        for path in candidates:
+            size = os.path.getsize(path)
+            last_size, since = sizes.get(path, (None, now))
+            if size != last_size:
+                sizes[path] = (size, now)
+            elif size > 0 and now - since >= stable_for:
+                return path
+        time.sleep(poll_interval)
+    raise DownloadTimeout(f"No completed export in {folder} after {timeout}s")
+
+
+# Readers of the spreadsheet formats, see requirements.txt
+EXCEL_ENGINES = {"xlsx": "openpyxl", "xls": "xlrd"}
+
+
+def detect_format(path: str) -> str:
+    """Detect an export's real format from its magic bytes: xlsx, xls or csv."""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if head.startswith(b"\xd0\xcf\x11\xe0"):
+        return "xls"
+    return "csv"
+
+
+def read_spreadsheet(path: str, file_format: str, **kwargs) -> pd.DataFrame:
+    """Read an xlsx or xls export with the reader of its format."""
+    return pd.read_excel(path, engine=EXCEL_ENGINES[file_format], **kwargs)
+
+
+def is_empty_export(path: str) -> bool:
+    """Whether an export has a header and no rows, the site's answer to a term
+    without results.
+
+    An empty file has no header either, so it is not an empty export but a
+    broken one.
+    """
+    file_format = detect_format(path)
+    if file_format != "csv":
+        return read_spreadsheet(path, file_format, nrows=1).empty
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        rows = (row for row in csv.reader(f) if any(field.strip() for field in row))
+        return next(rows, None) is not None and next(rows, None) is None
+
+
+def export_file_name(search_term: str) -> str:
+    """File name ingest expects for a search term's export."""
+    return f"{search_term.strip().lower().replace(' ', '_')}_product_detail.csv"
+
+
+def category_folder(product_name: str, data_folder: str = data_folder) -> str:
+    """The ``NN_category`` folder of a product, created with the next number if new."""
+    slug = product_name.strip().lower().replace(" ", "_")
+    folders = glob.glob(os.path.join(data_folder, "[0-9]*_*/"))
+    numbers = []
+    for folder in folders:
+        match = re.match(r"(\d+)_(.*)", os.path.basename(folder.rstrip("/")))
+        if not match:
+            continue
+        if match.group(2) == slug:
+            return folder
+        numbers.append(int(match.group(1)))
+    folder = os.path.join(data_folder, f"{max(numbers, default=0) + 1:02d}_{slug}")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def store_export(path: str, search_term: str, export_folder: str) -> str:
+    """Convert a downloaded export to CSV in export_folder and return the new path.
+
+    The downloaded file is removed once it has been converted.
+    """
+    os.makedirs(export_folder, exist_ok=True)
+    new_path = os.path.join(export_folder, export_file_name(search_term))
+    tmp_path = new_path + ".tmp"
+    file_format = detect_format(path)
+    if file_format == "csv":
+        shutil.copyfile(path, tmp_path)
+    else:
+        read_spreadsheet(path, file_format).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, new_path)
+    os.remove(path)
+    logging.info("Stored %s export for '%s' at %s", file_format, search_term, new_path)
+    return new_path
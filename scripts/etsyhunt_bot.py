@@ -1,79 +1,172 @@
-import glob
 import json
 import logging
 import os
-import random
 import sys
-import time
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import helium as he
 from dotenv import load_dotenv
-from openai import OpenAI
 import tenacity
+from selenium.webdriver import FirefoxOptions
+
+import downloads
+import pacing
+import scrape_journal
+import tracing
+from term_expansion import expand_search_terms
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 
+ETSYHUNT_URL = os.getenv("ETSYHUNT_URL", "https://etsyhunt.com")
+DOWNLOADS_FOLDER = os.path.expanduser("~/Downloads")
+# Seconds to wait for a page to be ready, and between checks
+READY_TIMEOUT = 30
+POLL_INTERVAL = 0.2
+# Logins per direct export run, each after the previous session expired
+MAX_LOGINS = 3
 
-def expand_search_terms(search_terms: str) -> List[str]:
-    """Use OpenAI API to expand search terms."""
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    prompt = """
-        Input: search_terms
-        Output:: Provide the search terms in a JSON format, with the keys being the numbers 1 to 10
-          and the values being the corresponding search terms.
-          Ensure that the search terms are closely related to the initial input but vary in their phrasing
-          and word choice to capture a wide range of relevant searches.
-          Try to keep each search term to four or less words.
-        Example:
-        Input: Chinese name seals
-        Output:
-        {
-        '1': 'Chinese name seals',
-        '2': 'Chinese chops',
-        '3': 'Hanko seals',
-        '4': 'Chinese seal carving',
-        '5': 'Chinese signature stamps',
-        '6': 'Asian name seals',
-        '7': 'Chinese calligraphy seals',
-        '8': 'Traditional Chinese seals',
-        '9': 'Chinese seal engraving',
-        '10': 'Chinese name stamps'
-        }
-    """
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Expand search terms for {search_terms}"},
-        ],
+
+def firefox_options(downloads_folder: str) -> FirefoxOptions:
+    """Firefox options that save exports to downloads_folder without prompting."""
+    options = FirefoxOptions()
+    options.set_preference("browser.download.folderList", 2)
+    options.set_preference("browser.download.dir", downloads_folder)
+    options.set_preference(
+        "browser.helperApps.neverAsk.saveToDisk",
+        "text/csv,application/csv,application/vnd.ms-excel,"
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
-    assistant_message = response.choices[0].message.content
-    search_terms_json = json.loads(assistant_message.replace("'", '"'))
-    logging.info("Expanded search terms:")
-    for key, value in search_terms_json.items():
-        logging.info(f"{key}: {value}")
-    expanded_terms = list(search_terms_json.values())
-    return expanded_terms
+    return options
+
 
+def wait_for(condition, timeout: float = READY_TIMEOUT):
+    """Wait until ``condition()`` is true, polling every POLL_INTERVAL seconds."""
+    he.wait_until(condition, timeout_secs=timeout, interval_secs=POLL_INTERVAL)
 
-def start_chrome_and_login():
+
+def credentials():
     email = os.getenv("ETSYHUNT_EMAIL")
     pwd = os.getenv("ETSYHUNT_PWD")
     if not email or not pwd:
         logging.error("Please provide email and password in .env file!")
         sys.exit(1)
-    he.start_firefox("https://etsyhunt.com/user/login")
-    he.click(he.TextField("Please enter your email"))
-    he.write(email)
-    he.click(he.TextField("Please enter your password"))
-    he.write(pwd)
-    he.click("Login")
-    he.wait_until(he.Text("Dashboard").exists)
-    # Random sleep to avoid detection
-    time.sleep(random.randint(2, 5))
+    return email, pwd
+
+
+def login():
+    """Fill in the login form and wait for the dashboard."""
+    email, pwd = credentials()
+    with tracing.span("login"):
+        he.click(he.TextField("Please enter your email"))
+        he.write(email)
+        he.click(he.TextField("Please enter your password"))
+        he.write(pwd)
+        he.click("Login")
+        wait_for(he.Text("Dashboard").exists)
+
+
+def start_chrome_and_login(downloads_folder: str = DOWNLOADS_FOLDER, headless=False):
+    credentials()
+    with tracing.span("start_browser"):
+        he.start_firefox(
+            f"{ETSYHUNT_URL}/user/login",
+            headless=headless,
+            options=firefox_options(downloads_folder),
+        )
+    login()
+
+
+def session_cookies() -> Dict[str, str]:
+    """The cookies of the logged-in browser session, to reuse over HTTP."""
+    return {cookie["name"]: cookie["value"] for cookie in he.get_driver().get_cookies()}
+
+
+def login_for_direct_export(
+    downloads_folder: str = DOWNLOADS_FOLDER, headless=False
+) -> Tuple[Dict[str, str], str]:
+    """Log in with the browser, returning the session cookies and user agent."""
+    start_chrome_and_login(downloads_folder, headless=headless)
+    try:
+        user_agent = he.get_driver().execute_script("return navigator.userAgent")
+        return session_cookies(), user_agent
+    finally:
+        close_browser()
+
+
+def scrape_direct(
+    terms: List[str],
+    export_folder: str,
+    downloads_folder: str = DOWNLOADS_FOLDER,
+    pacer: Optional[pacing.Pacer] = None,
+    journal: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    headless=False,
+) -> Dict[str, str]:
+    """Export terms over HTTP with the browser's session, see export_client.py.
+
+    Logs in again for the remaining terms whenever the session expires.
+    """
+    from export_client import (
+        CONCURRENCY,
+        SESSION_EXPIRED,
+        required_export_path,
+        run_exports,
+    )
+
+    # Before logging in, so a missing ETSYHUNT_EXPORT_PATH fails the run at once
+    required_export_path()
+    statuses = {}
+    remaining = list(terms)
+    for _ in range(MAX_LOGINS):
+        if pacer:
+            pacer.acquire()
+        cookies, user_agent = login_for_direct_export(downloads_folder, headless)
+        statuses.update(
+            run_exports(
+                remaining,
+                cookies,
+                export_folder,
+                ETSYHUNT_URL,
+                user_agent,
+                concurrency or CONCURRENCY,
+                pacer,
+                journal,
+            )
+        )
+        remaining = [term for term in remaining if statuses[term] == SESSION_EXPIRED]
+        if not remaining:
+            break
+        logging.warning(
+            "Session expired, logging in again for %d terms", len(remaining)
+        )
+    return statuses
+
+
+def on_login_page() -> bool:
+    """Whether the site sent us back to the login page."""
+    return he.TextField("Please enter your email").exists()
+
+
+def dismiss_chat() -> bool:
+    """Close the support chat if it popped up, returning whether it had."""
+    popped_up = False
+    if he.Text("Compose your reply").exists():
+        he.click(he.Text("Compose your reply"))
+        popped_up = True
+    if he.Button("close chat").exists():
+        he.click(he.Button("close chat"))
+        popped_up = True
+    return popped_up
+
+
+def search_results_ready() -> bool:
+    return (
+        he.Text("Export to CSV").exists()
+        or he.Text("No Data").exists()
+        or on_login_page()
+    )
 
 
 def go_to_product_search():
@@ -84,17 +177,22 @@ def go_to_dashboard():
     he.click("Dashboard")
 
 
-@tenacity.retry(wait=tenacity.wait_fixed(3), stop=tenacity.stop_after_attempt(2))
+@tenacity.retry(
+    wait=tenacity.wait_random_exponential(multiplier=0.5, max=5),
+    stop=tenacity.stop_after_attempt(2),
+    before_sleep=tracing.count_retry,
+)
 def search_for_product(search_term):
     logging.info("Searching for product: %s", search_term)
-    he.click(he.TextField())
-    he.wait_until(he.Button("Search").exists)
-    try:
-        time.sleep(random.randint(3, 6))
-        he.write(search_term)
-        he.press(he.click(he.Button("Search")))
-    except TypeError:
-        pass
+    with tracing.span("search", term=search_term):
+        he.click(he.TextField())
+        wait_for(he.Button("Search").exists)
+        try:
+            he.write(search_term)
+            he.press(he.click(he.Button("Search")))
+        except TypeError:
+            pass
+        wait_for(search_results_ready)
 
 
 def check_no_results():
@@ -104,39 +202,48 @@ def check_no_results():
     return False
 
 
-@tenacity.retry(wait=tenacity.wait_fixed(3), stop=tenacity.stop_after_attempt(2))
-def download_and_rename_csv(search_term):
-    if he.Text("Compose your reply").exists():
-        he.click(he.Text("Compose your reply"))
-
-    if he.Button("close chat").exists():
-        he.click(he.Button("close chat"))
+@tenacity.retry(
+    wait=tenacity.wait_random_exponential(multiplier=0.5, max=5),
+    stop=tenacity.stop_after_attempt(2),
+    before_sleep=tracing.count_retry,
+)
+def download_and_rename_csv(
+    search_term,
+    downloads_folder: str = DOWNLOADS_FOLDER,
+    journal=None,
+    export_folder: Optional[str] = None,
+) -> str:
+    """Export the search results and store them as CSV, returning the path.
 
+    The browser should download into a folder only this session uses. The
+    export is stored in export_folder (default: the downloads folder).
+    """
+    dismiss_chat()
     logging.info("Downloading CSV file for %s", search_term)
-    he.wait_until(he.Text("Export to CSV").exists)
-    time.sleep(random.randint(3, 5))
-    he.click(he.Text("Export to CSV"))
-    he.click(he.Text("All Page"))
-    time.sleep(2)
-    downloads_folder = os.path.expanduser("~/Downloads")
-    csv_file = glob.glob(os.path.join(downloads_folder, "product_detail_*.csv"))[0]
-    fn_formatted = search_term.lower().replace(" ", "_")
-    # The file is actually an Excel file, so rename it to .xlsx
-    new_path = os.path.join(downloads_folder, f"{fn_formatted}_product_detail.xlsx")
-    if os.path.exists(csv_file):
-        logging.info("Renaming file to: %s", new_path)
-        os.rename(csv_file, new_path)
-    else:
-        logging.warning("No CSV file found!")
+    with tracing.span("wait_for_export_button", term=search_term):
+        wait_for(he.Text("Export to CSV").exists)
+    before = downloads.snapshot(downloads_folder)
+    with tracing.span("download", term=search_term):
+        he.click(he.Text("Export to CSV"))
+        he.click(he.Text("All Page"))
+        download = downloads.wait_for_download(downloads_folder, before)
+    if journal:
+        scrape_journal.record(
+            journal, search_term, scrape_journal.DOWNLOADED, path=download
+        )
+    # The file is often an Excel file despite the name, store_export converts it
+    with tracing.span("store_export", term=search_term):
+        return downloads.store_export(
+            download, search_term, export_folder or downloads_folder
+        )
 
 
 def close_browser():
     he.kill_browser()
 
 
-def main(search_term):
-    logging.info("Expanding search terms for %s", search_term)
-    expanded_terms = expand_search_terms(search_term)
+def confirm_search_terms(expanded_terms: List[str]) -> List[str]:
+    """Let the user drop or add search terms before scraping."""
     # Ask for user input on whether to proceed
     user_input = input(
         "Do you want to proceed with the expanded search terms? ([Y]es/no): "
@@ -159,31 +266,171 @@ def main(search_term):
     logging.info("Proceeding with the following search terms:")
     for idx, term in enumerate(expanded_terms, 1):
         logging.info(f"{idx}: {term}")
-    start_chrome_and_login()
-    go_to_product_search()
-    logging.info("Logged in successfully!")
-    for term in expanded_terms:
+    return expanded_terms
+
+
+def scrape_term(
+    term: str,
+    downloads_folder: str = DOWNLOADS_FOLDER,
+    pacer: Optional[pacing.Pacer] = None,
+    journal=None,
+    export_folder: Optional[str] = None,
+) -> str:
+    """Search for a term and download its export, returning the outcome.
+
+    If given, ``pacer.acquire()`` is called before every request to the site
+    (the search and the export) and the pacer is told about throttling
+    signals, each step is recorded in the ``journal`` file, and the export is
+    stored in ``export_folder``.
+    """
+    with tracing.span("scrape_term", term=term) as labels:
+        labels["status"] = _scrape_term(
+            term, downloads_folder, pacer, journal, export_folder
+        )
+    tracing.count("terms", status=labels["status"])
+    return labels["status"]
+
+
+def _scrape_term(
+    term: str,
+    downloads_folder: str,
+    pacer: Optional[pacing.Pacer],
+    journal,
+    export_folder: Optional[str],
+) -> str:
+    if pacer:
+        pacer.acquire()
+    search_for_product(term)
+    if on_login_page():
+        if pacer:
+            pacer.throttled(pacing.LOGIN_REDIRECT)
+            pacer.acquire()
+        login()
+        go_to_product_search()
         search_for_product(term)
-        if check_no_results():
-            continue
-        try:
-            download_and_rename_csv(term)
-        except tenacity.RetryError:
-            logging.error("Error downloading CSV.")
+    if check_no_results():
+        if pacer:
+            pacer.throttled(pacing.EMPTY_RESULTS)
+        if journal:
+            scrape_journal.record(journal, term, scrape_journal.NO_RESULTS)
+        return "no-results"
+    if journal:
+        scrape_journal.record(journal, term, scrape_journal.SEARCHED)
+    if dismiss_chat() and pacer:
+        pacer.throttled(pacing.CHAT_POPUP)
+    if pacer:
+        pacer.acquire()
+    try:
+        new_path = download_and_rename_csv(
+            term, downloads_folder, journal, export_folder
+        )
+        status = "downloaded"
+        if pacer:
+            pacer.succeeded()
+        if journal and new_path:
+            scrape_journal.record(
+                journal,
+                term,
+                scrape_journal.RENAMED,
+                path=new_path,
+                sha256=scrape_journal.file_checksum(new_path),
+            )
+    except tenacity.RetryError:
+        logging.error("Error downloading CSV.")
+        status = "failed"
+        if journal:
+            scrape_journal.record(
+                journal, term, scrape_journal.FAILED, error="download failed"
+            )
+    with tracing.span("navigate"):
         go_to_dashboard()
         go_to_product_search()
+    return status
+
+
+@tenacity.retry(
+    wait=tenacity.wait_exponential(multiplier=5, max=120),
+    stop=tenacity.stop_after_attempt(3),
+    retry=tenacity.retry_if_result(lambda status: status == "failed"),
+    before_sleep=tracing.count_retry,
+    retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+)
+def scrape_term_with_backoff(
+    term: str,
+    journal: str,
+    downloads_folder: str,
+    export_folder: str,
+    pacer: Optional[pacing.Pacer] = None,
+) -> str:
+    """Scrape a term, retrying failures with exponential backoff."""
+    try:
+        return scrape_term(term, downloads_folder, pacer, journal, export_folder)
+    except Exception as e:
+        logging.exception("Error scraping %s", term)
+        scrape_journal.record(journal, term, scrape_journal.FAILED, error=str(e))
+        return "failed"
+
+
+def main(search_term, resume=False, direct=False):
+    journal = scrape_journal.journal_path(search_term, DOWNLOADS_FOLDER)
+    job = scrape_journal.load_journal(journal) if resume else {"terms": []}
+    if job["terms"]:
+        for term in scrape_journal.give_up_failing(journal, job):
+            logging.warning(
+                "Giving up on %s after %d failed attempts",
+                term,
+                job["states"][term]["attempts"],
+            )
+        expanded_terms = scrape_journal.remaining_terms(job)
+        logging.info(
+            "Resuming %s: %d of %d terms left",
+            search_term,
+            len(expanded_terms),
+            len(job["terms"]),
+        )
+    else:
+        logging.info("Expanding search terms for %s", search_term)
+        with tracing.span("expand_search_terms"):
+            expanded_terms = expand_search_terms(search_term)
+        expanded_terms = confirm_search_terms(expanded_terms)
+        scrape_journal.start_job(journal, expanded_terms)
+    if not expanded_terms:
+        logging.info("All search terms are done")
+        return
+
+    # A download folder of its own, so the exports of this job are unambiguous
+    job_folder = os.path.join(DOWNLOADS_FOLDER, os.path.basename(journal) + ".d")
+    os.makedirs(job_folder, exist_ok=True)
+    export_folder = downloads.category_folder(search_term)
+    pacer = pacing.Pacer()
+    if direct:
+        statuses = scrape_direct(
+            expanded_terms, export_folder, job_folder, pacer, journal
+        )
+        for term, status in statuses.items():
+            logging.info("%s: %s", term, status)
+        return
+    pacer.acquire()
+    start_chrome_and_login(job_folder)
+    go_to_product_search()
+    logging.info("Logged in successfully!")
+    for term in expanded_terms:
+        scrape_term_with_backoff(term, journal, job_folder, export_folder, pacer)
 
     close_browser()
     logging.info("Finished searching for products")
 
 
 def usage():
-    logging.error("Usage: python etsyhunt_bot.py <search terms>")
+    logging.error("Usage: python etsyhunt_bot.py [--resume] [--direct] <search terms>")
     sys.exit(1)
 
 
 if __name__ == "__main__":
-    search_terms = " ".join(sys.argv[1:])
+    args = sys.argv[1:]
+    resume = "--resume" in args
+    direct = "--direct" in args
+    search_terms = " ".join(arg for arg in args if arg not in ("--resume", "--direct"))
     if not search_terms:
         usage()
-    main(search_terms)
+    main(search_terms, resume=resume, direct=direct)
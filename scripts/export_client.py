@@ -0,0 +1,251 @@
+"""Download EtsyHunt exports over HTTP, without driving the browser.
+
+The browser is only needed to log in: ``etsyhunt_bot.session_cookies`` takes
+the cookies of the logged-in session, and this client then requests the
+export of every term directly, over one pooled aiohttp session with at most
+``concurrency`` requests in flight. Requests are still paced by a
+``pacing.Pacer``, which backs off on 429/503 answers, login redirects and
+empty results.
+
+The export request is ``GET {ETSYHUNT_URL}{ETSYHUNT_EXPORT_PATH}`` with the
+search term in the ``ETSYHUNT_EXPORT_PARAM`` query parameter. Set
+``ETSYHUNT_EXPORT_PATH`` to the path of the request the site's "All Page"
+button sends; there is no default, so a wrong guess cannot turn every term
+into a 404. A term only counts as having no results when the site answers
+with an export that has a header and no rows; a 404 fails the term.
+
+An expired session stops the run: the remaining terms come back as
+``session-expired``, to retry after logging in again.
+
+Example usage, against the mock:
+    $ python mock_etsyhunt.py --port 8000 &
+    $ ETSYHUNT_URL=http://localhost:8000 ETSYHUNT_EXPORT_PATH=/export \\
+        ETSYHUNT_EMAIL=a ETSYHUNT_PWD=b python etsyhunt_bot.py --direct chinese name seals
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+import tenacity
+
+import downloads
+import pacing
+import scrape_journal
+import tracing
+
+EXPORT_PATH = os.getenv("ETSYHUNT_EXPORT_PATH")
+EXPORT_PARAM = os.getenv("ETSYHUNT_EXPORT_PARAM", "keyword")
+LOGIN_PATH = "/user/login"
+CONCURRENCY = 4
+TIMEOUT = 120
+CHUNK_SIZE = 1 << 16
+
+DOWNLOADED = "downloaded"
+NO_RESULTS = "no-results"
+FAILED = "failed"
+SESSION_EXPIRED = "session-expired"
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class Throttled(Exception):
+    pass
+
+
+class ExportNotFound(Exception):
+    pass
+
+
+def required_export_path() -> str:
+    """The path of the export request, from ``ETSYHUNT_EXPORT_PATH``."""
+    if not EXPORT_PATH:
+        raise RuntimeError(
+            "Set ETSYHUNT_EXPORT_PATH to the path of the site's export request"
+        )
+    return EXPORT_PATH
+
+
+class ExportClient:
+    """Requests exports with the cookies of a logged-in browser session."""
+
+    def __init__(
+        self,
+        base_url: str,
+        cookies: Dict[str, str],
+        user_agent: Optional[str] = None,
+        concurrency: int = CONCURRENCY,
+        pacer: Optional[pacing.Pacer] = None,
+        timeout: float = TIMEOUT,
+        export_path: Optional[str] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.export_path = export_path or required_export_path()
+        self.cookies = cookies
+        self.headers = {"User-Agent": user_agent} if user_agent else {}
+        self.concurrency = concurrency
+        self.pacer = pacer
+        self.timeout = timeout
+        self.expired = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "ExportClient":
+        # Bounds the terms in flight, including their wait for the pacer
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            cookies=self.cookies,
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def _pace(self):
+        if self.pacer:
+            await asyncio.to_thread(self.pacer.acquire)
+
+    def _throttled(self, signal: str):
+        if self.pacer:
+            self.pacer.throttled(signal)
+
+    @tenacity.retry(
+        wait=tenacity.wait_random_exponential(multiplier=1, max=30),
+        stop=tenacity.stop_after_attempt(4),
+        retry=tenacity.retry_if_exception_type(
+            (aiohttp.ClientError, asyncio.TimeoutError, Throttled)
+        ),
+        before_sleep=tracing.count_retry,
+    )
+    async def download(self, term: str, folder: str) -> Optional[str]:
+        """Download the export of a term into folder, None if it has no results.
+
+        Only an export with a header and no rows means no results; a 404 raises
+        ``ExportNotFound``, which is not retried.
+        """
+        await self._pace()
+        url = self.base_url + self.export_path
+        with tracing.span("export_request", term=term) as labels:
+            async with self._session.get(url, params={EXPORT_PARAM: term}) as response:
+                labels["status"] = response.status
+                if response.status in (429, 503):
+                    self._throttled(pacing.RATE_LIMITED)
+                    raise Throttled(f"{response.status} for {term}")
+                if urlparse(str(response.url)).path == LOGIN_PATH:
+                    self._throttled(pacing.LOGIN_REDIRECT)
+                    raise SessionExpired(term)
+                if response.status == 404:
+                    raise ExportNotFound(f"404 for {term} at {url}")
+                response.raise_for_status()
+                path = os.path.join(folder, f"product_detail_{time.time_ns()}.download")
+                with open(path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+        if downloads.is_empty_export(path):
+            os.remove(path)
+            self._throttled(pacing.EMPTY_RESULTS)
+            return None
+        if self.pacer:
+            self.pacer.succeeded()
+        return path
+
+    async def export_term(
+        self,
+        term: str,
+        folder: str,
+        export_folder: str,
+        journal: Optional[str] = None,
+    ) -> str:
+        """Download and store the export of a term, returning the outcome.
+
+        Errors end this term only, as ``failed``, not the other terms in flight.
+        """
+        async with self._slots:
+            if self.expired.is_set():
+                return SESSION_EXPIRED
+            try:
+                return await self._export_term(term, folder, export_folder, journal)
+            except Exception as e:
+                logging.exception("Error exporting %s", term)
+                if journal:
+                    scrape_journal.record(
+                        journal, term, scrape_journal.FAILED, error=str(e)
+                    )
+                return FAILED
+
+    async def _export_term(
+        self, term: str, folder: str, export_folder: str, journal: Optional[str]
+    ) -> str:
+        try:
+            path = await self.download(term, folder)
+        except SessionExpired:
+            self.expired.set()
+            return SESSION_EXPIRED
+        except tenacity.RetryError as error:
+            logging.error(
+                "Export of %s failed: %s", term, error.last_attempt.exception()
+            )
+            if journal:
+                scrape_journal.record(
+                    journal, term, scrape_journal.FAILED, error="export failed"
+                )
+            return FAILED
+        if path is None:
+            if journal:
+                scrape_journal.record(journal, term, scrape_journal.NO_RESULTS)
+            return NO_RESULTS
+        if journal:
+            scrape_journal.record(journal, term, scrape_journal.DOWNLOADED, path=path)
+        # Converting a spreadsheet export blocks, so keep it off the event loop
+        new_path = await asyncio.to_thread(
+            downloads.store_export, path, term, export_folder
+        )
+        if journal:
+            scrape_journal.record(
+                journal,
+                term,
+                scrape_journal.RENAMED,
+                path=new_path,
+                sha256=scrape_journal.file_checksum(new_path),
+            )
+        return DOWNLOADED
+
+
+async def export_terms(
+    terms: List[str],
+    cookies: Dict[str, str],
+    export_folder: str,
+    base_url: str,
+    user_agent: Optional[str] = None,
+    concurrency: int = CONCURRENCY,
+    pacer: Optional[pacing.Pacer] = None,
+    journal: Optional[str] = None,
+) -> Dict[str, str]:
+    """Export all terms concurrently, returning each term's outcome."""
+    with tempfile.TemporaryDirectory(prefix="etsyhunt_exports_") as folder:
+        async with ExportClient(
+            base_url, cookies, user_agent, concurrency, pacer
+        ) as client:
+            statuses = await asyncio.gather(
+                *(
+                    client.export_term(term, folder, export_folder, journal)
+                    for term in terms
+                )
+            )
+    for term, status in zip(terms, statuses):
+        tracing.count("terms", status=status)
+    return dict(zip(terms, statuses))
+
+
+def run_exports(*args, **kwargs) -> Dict[str, str]:
+    """``export_terms`` from synchronous code."""
+    return asyncio.run(export_terms(*args, **kwargs))
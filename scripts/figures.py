@@ -0,0 +1,311 @@
+"""Plotly figures of the dashboard, built from the precomputed aggregates.
+
+The figure functions take the cube returned by ``aggregates.load_aggregates``,
+so both ``streamlitapp.py`` and the static export in ``report.py`` can build
+them without running the app.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.offline import plot
+
+from aggregates import get_metric, top_store_shares
+
+
+def to_html(fig, file_name: str):
+    """Save a Plotly figure to an HTML file."""
+    plot(fig, filename=file_name)
+
+
+def format_col_for_title(col: str) -> str:
+    """Format a column name for a title."""
+    return " ".join(col.split("_")).title()
+
+
+def plot_bar_chart_plotly(
+    data, x, y, sorted=True, title=None, x_label=None, y_label=None
+):
+    if sorted:
+        data = data.sort_values(by=y, ascending=False)
+    fig = go.Figure(
+        go.Bar(
+            x=data[x],
+            y=data[y],
+            name=format_col_for_title(y),
+            text=data[y],
+            textposition="auto",
+        )
+    )
+    fig.update_layout(
+        title=f"Bar Chart of {format_col_for_title(y)} by {format_col_for_title(x)}",
+        xaxis_title=format_col_for_title(x) if x_label is None else x_label,
+        yaxis_title=format_col_for_title(y) if y_label is None else y_label,
+        template="simple_white",
+    )
+    if title:
+        fig.update_layout(title=title)
+
+    fig.update_traces(texttemplate="%{text:.2f}")
+    return fig
+
+
+def plot_bar_chart_plotly_with_dropdown(
+    data_list, x, y, labels, sorted=True, title=None, x_label=None, y_label=None
+):
+    traces = []
+    for data, label in zip(data_list, labels):
+        if sorted:
+            data = data.sort_values(by=y, ascending=False)
+        trace = go.Bar(
+            x=data[x],
+            y=data[y],
+            name=label,
+            text=data[y],
+            textposition="auto",
+            visible=True if label == labels[0] else False,
+        )
+        traces.append(trace)
+
+    fig = go.Figure(data=traces)
+
+    # Add the dropdown menu
+    fig.update_layout(
+        updatemenus=[
+            dict(
+                buttons=[
+                    dict(
+                        args=[{"visible": [label == selected for label in labels]}],
+                        label=selected,
+                        method="update",
+                    )
+                    for selected in labels
+                ],
+                direction="down",
+                pad={"r": 2, "t": 12},
+                showactive=True,
+                x=0,
+                xanchor="left",
+                y=1.3,
+                yanchor="top",
+            )
+        ]
+    )
+
+    fig.update_layout(
+        title=(
+            f"Bar Chart of {format_col_for_title(y)} by {format_col_for_title(x)}"
+            if title is None
+            else title
+        ),
+        xaxis_title=format_col_for_title(x) if x_label is None else x_label,
+        yaxis_title=format_col_for_title(y) if y_label is None else y_label,
+        template="simple_white",
+    )
+
+    fig.update_traces(texttemplate="%{text:.2f}")
+
+    return fig
+
+
+def plot_median_price_by_product(cube):
+    fig = plot_bar_chart_plotly(
+        get_metric(cube, "price", "median"),
+        x="product_name_chinese_name",
+        y="price",
+        title="Median Price by Product （产品价格中位数）",
+        x_label="Product Name",
+        y_label="Median Price ($)",
+    )
+    return fig
+
+
+def plot_unique_products(cube):
+    data_list = [
+        get_metric(cube, "Product URL", "nunique"),
+        get_metric(cube, "Product URL", "nunique", subset="with_sales"),
+    ]
+
+    fig = plot_bar_chart_plotly_with_dropdown(
+        data_list,
+        labels=["All Products", "Products with Sales"],
+        x="product_name_chinese_name",
+        y="Product URL",
+        title="Number of Unique Products （产品数目）",
+        x_label="Product Name",
+        y_label="Number of Unique Products",
+    )
+    return fig
+
+
+def plot_percentage_of_products_with_sales(cube):
+    fig = plot_bar_chart_plotly(
+        get_metric(cube, "has_sales", "mean"),
+        x="product_name_chinese_name",
+        y="has_sales",
+        title="Percentage of Products with Sales （有销售量的产品的百分比）",
+        x_label="Product Name",
+        y_label="Percentage of Products with Sales (%)",
+    )
+    return fig
+
+
+def plot_total_sales_by_product(cube):
+    fig = plot_bar_chart_plotly(
+        get_metric(cube, "Total Sales", "sum"),
+        x="product_name_chinese_name",
+        y="Total Sales",
+        title="Total Sales by Product（产品总销售量）",
+        x_label="Product Name",
+        y_label="Total Sales",
+    )
+    return fig
+
+
+def generate_median_sales_figure(cube):
+    data_list = [
+        get_metric(cube, "Total Sales", "median"),
+        get_metric(cube, "Total Sales", "median", subset="with_sales"),
+    ]
+
+    # Median total sales by product
+    fig = plot_bar_chart_plotly_with_dropdown(
+        data_list,
+        labels=["All Products", "Products with Sales"],
+        x="product_name_chinese_name",
+        y="Total Sales",
+        title="Median Total Sales by Product（产品平均销售量）",
+        x_label="Product Name",
+        y_label="Median Total Sales",
+    )
+    return fig
+
+
+def plot_total_revenue_by_product(cube):
+    fig = plot_bar_chart_plotly(
+        get_metric(cube, "proceeds", "sum"),
+        x="product_name_chinese_name",
+        y="proceeds",
+        title="Total Revenue by Product（产品总销售额）",
+        x_label="Product Name",
+        y_label="Total Revenue",
+    )
+
+    return fig
+
+
+def generate_median_revenue_figure(cube):
+    data_list = [
+        get_metric(cube, "proceeds", "median"),
+        get_metric(cube, "proceeds", "median", subset="with_sales"),
+    ]
+
+    labels = ["All Products", "Products with Sales"]
+
+    fig = plot_bar_chart_plotly_with_dropdown(
+        data_list=data_list,
+        x="product_name_chinese_name",
+        y="proceeds",
+        labels=labels,
+        title="Median Revenue by Product（产品销售额中位数）",
+        x_label="Product Name",
+        y_label="Median Revenue ($)",
+    )
+    return fig
+
+
+def plot_heatmap_plotly(
+    data,
+    x,
+    y,
+    z,
+    title=None,
+    x_label=None,
+    y_label=None,
+    log_scale=False,
+    colorbar_title=None,
+    width=1000,
+    height=1000,
+):
+    if log_scale:
+        data[z] = np.log(data[z] + 1)
+    fig = go.Figure(
+        data=go.Heatmap(
+            x=data[x],
+            y=data[y],
+            z=data[z],
+            colorscale="blues_r",
+            hoverongaps=False,
+            colorbar_title=colorbar_title,
+        )
+    )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_label,
+        yaxis_title=y_label,
+        template="plotly_dark",
+        width=width,
+        height=height,
+    )
+
+    return fig
+
+
+def calculate_sales_heatmap(cube, top_k=10, cumulative_share=None):
+    # Leading stores per product, the rest are bucketed as "Other"
+    product_store_sales = top_store_shares(
+        cube["category_store"], top_k=top_k, cumulative_share=cumulative_share
+    ).rename(columns={"sales_share": "Percentage of Total Sales"})
+    n_stores = product_store_sales["Store Name"].nunique()
+
+    # Create the heatmap
+    fig = plot_heatmap_plotly(
+        data=product_store_sales,
+        x="product_name_chinese_name",
+        y="Store Name",
+        z="Percentage of Total Sales",
+        title="Percentage of Total Sales by Product and Store (With Sales)",
+        x_label="Product Name",
+        y_label="Store Name",
+        colorbar_title="%",
+        height=min(max(400, 20 * n_stores + 200), 4000),
+    )
+
+    return fig
+
+
+# Figures exported by report.py, with the aggregates each one is built from:
+# ``(subset, column, stat)`` metric keys, or the name of an aggregate table.
+# Only the figures drawn from the aggregate cube, the store, opportunity, tag
+# and search slides plot what is picked in their widgets.
+figures = {
+    "number_unique_products": (
+        plot_unique_products,
+        [("all", "Product URL", "nunique"), ("with_sales", "Product URL", "nunique")],
+    ),
+    "median_price_by_product": (
+        plot_median_price_by_product,
+        [("all", "price", "median")],
+    ),
+    "total_sales_by_product": (
+        plot_total_sales_by_product,
+        [("all", "Total Sales", "sum")],
+    ),
+    "median_total_sales": (
+        generate_median_sales_figure,
+        [("all", "Total Sales", "median"), ("with_sales", "Total Sales", "median")],
+    ),
+    "percentage_products_with_sales": (
+        plot_percentage_of_products_with_sales,
+        [("all", "has_sales", "mean")],
+    ),
+    "total_revenue_by_product": (
+        plot_total_revenue_by_product,
+        [("all", "proceeds", "sum")],
+    ),
+    "median_revenue_by_product": (
+        generate_median_revenue_figure,
+        [("all", "proceeds", "median"), ("with_sales", "proceeds", "median")],
+    ),
+    "competitor_heatmap": (calculate_sales_heatmap, ["category_store"]),
+}
@@ -0,0 +1,402 @@
+"""Build the consolidated product table from the EtsyHunt exports.
+
+Each folder in ``data/products/`` (``NN_category``) holds one
+``*_product_detail.csv`` export per search term. Ingest parses the exports,
+merges them per category and writes ``output/all_product_data.csv`` along
+with the columnar store in ``product_store.py``, the precomputed
+aggregates in ``aggregates.py``, the listing, tag and search indexes
+(``listing_index.py``, ``tag_index.py``, ``search_index.py``) and the store
+profiles in ``store_index.py``. The listings of new or changed exports are
+also appended to the time series in ``snapshots.py``.
+
+Exports are validated and repaired on the way in (see ``validation.py``).
+Rows that fail validation go to ``output/quarantine.csv`` and the quality
+stats of every export to ``output/ingest_quality.json``. Once everything is
+written, a new dataset version is published for running dashboards (see
+``dashboard_data.py``).
+
+A manifest of file size, mtime and hash is kept next to the output, so a rerun
+only re-parses the exports that changed and only re-merges the categories they
+belong to. Categories are rebuilt in parallel across a process pool.
+
+Example usage:
+    $ python ingest.py
+    $ python ingest.py --workers 8 --force
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from aggregates import build_aggregates, write_aggregates
+from dashboard_data import publish_dataset_version
+from listing_index import (
+    LISTING_ID,
+    build_listing_index,
+    listing_terms,
+    parse_listing_id,
+    write_listing_index,
+)
+from product_store import STORE_FOLDER, to_store_types, write_product_store
+from search_index import SEARCH_INDEX_FOLDER, update_search_index
+from snapshots import append_snapshot, to_snapshot
+from store_index import build_store_index, write_store_index
+from tag_index import build_tag_index, write_tag_index
+from validation import validate_export
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(current_directory, "../data/products/")
+output_folder = os.path.join(current_directory, "../output/")
+
+MANIFEST_FILE = "ingest_manifest.json"
+CACHE_FOLDER = ".ingest_cache"
+OUTPUT_FILE = "all_product_data.csv"
+QUARANTINE_FILE = "quarantine.csv"
+QUALITY_FILE = "ingest_quality.json"
+# Bump when parsing or merging changes, to invalidate the caches
+PARSER_VERSION = 5
+
+chinese_translations = {
+    "bead bracelets and necklaces": "珠子手链和项链",
+    "chinese mid autumn gift sets": "中秋节礼品套装",
+    "chinese pottery": "中国陶器",
+    "chinese incense": "中国香",
+    "chinese magnets": "中国冰箱贴",
+    "paper lanterns": "纸灯笼",
+    "chinese bamboo art": "中国竹艺",
+    "chinese washi tape": "中国和纸胶带",
+    "chinese art stickers": "中国艺术贴纸",
+    "brushes and calligraphy tools": "笔和书法工具",
+    "calligraphy prints": "书法印刷品",
+    "chinese bookmarks": "中国书签",
+    "name seals": "印章",
+}
+
+# Listings in these categories are only kept if the URL contains the keyword,
+# the searches return plenty of products that are not actually magnets or tape.
+category_url_filters = {
+    "chinese magnets": "magnet",
+    "chinese washi tape": "tape",
+}
+
+
+def get_product_names(data_folder: str) -> List[Tuple[str, str]]:
+    """Get the (folder, product name) pairs from the folders in the data folder."""
+    folders = sorted(glob.glob(os.path.join(data_folder, "*/")))
+    return [
+        (folder, " ".join(os.path.basename(folder.rstrip("/")).split("_")[1:]))
+        for folder in folders
+    ]
+
+
+def get_search_term_from_file_name(file_name: str) -> str:
+    """Get the search term from the file name."""
+    return file_name.replace("_product_detail.csv", "").replace("_", " ")
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Compute the sha256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str, previous: Optional[Dict] = None) -> Dict:
+    """Get the size, mtime and hash of a file.
+
+    The hash is only recomputed when the size or mtime differ from the previous
+    fingerprint.
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if (
+        previous
+        and previous["size"] == fingerprint["size"]
+        and previous["mtime"] == fingerprint["mtime"]
+    ):
+        fingerprint["sha256"] = previous["sha256"]
+    else:
+        fingerprint["sha256"] = hash_file(path)
+    return fingerprint
+
+
+def load_manifest(output_folder: str) -> Dict:
+    """Load the ingest manifest, or an empty one if there is none yet."""
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"files": {}, "categories": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(output_folder: str, manifest: Dict):
+    """Atomically write the ingest manifest."""
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def parse_export(path: str, product_name: str) -> Tuple[pd.DataFrame, Dict]:
+    """Parse a single EtsyHunt export and add the derived columns.
+
+    Also returns the export's quality report: its stats and quarantined rows.
+    """
+    df, quarantined, stats = validate_export(path)
+    df["search_term"] = get_search_term_from_file_name(os.path.basename(path))
+    df["product_name"] = product_name
+    df[LISTING_ID] = parse_listing_id(df["Product URL"])
+    df["Tags"] = df["Tags"].fillna("").astype(str).str.split(",")
+    df['Price("$")'] = df['Price("$")'].astype(str)
+    df["price"] = df['Price("$")'].str.replace(",", "").astype(float)
+    df["proceeds"] = df["price"] * df["Total Sales"]
+    df["has_sales"] = df["Total Sales"] > 0
+    df["product_name_chinese_name"] = (
+        product_name + " (" + chinese_translations.get(product_name, "") + ")"
+    )
+    return df, {"stats": stats, "quarantined": quarantined}
+
+
+def filter_category(df: pd.DataFrame, product_name: str) -> pd.DataFrame:
+    """Drop the listings a category's URL keyword filter excludes."""
+    keyword = category_url_filters.get(product_name)
+    if keyword:
+        df = df[df["Product URL"].str.contains(keyword)]
+    return df
+
+
+def merge_category(
+    dataframes: List[pd.DataFrame], product_name: str
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Merge the parsed exports of a category, one row per listing.
+
+    Also returns the (listing, search term) pairs of the category, since a
+    listing found under several search terms only keeps the row of the first.
+    """
+    df = filter_category(pd.concat(dataframes, ignore_index=True), product_name)
+    terms = listing_terms(df)
+    df = df.drop_duplicates(subset=[LISTING_ID])
+    df["true_magnet"] = (df["product_name"] == "chinese magnets") & df[
+        "Product URL"
+    ].str.contains("magnet")
+    return df, terms
+
+
+def _file_cache_key(key: str, sha256: str) -> str:
+    # The search term comes from the file name, so identical exports saved
+    # under different names must not share a cache entry.
+    return hashlib.sha256(f"{PARSER_VERSION}:{key}:{sha256}".encode()).hexdigest()
+
+
+def _cache_path(cache_folder: str, kind: str, key: str) -> str:
+    return os.path.join(cache_folder, kind, f"{key}.pkl")
+
+
+def build_category(
+    folder: str,
+    product_name: str,
+    files: Dict[str, str],
+    changed: List[str],
+    cache_folder: str,
+) -> Tuple[str, int]:
+    """Rebuild the merged frame of one category.
+
+    Runs in a worker process. Only the exports in ``changed`` are parsed, the
+    others are read back from the per-file cache. ``files`` maps each export's
+    path to its cache key.
+    """
+    dataframes = []
+    for path in sorted(files):
+        file_cache = _cache_path(cache_folder, "files", files[path])
+        if path in changed or not os.path.exists(file_cache):
+            df, quality = parse_export(path, product_name)
+            df.to_pickle(file_cache)
+            pd.to_pickle(quality, _cache_path(cache_folder, "quality", files[path]))
+        else:
+            df = pd.read_pickle(file_cache)
+        dataframes.append(df)
+    category = os.path.basename(folder.rstrip("/"))
+    if dataframes:
+        merged, terms = merge_category(dataframes, product_name)
+    else:
+        merged, terms = pd.DataFrame(), pd.DataFrame()
+    merged.to_pickle(_cache_path(cache_folder, "categories", category))
+    terms.to_pickle(_cache_path(cache_folder, "terms", category))
+    return category, len(merged)
+
+
+def snapshot_exports(
+    changed: List[Tuple[str, str, str]], cache_folder: str, output_folder: str
+) -> int:
+    """Append the listings of changed exports to the snapshot time series.
+
+    ``changed`` holds (path, cache key, product name) triples. An export's mtime
+    is its scrape time.
+    """
+    snapshots = []
+    for path, key, product_name in changed:
+        df = filter_category(
+            pd.read_pickle(_cache_path(cache_folder, "files", key)), product_name
+        )
+        df = df[df[LISTING_ID].notna()]
+        snapshots.append(
+            to_snapshot(df, pd.Timestamp(os.path.getmtime(path), unit="s"))
+        )
+    if not snapshots:
+        return 0
+    return append_snapshot(pd.concat(snapshots, ignore_index=True), output_folder)
+
+
+def write_quality_report(files: Dict[str, Dict], cache_folder: str, output_folder: str):
+    """Write the quarantined rows and quality stats of all exports.
+
+    ``files`` maps each export's key (its path relative to the data folder) to
+    its fingerprint.
+    """
+    stats = {}
+    quarantined = []
+    for key, fingerprint in sorted(files.items()):
+        quality_cache = _cache_path(
+            cache_folder, "quality", _file_cache_key(key, fingerprint["sha256"])
+        )
+        quality = pd.read_pickle(quality_cache)
+        stats[key] = quality["stats"]
+        if len(quality["quarantined"]):
+            quarantined.append(quality["quarantined"].assign(file=key))
+
+    with open(os.path.join(output_folder, QUALITY_FILE), "w") as f:
+        json.dump(stats, f, indent=2, sort_keys=True)
+    quarantine_path = os.path.join(output_folder, QUARANTINE_FILE)
+    if quarantined:
+        pd.concat(quarantined, ignore_index=True).to_csv(quarantine_path, index=False)
+    elif os.path.exists(quarantine_path):
+        os.remove(quarantine_path)
+    n_quarantined = sum(s["quarantined_rows"] for s in stats.values())
+    logging.info("Quarantined %d rows, see %s", n_quarantined, QUALITY_FILE)
+
+
+def ingest(
+    data_folder: str = data_folder,
+    output_folder: str = output_folder,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> pd.DataFrame:
+    """Incrementally build all_product_data from the exports in data_folder."""
+    cache_folder = os.path.join(output_folder, CACHE_FOLDER)
+    for kind in ["files", "quality", "categories", "terms"]:
+        os.makedirs(os.path.join(cache_folder, kind), exist_ok=True)
+
+    manifest = load_manifest(output_folder)
+    if force or manifest.get("version") != PARSER_VERSION:
+        manifest = {"files": {}, "categories": {}}
+    new_manifest = {"version": PARSER_VERSION, "files": {}, "categories": {}}
+
+    jobs = []
+    categories = []
+    changed_exports = []
+    for folder, product_name in get_product_names(data_folder):
+        category = os.path.basename(folder.rstrip("/"))
+        files = {}
+        changed = []
+        for path in sorted(glob.glob(os.path.join(folder, "*.csv"))):
+            key = os.path.relpath(path, data_folder)
+            previous = manifest["files"].get(key)
+            fingerprint = file_fingerprint(path, previous)
+            new_manifest["files"][key] = fingerprint
+            files[path] = _file_cache_key(key, fingerprint["sha256"])
+            if not previous or previous["sha256"] != fingerprint["sha256"]:
+                changed.append(path)
+                changed_exports.append((path, files[path], product_name))
+
+        file_keys = sorted(os.path.relpath(path, data_folder) for path in files)
+        new_manifest["categories"][category] = file_keys
+        categories.append(category)
+        if (
+            changed
+            or manifest["categories"].get(category) != file_keys
+            or not os.path.exists(_cache_path(cache_folder, "terms", category))
+        ):
+            jobs.append((folder, product_name, files, changed, cache_folder))
+
+    logging.info("%d of %d categories need rebuilding", len(jobs), len(categories))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_category, *job) for job in jobs]
+            for job, future in zip(jobs, futures):
+                _, n_rows = future.result()
+                logging.info("Rebuilt %s (%d rows)", job[1], n_rows)
+
+    n_snapshots = snapshot_exports(changed_exports, cache_folder, output_folder)
+    logging.info("Appended %d listing snapshots", n_snapshots)
+
+    # Drop cached parses of exports that have since changed or been removed
+    live = {
+        _file_cache_key(key, fingerprint["sha256"]) + ".pkl"
+        for key, fingerprint in new_manifest["files"].items()
+    }
+    for kind in ["files", "quality"]:
+        for path in glob.glob(os.path.join(cache_folder, kind, "*.pkl")):
+            if os.path.basename(path) not in live:
+                os.remove(path)
+    write_quality_report(new_manifest["files"], cache_folder, output_folder)
+
+    all_product_data, terms = [
+        pd.concat(
+            [pd.read_pickle(_cache_path(cache_folder, kind, c)) for c in categories],
+            ignore_index=True,
+        )
+        for kind in ["categories", "terms"]
+    ]
+    all_product_data.to_csv(os.path.join(output_folder, OUTPUT_FILE), index=False)
+    rebuilt = [job[1] for job in jobs]
+    if os.path.exists(os.path.join(output_folder, STORE_FOLDER)):
+        write_product_store(all_product_data, output_folder, product_names=rebuilt)
+    else:
+        write_product_store(all_product_data, output_folder)
+    write_aggregates(build_aggregates(all_product_data), output_folder)
+    typed = to_store_types(all_product_data)
+    write_listing_index(build_listing_index(terms), output_folder)
+    write_tag_index(build_tag_index(typed), output_folder)
+    write_store_index(build_store_index(typed), output_folder)
+    if os.path.exists(os.path.join(output_folder, SEARCH_INDEX_FOLDER)):
+        update_search_index(typed, output_folder, product_names=rebuilt)
+    else:
+        update_search_index(typed, output_folder)
+    save_manifest(output_folder, new_manifest)
+    # Only the exports decide the outputs, so an unchanged rerun keeps the
+    # dashboards' cached figures
+    version = hashlib.sha256(json.dumps(new_manifest, sort_keys=True).encode())
+    publish_dataset_version(output_folder, version.hexdigest())
+    logging.info("Wrote %d rows to %s", len(all_product_data), OUTPUT_FILE)
+    return all_product_data
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-folder", default=data_folder)
+    parser.add_argument("--output-folder", default=output_folder)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Size of the process pool."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Ignore the manifest and rebuild all."
+    )
+    args = parser.parse_args(argv)
+    ingest(args.data_folder, args.output_folder, args.workers, args.force)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+"""Deduplicated listing index.
+
+The same Etsy listing shows up under many synonymous search terms (and
+sometimes under several categories). Ingest keys every row on the listing ID
+parsed from ``Product URL`` and keeps one row per listing and category in the
+product store, the first of its search terms. This index adds:
+
+- ``listing_terms``: the many-to-many mapping of listing <-> search_term <->
+  product_name, with dictionary-encoded terms.
+
+Loading it also gives ``listings``, the canonical row of each listing, read
+from the product store rather than stored a second time. Per-category views
+are rebuilt by joining the two, with each listing counted once per category.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+INDEX_FOLDER = "listing_index"
+LISTING_ID = "listing_id"
+
+# Columns that depend on the search, not on the listing itself
+search_columns = ["search_term", "product_name", "product_name_chinese_name"]
+
+
+def parse_listing_id(urls: pd.Series) -> pd.Series:
+    """Parse the numeric listing ID out of Etsy listing URLs."""
+    return pd.to_numeric(
+        urls.astype(str).str.extract(r"/listing/(\d+)", expand=False),
+        errors="coerce",
+    ).astype("Int64")
+
+
+def listing_terms(df: pd.DataFrame) -> pd.DataFrame:
+    """The distinct (listing, search term, product) triples in a parsed frame."""
+    return df[[LISTING_ID, "search_term", "product_name"]].drop_duplicates()
+
+
+def canonical_listings(all_product_data: pd.DataFrame) -> pd.DataFrame:
+    """The first row of each listing, without the search dependent columns."""
+    return (
+        all_product_data.drop_duplicates(subset=[LISTING_ID])
+        .drop(columns=[col for col in search_columns if col in all_product_data])
+        .reset_index(drop=True)
+    )
+
+
+def build_listing_index(terms: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Build the listing <-> term mapping, with dictionary-encoded terms."""
+    terms = terms.drop_duplicates().reset_index(drop=True)
+    for col in ["search_term", "product_name"]:
+        terms[col] = terms[col].astype("category")
+    return {"listing_terms": terms}
+
+
+def write_listing_index(index: Dict[str, pd.DataFrame], output_folder: str):
+    """Persist the listing index as Parquet."""
+    folder = os.path.join(output_folder, INDEX_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    for name, df in index.items():
+        df.to_parquet(os.path.join(folder, f"{name}.parquet"), compression="zstd")
+    # Older ingest runs also stored a copy of the listings here
+    stale = os.path.join(folder, "listings.parquet")
+    if os.path.exists(stale):
+        os.remove(stale)
+
+
+def load_listing_index(
+    output_folder: str = output_folder, columns: Optional[List[str]] = None
+) -> Dict[str, pd.DataFrame]:
+    """Load the listing index, optionally only some listing columns.
+
+    The listings are read from the product store. Without an index (ingest has
+    not written one yet) the mapping is built from the product table.
+    """
+    # product_store imports this module
+    from product_store import load_product_data, to_store_types
+
+    if columns is not None:
+        columns = list(dict.fromkeys([LISTING_ID] + columns))
+    path = os.path.join(output_folder, INDEX_FOLDER, "listing_terms.parquet")
+    if os.path.exists(path):
+        # The dashboard keeps the listings in memory for its whole life
+        listings = load_product_data(columns, output_folder=output_folder, compact=True)
+        terms = pd.read_parquet(path)
+    else:
+        logging.warning("No listing index found, building it from the product table")
+        listings = to_store_types(load_product_data(output_folder=output_folder))
+        terms = build_listing_index(listing_terms(listings))["listing_terms"]
+        if columns is not None:
+            listings = listings[columns]
+    return {"listings": canonical_listings(listings), "listing_terms": terms}
+
+
+def search_terms_of(index: Dict[str, pd.DataFrame], listing_id: int) -> List[str]:
+    """All the search terms a listing was found under."""
+    terms = index["listing_terms"]
+    return (
+        terms.loc[terms[LISTING_ID] == listing_id, "search_term"].astype(str).tolist()
+    )
+
+
+def category_view(
+    index: Dict[str, pd.DataFrame], product_names: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Listings joined to their categories, each listing once per category."""
+    terms = index["listing_terms"]
+    if product_names is not None:
+        terms = terms[terms["product_name"].isin(product_names)]
+    categories = terms[[LISTING_ID, "product_name"]].drop_duplicates()
+    categories["product_name"] = categories["product_name"].astype(str)
+    return categories.merge(index["listings"], on=LISTING_ID, how="left")
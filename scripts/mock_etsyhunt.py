@@ -0,0 +1,265 @@
+"""Local stand-in for the EtsyHunt pages the scraper drives.
+
+Serves a login page, the dashboard, the product search and the "Export to
+CSV" / "All Page" download, using the exports in data/products as results.
+A search for a term with no export in data/products shows "No Data", and its
+export is a CSV with the header and no rows.
+Request counts and timestamps are served as JSON at /stats, to check the
+scraper's request budget.
+
+Logging in sets a session cookie, and the search and export pages redirect to
+the login page without a valid one, like the real site when a session
+expires (``--session-ttl``). ``--throttle-every N`` answers every Nth export
+with 429 Too Many Requests, to exercise the scraper's backoff.
+
+Like Etsy's image CDN, ``/images/<name>.jpg`` serves a JPEG without logging
+in: a solid colour picked from the name, for ``thumbnails.py`` to fetch. Any
+other path under ``/images/`` is a 404, like a removed image.
+
+Example usage:
+    $ python mock_etsyhunt.py --port 8000
+    $ ETSYHUNT_URL=http://localhost:8000 ETSYHUNT_EMAIL=a ETSYHUNT_PWD=b \\
+        python scrape_pool.py --headless --terms "hanko seal,chinese chop seal"
+    $ ETSYHUNT_URL=http://localhost:8000 ETSYHUNT_EMAIL=a ETSYHUNT_PWD=b \\
+        ETSYHUNT_EXPORT_PATH=/export python scrape_pool.py --headless --direct --terms "hanko seal,chinese chop seal"
+"""
+
+import argparse
+import glob
+import hashlib
+import html
+import io
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, urlparse
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(current_directory, "../data/products/")
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>EtsyHunt</title></head><body>
+<nav><a href="/dashboard">Dashboard</a> <a href="/product">Find Hot Product</a></nav>
+{body}
+</body></html>"""
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><title>EtsyHunt Login</title></head><body>
+<form action="/dashboard" method="get">
+<input type="text" name="email" placeholder="Please enter your email">
+<input type="password" name="password" placeholder="Please enter your password">
+<button type="submit">Login</button>
+</form>
+</body></html>"""
+
+SESSION_COOKIE = "session"
+IMAGE_SIZE = 570
+
+SEARCH_FORM = """<form action="/product" method="get">
+<input type="text" name="keyword" value="{keyword}">
+<button type="submit">Search</button>
+</form>"""
+
+
+def find_export(keyword: str, data_folder: str = data_folder) -> Optional[str]:
+    """Find the export in data_folder for a search term."""
+    file_name = keyword.strip().lower().replace(" ", "_") + "_product_detail.csv"
+    matches = glob.glob(os.path.join(data_folder, "*", file_name))
+    return matches[0] if matches else None
+
+
+def export_header(data_folder: str = data_folder) -> bytes:
+    """The header line of the exports in data_folder, for an export without rows."""
+    for path in sorted(
+        glob.glob(os.path.join(data_folder, "*", "*_product_detail.csv"))
+    ):
+        with open(path, "rb") as f:
+            return f.readline()
+    return b""
+
+
+class MockEtsyHuntHandler(BaseHTTPRequestHandler):
+    data_folder = data_folder
+    stats: Dict[str, List[float]] = {}
+    stats_lock = threading.Lock()
+    export_delay = 0.0
+    # Session token -> login time
+    sessions: Dict[str, float] = {}
+    session_ttl: Optional[float] = None
+    throttle_every = 0
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+    def _send(self, body: bytes, content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, body: str):
+        self._send(PAGE.format(body=body).encode())
+
+    def _redirect(self, location: str):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _logged_in(self) -> bool:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        if SESSION_COOKIE not in cookie:
+            return False
+        started = self.sessions.get(cookie[SESSION_COOKIE].value)
+        if started is None:
+            return False
+        return self.session_ttl is None or time.time() - started < self.session_ttl
+
+    def login(self):
+        token = secrets.token_hex(16)
+        with self.stats_lock:
+            self.sessions[token] = time.time()
+        body = PAGE.format(body="<h1>Dashboard</h1>").encode()
+        self._send(
+            body, headers={"Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/; HttpOnly"}
+        )
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.stats_lock:
+            self.stats.setdefault(url.path, []).append(time.time())
+
+        if url.path == "/user/login":
+            self._send(LOGIN_PAGE.encode())
+        elif url.path == "/stats":
+            with self.stats_lock:
+                self._send(json.dumps(self.stats).encode(), "application/json")
+        elif url.path == "/dashboard" and "email" in query:
+            self.login()
+        elif url.path.startswith("/images/"):
+            self.image(url.path)
+        elif not self._logged_in():
+            self._redirect("/user/login")
+        elif url.path == "/dashboard":
+            self._page("<h1>Dashboard</h1>")
+        elif url.path == "/product":
+            self.search_page(query.get("keyword", ""))
+        elif url.path == "/export":
+            self.export(query.get("keyword", ""))
+        else:
+            self.send_error(404)
+
+    def search_page(self, keyword: str):
+        body = SEARCH_FORM.format(keyword=html.escape(keyword))
+        if keyword:
+            if find_export(keyword, self.data_folder):
+                body += (
+                    "<button>Export to CSV</button>"
+                    f'<a href="/export?keyword={quote(keyword)}">All Page</a>'
+                )
+            else:
+                body += "<p>No Data</p>"
+        self._page(body)
+
+    def export(self, keyword: str):
+        with self.stats_lock:
+            exports = len(self.stats["/export"])
+        if self.throttle_every and exports % self.throttle_every == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = find_export(keyword, self.data_folder)
+        time.sleep(self.export_delay)
+        if path:
+            with open(path, "rb") as f:
+                body = f.read()
+        else:
+            body = export_header(self.data_folder)
+        file_name = f"product_detail_{int(time.time() * 1000)}.csv"
+        self._send(
+            body,
+            "text/csv",
+            {"Content-Disposition": f'attachment; filename="{file_name}"'},
+        )
+
+    def image(self, path: str):
+        from PIL import Image
+
+        if not path.endswith(".jpg"):
+            self.send_error(404)
+            return
+        color = tuple(hashlib.sha256(path.encode()).digest()[:3])
+        buffer = io.BytesIO()
+        Image.new("RGB", (IMAGE_SIZE, IMAGE_SIZE), color).save(buffer, "JPEG")
+        self._send(buffer.getvalue(), "image/jpeg")
+
+
+def serve(
+    port: int = 8000,
+    data_folder: str = data_folder,
+    export_delay=0.0,
+    session_ttl: Optional[float] = None,
+    throttle_every: int = 0,
+):
+    """Start the mock server in a background thread and return it."""
+    handler = type(
+        "Handler",
+        (MockEtsyHuntHandler,),
+        {
+            "data_folder": data_folder,
+            "stats": {},
+            "export_delay": export_delay,
+            "sessions": {},
+            "session_ttl": session_ttl,
+            "throttle_every": throttle_every,
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Mock EtsyHunt serving on http://127.0.0.1:%d", server.server_port)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-folder", default=data_folder)
+    parser.add_argument(
+        "--export-delay", type=float, default=0.0, help="Seconds before an export."
+    )
+    parser.add_argument(
+        "--session-ttl", type=float, help="Seconds before a login session expires."
+    )
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="Answer every Nth export with 429 Too Many Requests.",
+    )
+    args = parser.parse_args()
+    server = serve(
+        args.port,
+        args.data_folder,
+        args.export_delay,
+        args.session_ttl,
+        args.throttle_every,
+    )
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
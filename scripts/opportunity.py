@@ -0,0 +1,205 @@
+"""Score product categories and search terms by demand against competition.
+
+Every category and every search term gets the features the slides discuss:
+
+- ``sales_rate``: the share of its listings with sales (demand);
+- ``median_proceeds``: the median revenue of its listings (demand);
+- ``median_price``: the median listing price (demand, more per sale);
+- ``listings``: the number of listings found (competition);
+- ``store_concentration``: the Herfindahl index of the stores' shares of its
+  sales, the sum of the squared shares. 1 when one store makes every sale
+  (competition, a market dominated by few stores is hard to enter).
+
+Categories take them from the aggregate cube, so they agree with the
+figures. Search terms compute them from the listing index, counting every
+listing under every term it was found with. A term found with a handful of
+listings would otherwise top the ranks on luck, so its sales rate and
+medians are shrunk toward those of its product, as if ``PRIOR_LISTINGS``
+more listings had the product's values.
+
+Loading turns the features into percentile ranks within each level, flipped
+for the competition features so higher is always better. A score is then
+the weighted mean of the ranks: one matrix-vector product, so re-weighting
+with the dashboard's sliders stays instant however many categories and terms
+there are. Missing features (no sales to share among stores) rank in the
+middle.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CATEGORY_COLUMN, OTHER_STORES, STORE_COLUMN, get_metric
+
+DEMAND = 1
+COMPETITION = -1
+
+# Feature -> (description, direction)
+features = {
+    "sales_rate": ("Share of listings with sales", DEMAND),
+    "median_proceeds": ("Median revenue per listing", DEMAND),
+    "median_price": ("Median price", DEMAND),
+    "listings": ("Listings found", COMPETITION),
+    "store_concentration": ("Concentration of sales in few stores", COMPETITION),
+}
+default_weights = {
+    "sales_rate": 1.0,
+    "median_proceeds": 1.0,
+    "median_price": 0.5,
+    "listings": 0.5,
+    "store_concentration": 0.5,
+}
+
+# Columns of the listing index the search term features are computed from
+listing_columns = ["has_sales", "proceeds", "price", "Total Sales", STORE_COLUMN]
+
+# Weight, in listings, of the product's values in a search term's features
+PRIOR_LISTINGS = 10
+# Listings a row needs to be ranked by default, per level
+min_listings = {"category": 10, "term": 5}
+
+
+def concentration(
+    sales: pd.DataFrame, keys, store: str = STORE_COLUMN, weight: str = "Total Sales"
+) -> pd.Series:
+    """The Herfindahl index of the store sales shares of each group."""
+    store_sales = sales.groupby(keys + [store], observed=True)[weight].sum()
+    group_sales = store_sales.groupby(level=keys).transform("sum")
+    shares = store_sales / group_sales.where(group_sales > 0)
+    return (shares**2).groupby(level=keys).sum(min_count=1)
+
+
+def shrink(
+    values: pd.Series, counts: pd.Series, prior: pd.Series, weight: float
+) -> pd.Series:
+    """The mean of values and their prior, the prior counting as weight listings."""
+    return (values * counts + prior * weight) / (counts + weight)
+
+
+def category_features(cube: Dict) -> pd.DataFrame:
+    """The features of each category, from the aggregate cube."""
+
+    def metric(column: str, stat: str) -> pd.Series:
+        return get_metric(cube, column, stat).set_index(CATEGORY_COLUMN)[column]
+
+    shares = cube["category_store"]
+    # The remainder bucket of the streamed aggregates is many small stores,
+    # which add next to nothing to the index, not one store with its share
+    shares = shares[shares[STORE_COLUMN] != OTHER_STORES]
+    hhi = (shares["sales_share"] ** 2).groupby(shares[CATEGORY_COLUMN]).sum()
+    df = pd.DataFrame(
+        {
+            "sales_rate": metric("has_sales", "mean"),
+            "median_proceeds": metric("proceeds", "median"),
+            "median_price": metric("price", "median"),
+            "listings": metric("Product URL", "nunique"),
+        }
+    )
+    # Categories without sales have no shares
+    df["store_concentration"] = hhi.where(hhi > 0).reindex(df.index)
+    df.index.name = CATEGORY_COLUMN
+    return df
+
+
+def term_features(listing_index: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """The features of each (product_name, search_term), from the listing index."""
+    keys = ["product_name", "search_term"]
+    # One row per (listing, product, term), so groups count distinct listings
+    terms = listing_index["listing_terms"][["listing_id"] + keys]
+    df = terms.merge(
+        listing_index["listings"][["listing_id"] + listing_columns],
+        on="listing_id",
+        how="left",
+    )
+    grouped = df.groupby(keys, observed=True)
+    result = pd.DataFrame(
+        {
+            "sales_rate": grouped["has_sales"].mean(),
+            "median_proceeds": grouped["proceeds"].median(),
+            "median_price": grouped["price"].median(),
+            "listings": grouped.size(),
+        }
+    )
+    # Each listing once per product, for the values the terms are shrunk toward
+    products = df.drop_duplicates(["listing_id", "product_name"]).groupby(
+        "product_name", observed=True
+    )
+    priors = pd.DataFrame(
+        {
+            "sales_rate": products["has_sales"].mean(),
+            "median_proceeds": products["proceeds"].median(),
+            "median_price": products["price"].median(),
+        }
+    ).reindex(result.index.get_level_values("product_name"))
+    for name in priors.columns:
+        result[name] = shrink(
+            result[name],
+            result["listings"],
+            priors[name].to_numpy(),
+            PRIOR_LISTINGS,
+        )
+    result["store_concentration"] = concentration(df, keys)
+    return result
+
+
+class OpportunityScores:
+    """Rank the rows of a feature table by weighted feature percentiles."""
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table
+        ranks = pd.DataFrame(
+            {
+                name: table[name].rank(pct=True, ascending=direction == DEMAND)
+                for name, (_, direction) in features.items()
+            }
+        )
+        self.ranks = ranks.fillna(0.5).to_numpy(dtype=np.float64)
+        self.sales_rate = table["sales_rate"].to_numpy(dtype=np.float64)
+        self.listings = table["listings"].to_numpy(dtype=np.float64)
+        self.groups = (
+            table.index.get_level_values(0).astype(str).to_numpy()
+            if table.index.nlevels > 1
+            else None
+        )
+
+    def scores(self, weights: Dict[str, float]) -> np.ndarray:
+        """The score of every row, from 0 to 1."""
+        w = np.array([weights.get(name, 0.0) for name in features], dtype=np.float64)
+        if w.sum() <= 0:
+            return np.zeros(len(self.ranks))
+        return self.ranks @ (w / w.sum())
+
+    def rank(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        k: Optional[int] = None,
+        min_sales_rate: float = 0.0,
+        min_listings: int = 0,
+        group: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """The k best rows that pass the filters, with their score and features.
+
+        ``group`` keeps the search terms of one product.
+        """
+        scores = self.scores(default_weights if weights is None else weights)
+        mask = (self.sales_rate >= min_sales_rate) & (self.listings >= min_listings)
+        if group is not None and self.groups is not None:
+            mask &= self.groups == group
+        rows = np.flatnonzero(mask)
+        if k is not None and k < len(rows):
+            rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        ranked = self.table.iloc[rows].reset_index()
+        ranked.insert(0, "score", scores[rows])
+        return ranked
+
+
+def build_scores(
+    cube: Dict, listing_index: Dict[str, pd.DataFrame]
+) -> Dict[str, OpportunityScores]:
+    """The scores of the categories and of the search terms."""
+    return {
+        "category": OpportunityScores(category_features(cube)),
+        "term": OpportunityScores(term_features(listing_index)),
+    }
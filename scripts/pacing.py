@@ -0,0 +1,113 @@
+"""Pacing of the scraper's requests to EtsyHunt.
+
+Requests are spaced by a token bucket: ``requests_per_minute`` on average,
+with bursts of up to ``burst`` requests and a random jitter on every wait so
+the requests do not tick like a clock. The bucket lives in shared memory, so
+one pacer created before the scrape pool starts paces all its workers.
+
+The pacer also backs off when the scraper sees signs of being throttled (an
+empty result page, a redirect to the login page, a support chat pop-up or a
+429/503 answer to a direct request): every signal doubles a delay added to
+the next requests, and every request that goes through cleanly halves it
+again. Without those signals, the scraper only waits for the bucket and for
+the pages to be ready.
+
+The defaults can be set with the ``ETSYHUNT_REQUESTS_PER_MINUTE``,
+``ETSYHUNT_BURST`` and ``ETSYHUNT_JITTER`` environment variables.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import random
+import time
+
+import tracing
+
+REQUESTS_PER_MINUTE = float(os.getenv("ETSYHUNT_REQUESTS_PER_MINUTE", 20))
+BURST = int(os.getenv("ETSYHUNT_BURST", 2))
+# Random extra wait, as a fraction of the average interval between requests
+JITTER = float(os.getenv("ETSYHUNT_JITTER", 0.3))
+BACKOFF = 5.0
+MAX_BACKOFF = 120.0
+
+# Signs of throttling the scraper reports to the pacer
+EMPTY_RESULTS = "empty_results"
+LOGIN_REDIRECT = "login_redirect"
+CHAT_POPUP = "chat_popup"
+RATE_LIMITED = "rate_limited"
+
+
+class TokenBucket:
+    """Allows ``requests_per_minute`` requests on average, ``burst`` at once.
+
+    The state is in shared memory, so the bucket is shared by the processes
+    it is passed to.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self._lock = mp.Lock()
+        self._tokens = mp.Value("d", float(burst), lock=False)
+        self._updated = mp.Value("d", time.time(), lock=False)
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait until it is available.
+
+        Tokens can be taken ahead of time, the bucket then goes into debt and
+        later callers wait longer, so concurrent callers are served in order.
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = now - self._updated.value
+            tokens = min(self.burst, self._tokens.value + elapsed * self.rate) - 1
+            self._tokens.value = tokens
+            self._updated.value = now
+        return max(0.0, -tokens / self.rate)
+
+
+class Pacer:
+    """A token bucket with jitter that backs off on throttling signals."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        burst: int = BURST,
+        jitter: float = JITTER,
+        backoff: float = BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ):
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._penalty = mp.Value("d", 0.0)
+
+    @property
+    def penalty(self) -> float:
+        """The current backoff delay added to each request, in seconds."""
+        return self._penalty.value
+
+    def acquire(self):
+        """Block until the next request may be sent."""
+        wait = self.bucket.reserve() + self.penalty
+        wait += random.uniform(0, self.jitter / self.bucket.rate)
+        tracing.observe("pacing_wait_seconds", wait)
+        time.sleep(wait)
+
+    def throttled(self, signal: str):
+        """Back off after a sign of throttling, e.g. ``LOGIN_REDIRECT``."""
+        with self._penalty.get_lock():
+            self._penalty.value = min(
+                self.max_backoff, max(self.backoff, self._penalty.value * 2)
+            )
+            penalty = self._penalty.value
+        tracing.count("throttling", signal=signal)
+        logging.warning("Throttling signal %s, backing off %.1fs", signal, penalty)
+
+    def succeeded(self):
+        """Ease the backoff after a request without throttling signals."""
+        with self._penalty.get_lock():
+            penalty = self._penalty.value / 2
+            self._penalty.value = penalty if penalty >= self.backoff else 0.0
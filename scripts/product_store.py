@@ -0,0 +1,198 @@
+"""Columnar store for the consolidated product table.
+
+The product table is written as a typed, zstd-compressed Parquet dataset
+partitioned by ``product_name``, so readers only decode the columns (and
+categories) they ask for instead of re-parsing the full CSV.
+
+``ingest.py`` keeps the store up to date. To build it from an existing
+``all_product_data.csv``:
+    $ python product_store.py
+"""
+
+import ast
+import logging
+import os
+import shutil
+import sys
+from typing import Iterable, List, Optional
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from listing_index import parse_listing_id
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+STORE_FOLDER = "all_product_data.parquet"
+CSV_FILE = "all_product_data.csv"
+PARTITION_COLUMN = "product_name"
+
+count_columns = [
+    "7-day sales",
+    "Total Sales",
+    "Total Reviews",
+    "7-day Reviews",
+    "Total Favorites",
+    "7-day Favorites",
+]
+flag_columns = ["Best Seller", "Etsy Pick", "Raving", "has_sales", "true_magnet"]
+
+schema = pa.schema(
+    [
+        ("Title", pa.string()),
+        ("Category", pa.string()),
+        ('Price("$")', pa.string()),
+        *[(col, pa.int64()) for col in count_columns],
+        ("Tags", pa.list_(pa.string())),
+        ("Ship From", pa.string()),
+        ("Release Time", pa.timestamp("ms")),
+        ("Best Seller", pa.bool_()),
+        ("Etsy Pick", pa.bool_()),
+        ("Raving", pa.bool_()),
+        ("Store Name", pa.string()),
+        ("Product URL", pa.string()),
+        ("listing_id", pa.int64()),
+        ("Image URL", pa.string()),
+        ("search_term", pa.string()),
+        (PARTITION_COLUMN, pa.string()),
+        ("price", pa.float64()),
+        ("proceeds", pa.float64()),
+        ("has_sales", pa.bool_()),
+        ("product_name_chinese_name", pa.string()),
+        ("true_magnet", pa.bool_()),
+    ]
+)
+
+
+def parse_tags(tags) -> List[str]:
+    """Parse a Tags value, either a list or its string repr from the CSV."""
+    if isinstance(tags, str):
+        if tags.startswith("["):
+            return ast.literal_eval(tags)
+        return tags.split(",") if tags else []
+    if tags is None or isinstance(tags, float):
+        return []
+    return list(tags)
+
+
+def to_store_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce the product table to the column types of the store schema."""
+    df = df.copy()
+    for col in count_columns:
+        # in2csv turns all-0/1 columns into True/False, hence the float detour
+        df[col] = df[col].astype("float64").fillna(0).astype("int64")
+    for col in flag_columns:
+        df[col] = df[col].astype(str).str.lower().isin(["true", "yes", "1"])
+    df["Release Time"] = pd.to_datetime(df["Release Time"], errors="coerce")
+    if "listing_id" not in df:
+        df["listing_id"] = parse_listing_id(df["Product URL"])
+    df["Tags"] = df["Tags"].map(parse_tags)
+    df['Price("$")'] = df['Price("$")'].astype(str)
+    return df
+
+
+def _partition_path(store_path: str, product_name: str) -> str:
+    return os.path.join(store_path, f"{PARTITION_COLUMN}={quote(product_name)}")
+
+
+def write_product_store(
+    df: pd.DataFrame,
+    output_folder: str = output_folder,
+    product_names: Optional[Iterable[str]] = None,
+):
+    """Write the product table to the store.
+
+    If ``product_names`` is given only those partitions are rewritten, and
+    partitions of categories no longer in ``df`` are removed.
+    """
+    store_path = os.path.join(output_folder, STORE_FOLDER)
+    if product_names is None:
+        product_names = df[PARTITION_COLUMN].unique()
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+    product_names = set(product_names)
+
+    for product_name in product_names:
+        shutil.rmtree(_partition_path(store_path, product_name), ignore_errors=True)
+    to_write = df[df[PARTITION_COLUMN].isin(product_names)]
+    if len(to_write):
+        table = pa.Table.from_pandas(
+            to_store_types(to_write)[schema.names],
+            schema=schema,
+            preserve_index=False,
+        )
+        pq.write_to_dataset(
+            table,
+            store_path,
+            partition_cols=[PARTITION_COLUMN],
+            compression="zstd",
+            existing_data_behavior="delete_matching",
+        )
+
+    live = {
+        os.path.basename(_partition_path(store_path, name))
+        for name in df[PARTITION_COLUMN].unique()
+    }
+    for partition in os.listdir(store_path) if os.path.exists(store_path) else []:
+        if partition not in live:
+            shutil.rmtree(os.path.join(store_path, partition))
+    logging.info("Wrote %d partitions to %s", len(product_names), STORE_FOLDER)
+
+
+def read_store_table(
+    columns: Optional[List[str]] = None,
+    product_names: Optional[List[str]] = None,
+    output_folder: str = output_folder,
+) -> pa.Table:
+    """Read the store as an Arrow table, only the requested columns and categories."""
+    filters = None
+    if product_names is not None:
+        filters = [(PARTITION_COLUMN, "in", list(product_names))]
+    return pq.read_table(
+        os.path.join(output_folder, STORE_FOLDER), columns=columns, filters=filters
+    )
+
+
+def load_product_data(
+    columns: Optional[List[str]] = None,
+    product_names: Optional[List[str]] = None,
+    output_folder: str = output_folder,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """Load the product table, reading only the requested columns.
+
+    Falls back to the CSV if the store has not been built yet. ``compact``
+    converts the text, flag and count columns to the compact types of
+    ``compact.py``, for tables a dashboard keeps in memory.
+    """
+    store_path = os.path.join(output_folder, STORE_FOLDER)
+    if not os.path.exists(store_path):
+        logging.warning("No product store found, falling back to %s", CSV_FILE)
+        usecols = columns
+        if columns is not None and product_names is not None:
+            usecols = list(dict.fromkeys([*columns, PARTITION_COLUMN]))
+        df = pd.read_csv(os.path.join(output_folder, CSV_FILE), usecols=usecols)
+        if product_names is not None:
+            df = df[df[PARTITION_COLUMN].isin(product_names)]
+        df = df if columns is None else df[columns]
+    else:
+        df = read_store_table(columns, product_names, output_folder).to_pandas()
+        if PARTITION_COLUMN in df:
+            # The partition column comes back dictionary encoded
+            df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype(str)
+    if compact:
+        # compact.py builds on this module
+        from compact import compact_frame
+
+        df = compact_frame(df)
+    return df
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else output_folder
+    write_product_store(pd.read_csv(os.path.join(folder, CSV_FILE)), folder)
@@ -0,0 +1,225 @@
+"""Export the dashboard's aggregate figures as static PNG and HTML files.
+
+The figures are those of ``figures.figures``, drawn from the aggregate cube.
+The store profile, opportunity, tag demand and search slides plot whatever is
+picked in their widgets, so they have no static version.
+
+Figures are rendered in parallel across a process pool, since image export is
+by far the slowest step. Each figure is cached by a hash of the aggregates it
+is built from and of the plotting code (the source of figures.py and of the
+aggregates.py helpers it calls), so a rerun only re-renders the figures whose
+data or code changed.
+
+Example usage:
+    $ python report.py
+    $ python report.py --formats html --workers 4 --force
+"""
+
+import argparse
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import aggregates
+import figures as plotting
+from aggregates import load_aggregates
+from figures import figures
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+REPORT_FOLDER = "report"
+MANIFEST_FILE = "report_manifest.json"
+# HTML first, PNG export needs kaleido and a Chrome it can drive
+FORMATS = ["html", "png"]
+# Bump to re-render every figure after a change outside the plotting code,
+# e.g. a plotly upgrade
+REPORT_VERSION = 1
+
+
+def figure_inputs(cube: Dict, inputs: List) -> List[pd.DataFrame]:
+    """The aggregate frames a figure is built from."""
+    return [
+        cube["metrics"][key] if isinstance(key, tuple) else cube[key] for key in inputs
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def code_hash() -> str:
+    """Hash the plotting code, so that any change to it re-renders the figures.
+
+    A figure's function calls shared helpers (``plot_bar_chart_plotly``,
+    ``aggregates.top_store_shares``), so its own source is not enough.
+    """
+    digest = hashlib.sha256(str(REPORT_VERSION).encode())
+    for module in (plotting, aggregates):
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+def figure_hash(name: str, cube: Dict) -> str:
+    """Hash a figure's input aggregates and the plotting code."""
+    _, inputs = figures[name]
+    digest = hashlib.sha256(f"{code_hash()}:{name}".encode())
+    for frame in figure_inputs(cube, inputs):
+        digest.update(",".join(map(str, frame.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(frame).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _error_message(error: Exception) -> str:
+    return f"{type(error).__name__}: {str(error).strip()}"
+
+
+def render_figure(
+    name: str, cube: Dict, report_folder: str, formats: List[str]
+) -> Tuple[str, List[str], Dict[str, str]]:
+    """Render one figure in every format. Runs in a worker process.
+
+    Returns the figure name, the formats written and the error message of each
+    format that failed, so e.g. a PNG export failing does not lose the HTML.
+    """
+    function, _ = figures[name]
+    try:
+        fig = function(cube)
+    except Exception as error:
+        return name, [], {file_format: _error_message(error) for file_format in formats}
+    written, errors = [], {}
+    for file_format in formats:
+        path = os.path.join(report_folder, f"{name}.{file_format}")
+        tmp_path = f"{path}.tmp"
+        try:
+            if file_format == "html":
+                fig.write_html(tmp_path, include_plotlyjs="cdn")
+            else:
+                fig.write_image(tmp_path, format=file_format, scale=2)
+            os.replace(tmp_path, path)
+        except Exception as error:
+            errors[file_format] = _error_message(error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            written.append(file_format)
+    return name, written, errors
+
+
+def load_manifest(report_folder: str) -> Dict:
+    path = os.path.join(report_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(report_folder: str, manifest: Dict):
+    path = os.path.join(report_folder, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def export_report(
+    output_folder: str = output_folder,
+    report_folder: Optional[str] = None,
+    formats: List[str] = FORMATS,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, str]:
+    """Render the figures whose inputs changed, returning each figure's status.
+
+    The status is ``cached``, ``rendered``, ``partial`` (some formats failed) or
+    ``failed``.
+    """
+    report_folder = report_folder or os.path.join(output_folder, REPORT_FOLDER)
+    os.makedirs(report_folder, exist_ok=True)
+    cube = load_aggregates(output_folder)
+    previous = load_manifest(report_folder)
+    manifest = {} if force else dict(previous)
+    # Figures renamed or dropped from figures.py since the last run
+    for name in set(previous) - set(figures):
+        manifest.pop(name, None)
+        for file_format in previous[name].get("formats", []):
+            path = os.path.join(report_folder, f"{name}.{file_format}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    hashes = {name: figure_hash(name, cube) for name in figures}
+    statuses = {}
+    stale = []
+    for name, digest in hashes.items():
+        entry = manifest.get(name, {})
+        up_to_date = entry.get("hash") == digest and all(
+            file_format in entry.get("formats", [])
+            and os.path.exists(os.path.join(report_folder, f"{name}.{file_format}"))
+            for file_format in formats
+        )
+        if up_to_date:
+            statuses[name] = "cached"
+        else:
+            stale.append(name)
+    logging.info("%d of %d figures need rendering", len(stale), len(figures))
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(render_figure, name, cube, report_folder, formats)
+                for name in stale
+            ]
+            for future in futures:
+                name, written, errors = future.result()
+                for file_format, error in errors.items():
+                    logging.error(
+                        "Failed to render %s as %s: %s", name, file_format, error
+                    )
+                if not written:
+                    statuses[name] = "failed"
+                    manifest.pop(name, None)
+                    continue
+                statuses[name] = "partial" if errors else "rendered"
+                formats_done = set(written)
+                if manifest.get(name, {}).get("hash") == hashes[name]:
+                    formats_done.update(manifest[name]["formats"])
+                manifest[name] = {
+                    "hash": hashes[name],
+                    "formats": sorted(formats_done),
+                }
+    save_manifest(report_folder, manifest)
+    return statuses
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output-folder", default=output_folder)
+    parser.add_argument(
+        "--report-folder", help="Where to write the figures (default: output/report)."
+    )
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Size of the process pool."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Ignore the cache and render all."
+    )
+    args = parser.parse_args(argv)
+    statuses = export_report(
+        args.output_folder, args.report_folder, args.formats, args.workers, args.force
+    )
+    for name, status in statuses.items():
+        logging.info("%s: %s", name, status)
+    if {"failed", "partial"} & set(statuses.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,123 @@
+"""Checkpoint journal for scrape jobs.
+
+A job journal is an append-only JSONL file with one event per state change of
+a search term. Replaying it gives the latest state of every term, so a crashed
+or expired run can be resumed without redoing terms that already finished.
+
+Term states, in order: pending, searched, then no-results or downloaded,
+renamed. A term that errors is marked failed with its attempt count, and is
+retried on resume until it has failed ``MAX_ATTEMPTS`` times: it is then
+marked given-up and skipped, so one broken term does not fail every resume.
+Starting the job afresh makes its terms pending again.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+PENDING = "pending"
+SEARCHED = "searched"
+NO_RESULTS = "no-results"
+DOWNLOADED = "downloaded"
+RENAMED = "renamed"
+FAILED = "failed"
+GIVEN_UP = "given-up"
+
+# States after which a term needs no more work
+COMPLETED_STATES = {NO_RESULTS, RENAMED, GIVEN_UP}
+# Failed attempts after which a term is given up
+MAX_ATTEMPTS = int(os.getenv("ETSYHUNT_MAX_ATTEMPTS", 3))
+
+
+def journal_path(search_term: str, folder: str) -> str:
+    """Path of the journal for a seed search term."""
+    slug = search_term.strip().lower().replace(" ", "_")
+    return os.path.join(folder, f"etsyhunt_{slug}.journal.jsonl")
+
+
+def file_checksum(path: str) -> str:
+    """sha256 of a downloaded export."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record(journal: str, term: Optional[str], state: str, **fields):
+    """Append an event to the journal."""
+    event = {"time": time.time(), "term": term, "state": state, **fields}
+    with open(journal, "a") as f:
+        f.write(json.dumps(event) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def start_job(journal: str, terms: List[str]):
+    """Record the terms of a new job, all pending."""
+    record(journal, None, "job", terms=terms)
+    for term in terms:
+        record(journal, term, PENDING)
+
+
+def load_journal(journal: str) -> Dict:
+    """Replay a journal into the job's terms and the latest event per term."""
+    job = {"terms": [], "states": {}}
+    if not os.path.exists(journal):
+        return job
+    with open(journal) as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line
+                continue
+            if event["state"] == "job":
+                job["terms"] = event["terms"]
+                continue
+            previous = job["states"].get(event["term"], {})
+            attempts = previous.get("attempts", 0)
+            if event["state"] == FAILED:
+                attempts += 1
+            elif event["state"] == PENDING:
+                attempts = 0
+            job["states"][event["term"]] = {**event, "attempts": attempts}
+    return job
+
+
+def is_completed(event: Dict) -> bool:
+    """Whether a term's latest event means it needs no more work.
+
+    A renamed export only counts if the file is still there, unchanged.
+    """
+    if event.get("state") not in COMPLETED_STATES:
+        return False
+    if event["state"] == RENAMED:
+        path = event.get("path")
+        if not path or not os.path.exists(path):
+            return False
+        return file_checksum(path) == event.get("sha256")
+    return True
+
+
+def give_up_failing(
+    journal: str, job: Dict, max_attempts: int = MAX_ATTEMPTS
+) -> List[str]:
+    """Mark the terms that failed max_attempts times as given up, returning them."""
+    given_up = []
+    for term in job["terms"]:
+        event = job["states"].get(term, {})
+        if event.get("state") == FAILED and event["attempts"] >= max_attempts:
+            record(journal, term, GIVEN_UP, attempts=event["attempts"])
+            job["states"][term] = {**event, "state": GIVEN_UP}
+            given_up.append(term)
+    return given_up
+
+
+def remaining_terms(job: Dict) -> List[str]:
+    """Terms of the job that still need to be scraped, in job order."""
+    return [
+        term for term in job["terms"] if not is_completed(job["states"].get(term, {}))
+    ]
@@ -0,0 +1,210 @@
+"""Scrape search terms with several logged-in browser sessions at once.
+
+Each worker process runs its own Helium Firefox session with its own download
+folder and pulls terms from a shared queue. One pacer (see ``pacing.py``)
+paces the requests of all workers and backs off for all of them on throttling,
+so adding workers raises throughput only up to the configured request budget.
+
+Example usage:
+    $ python scrape_pool.py --workers 3 --requests-per-minute 20 chinese name seals
+    $ python scrape_pool.py --workers 2 --terms "hanko seal,chinese chop seal"
+
+Against the local mock (see mock_etsyhunt.py):
+    $ ETSYHUNT_URL=http://localhost:8000 python scrape_pool.py --headless --terms ...
+"""
+
+import argparse
+import glob
+import logging
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+import downloads
+import etsyhunt_bot
+import pacing
+
+logging.basicConfig(level=logging.INFO)
+
+
+def worker_folder(downloads_folder: str, worker_id: int) -> str:
+    return os.path.join(downloads_folder, f".etsyhunt_worker_{worker_id}")
+
+
+def scrape_worker(
+    worker_id: int,
+    terms: mp.Queue,
+    results: mp.Queue,
+    pacer: pacing.Pacer,
+    downloads_folder: str,
+    headless: bool,
+    export_folder: Optional[str] = None,
+):
+    """Log in and scrape terms from the queue until it is empty."""
+    folder = worker_folder(downloads_folder, worker_id)
+    os.makedirs(folder, exist_ok=True)
+    pacer.acquire()
+    etsyhunt_bot.start_chrome_and_login(folder, headless=headless)
+    etsyhunt_bot.go_to_product_search()
+    logging.info("Worker %d logged in", worker_id)
+    try:
+        while True:
+            try:
+                term = terms.get_nowait()
+            except queue.Empty:
+                break
+            # Report the term as taken, so it is not lost if the browser dies
+            results.put((term, "started", worker_id))
+            try:
+                status = etsyhunt_bot.scrape_term(
+                    term, folder, pacer, export_folder=export_folder
+                )
+            except Exception:
+                logging.exception("Worker %d failed on %s", worker_id, term)
+                status = "failed"
+            results.put((term, status, worker_id))
+    finally:
+        etsyhunt_bot.close_browser()
+
+
+def collect_downloads(downloads_folder: str, workers: int):
+    """Move exports left in the worker folders to downloads_folder."""
+    for worker_id in range(workers):
+        folder = worker_folder(downloads_folder, worker_id)
+        for path in glob.glob(os.path.join(folder, "*_product_detail.*")):
+            shutil.move(path, os.path.join(downloads_folder, os.path.basename(path)))
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_pool(
+    terms: List[str],
+    workers: int = 2,
+    requests_per_minute: float = pacing.REQUESTS_PER_MINUTE,
+    burst: int = pacing.BURST,
+    jitter: float = pacing.JITTER,
+    downloads_folder: str = etsyhunt_bot.DOWNLOADS_FOLDER,
+    headless: bool = False,
+    export_folder: Optional[str] = None,
+) -> Dict[str, str]:
+    """Scrape terms with a pool of browser sessions, returning each term's status."""
+    term_queue = mp.Queue()
+    for term in terms:
+        term_queue.put(term)
+    results = mp.Queue()
+    pacer = pacing.Pacer(requests_per_minute, burst, jitter)
+
+    processes = [
+        mp.Process(
+            target=scrape_worker,
+            args=(
+                i,
+                term_queue,
+                results,
+                pacer,
+                downloads_folder,
+                headless,
+                export_folder,
+            ),
+        )
+        for i in range(min(workers, len(terms)))
+    ]
+    for process in processes:
+        process.start()
+
+    statuses = {term: "pending" for term in terms}
+    while any(process.is_alive() for process in processes) or not results.empty():
+        try:
+            term, status, worker_id = results.get(timeout=1)
+        except queue.Empty:
+            continue
+        statuses[term] = status
+        if status != "started":
+            logging.info("Worker %d: %s -> %s", worker_id, term, status)
+    for process in processes:
+        process.join()
+
+    # Terms whose worker died mid-scrape
+    for term, status in statuses.items():
+        if status == "started":
+            statuses[term] = "failed"
+    collect_downloads(downloads_folder, len(processes))
+    return statuses
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("search_term", nargs="*", help="Seed term to expand.")
+    parser.add_argument(
+        "--terms", help="Comma separated terms to scrape, skips the expansion."
+    )
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument(
+        "--requests-per-minute", type=float, default=pacing.REQUESTS_PER_MINUTE
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=pacing.BURST,
+        help="Requests that may be sent at once after an idle period.",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=pacing.JITTER,
+        help="Random extra wait, as a fraction of the interval between requests.",
+    )
+    parser.add_argument("--downloads-folder", default=etsyhunt_bot.DOWNLOADS_FOLDER)
+    parser.add_argument(
+        "--category",
+        help="Product name whose data/products folder the exports are stored in "
+        "(default: the search term).",
+    )
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="Log in once and download the exports over HTTP, with --workers "
+        "requests at once (see export_client.py).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.terms:
+        terms = [term.strip() for term in args.terms.split(",") if term.strip()]
+    elif args.search_term:
+        terms = etsyhunt_bot.confirm_search_terms(
+            etsyhunt_bot.expand_search_terms(" ".join(args.search_term))
+        )
+    else:
+        parser.error("Provide a search term or --terms")
+    category = args.category or " ".join(args.search_term)
+    export_folder = downloads.category_folder(category) if category else None
+
+    if args.direct:
+        statuses = etsyhunt_bot.scrape_direct(
+            terms,
+            export_folder or args.downloads_folder,
+            args.downloads_folder,
+            pacing.Pacer(args.requests_per_minute, args.burst, args.jitter),
+            concurrency=args.workers,
+            headless=args.headless,
+        )
+    else:
+        statuses = run_pool(
+            terms,
+            workers=args.workers,
+            requests_per_minute=args.requests_per_minute,
+            burst=args.burst,
+            jitter=args.jitter,
+            downloads_folder=args.downloads_folder,
+            headless=args.headless,
+            export_folder=export_folder,
+        )
+    for term, status in statuses.items():
+        logging.info("%s: %s", term, status)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
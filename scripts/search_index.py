@@ -0,0 +1,249 @@
+"""Full-text search over listing titles, tags and store names.
+
+The index has one segment per category, so ingest only rebuilds the segments
+of the categories whose exports changed. A segment holds its documents (one
+per listing in the category, with the columns results are filtered on) and
+an inverted index from each term to the documents containing it and the term
+frequencies.
+
+Results are ranked with BM25. The document frequencies and average document
+length are summed over all segments when the index is loaded, so scores do
+not depend on how the index is split.
+
+Example usage:
+    index = load_search_index()
+    index.search("jade bangle", max_price=50, has_sales=True)
+"""
+
+import glob
+import logging
+import os
+from typing import Iterable, List, Optional
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+SEARCH_INDEX_FOLDER = "search_index"
+TOKEN_PATTERN = r"[a-z0-9]+"
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+document_columns = [
+    "listing_id",
+    "product_name",
+    "Title",
+    "Store Name",
+    "price",
+    "Total Sales",
+    "has_sales",
+    "Product URL",
+]
+
+
+def stem(tokens: pd.Series) -> pd.Series:
+    """Strip plural endings, so "bangles" finds "bangle"."""
+    return tokens.str.replace(r"(?<=[a-z]{3})(?<!s)s$", "", regex=True)
+
+
+def tokenize(text: pd.Series) -> pd.Series:
+    """Split text into lowercase, stemmed tokens, one per row of the result.
+
+    Each token keeps the index of the text it came from.
+    """
+    tokens = text.fillna("").str.lower().str.findall(TOKEN_PATTERN).explode()
+    return stem(tokens.dropna())
+
+
+def document_text(df: pd.DataFrame) -> pd.Series:
+    """The searchable text of each listing: its title, tags and store name."""
+    tags = df["Tags"].map(" ".join)
+    return df["Title"].fillna("") + " " + tags + " " + df["Store Name"].fillna("")
+
+
+def build_segment(df: pd.DataFrame) -> dict:
+    """Build the documents and postings of one category's listings."""
+    df = df.reset_index(drop=True)
+    entries = tokenize(document_text(df))
+    documents = df[document_columns].copy()
+    documents["length"] = (
+        entries.index.value_counts().reindex(df.index, fill_value=0).astype(np.int32)
+    )
+    counts = (
+        pd.DataFrame({"term": entries.to_numpy(), "doc": entries.index.to_numpy()})
+        .groupby(["term", "doc"], sort=True)
+        .size()
+    )
+    terms, term_codes = np.unique(
+        counts.index.get_level_values("term").to_numpy(dtype=str), return_inverse=True
+    )
+    offsets = np.searchsorted(term_codes, np.arange(len(terms) + 1)).astype(np.int32)
+    postings = pa.table(
+        {
+            "term": pa.array(terms),
+            "docs": pa.ListArray.from_arrays(
+                pa.array(offsets),
+                pa.array(counts.index.get_level_values("doc").to_numpy(np.int32)),
+            ),
+            "tfs": pa.ListArray.from_arrays(
+                pa.array(offsets), pa.array(counts.to_numpy(np.uint16))
+            ),
+        }
+    )
+    return {"documents": documents, "postings": postings}
+
+
+def _segment_path(folder: str, product_name: str) -> str:
+    return os.path.join(folder, quote(product_name, safe=""))
+
+
+def update_search_index(
+    df: pd.DataFrame,
+    output_folder: str = output_folder,
+    product_names: Optional[Iterable[str]] = None,
+):
+    """Rebuild the segments of ``product_names``, or of all categories if None.
+
+    ``df`` is the product table with tag lists. Segments of categories no
+    longer in ``df`` are removed.
+    """
+    folder = os.path.join(output_folder, SEARCH_INDEX_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    if product_names is None:
+        product_names = df["product_name"].unique()
+    for product_name, rows in df[df["product_name"].isin(product_names)].groupby(
+        "product_name"
+    ):
+        path = _segment_path(folder, product_name)
+        os.makedirs(path, exist_ok=True)
+        segment = build_segment(rows)
+        segment["documents"].to_parquet(
+            os.path.join(path, "documents.parquet"), compression="zstd", index=False
+        )
+        pq.write_table(
+            segment["postings"],
+            os.path.join(path, "postings.parquet"),
+            compression="zstd",
+        )
+
+    live = {
+        os.path.basename(_segment_path(folder, name))
+        for name in df["product_name"].unique()
+    }
+    for path in glob.glob(os.path.join(folder, "*", "")):
+        if os.path.basename(path.rstrip("/")) not in live:
+            for file in glob.glob(os.path.join(path, "*")):
+                os.remove(file)
+            os.rmdir(path)
+    logging.info("Rebuilt %d search index segments", len(set(product_names)))
+
+
+class Segment:
+    """The decoded documents and postings of one category."""
+
+    def __init__(self, documents: pd.DataFrame, postings: pa.Table):
+        self.documents = documents
+        self.lengths = documents["length"].to_numpy(np.float64)
+        self.prices = documents["price"].to_numpy(np.float64)
+        self.has_sales = documents["has_sales"].to_numpy(bool)
+        self.terms = {
+            term: i for i, term in enumerate(postings.column("term").to_pylist())
+        }
+        docs = postings.column("docs").combine_chunks()
+        self.offsets = docs.offsets.to_numpy() - docs.offsets.to_numpy()[0]
+        self.docs = docs.flatten().to_numpy()
+        self.tfs = postings.column("tfs").combine_chunks().flatten().to_numpy()
+
+    def postings(self, term: str):
+        """The documents containing a term and its frequency in each."""
+        i = self.terms.get(term)
+        if i is None:
+            return self.docs[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+
+class SearchIndex:
+    """All segments of the search index, with the BM25 statistics across them."""
+
+    def __init__(self, segments: dict):
+        self.segments = segments
+        self.n_documents = sum(len(s.documents) for s in segments.values())
+        total_length = sum(s.lengths.sum() for s in segments.values())
+        self.average_length = total_length / max(self.n_documents, 1)
+
+    def idf(self, term: str) -> float:
+        frequency = sum(len(s.postings(term)[0]) for s in self.segments.values())
+        return np.log(1 + (self.n_documents - frequency + 0.5) / (frequency + 0.5))
+
+    def search(
+        self,
+        query: str,
+        product_names: Optional[List[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        has_sales: Optional[bool] = None,
+        k: int = 50,
+    ) -> pd.DataFrame:
+        """The k best matching listings that pass the filters.
+
+        Without query terms, the filtered listings are ranked by Total Sales.
+        """
+        terms = list(dict.fromkeys(tokenize(pd.Series([query]))))
+        idfs = {term: self.idf(term) for term in terms}
+        results = []
+        for product_name, segment in self.segments.items():
+            if product_names is not None and product_name not in product_names:
+                continue
+            keep = np.ones(len(segment.documents), dtype=bool)
+            if min_price is not None:
+                keep &= segment.prices >= min_price
+            if max_price is not None:
+                keep &= segment.prices <= max_price
+            if has_sales is not None:
+                keep &= segment.has_sales == has_sales
+
+            if terms:
+                scores = np.zeros(len(segment.documents))
+                norm = K1 * (1 - B + B * segment.lengths / self.average_length)
+                for term in terms:
+                    docs, tfs = segment.postings(term)
+                    scores[docs] += idfs[term] * tfs * (K1 + 1) / (tfs + norm[docs])
+                keep &= scores > 0
+            else:
+                scores = segment.documents["Total Sales"].to_numpy(np.float64)
+            matches = np.flatnonzero(keep)
+            if len(matches) > k:
+                matches = matches[np.argpartition(-scores[matches], k)[:k]]
+            results.append(
+                segment.documents.iloc[matches].assign(score=scores[matches])
+            )
+
+        if not results:
+            return pd.DataFrame(columns=document_columns + ["score"])
+        return (
+            pd.concat(results, ignore_index=True)
+            .sort_values("score", ascending=False)
+            .head(k)
+            .drop(columns="length")
+            .reset_index(drop=True)
+        )
+
+
+def load_search_index(output_folder: str = output_folder) -> SearchIndex:
+    """Load every segment of the search index."""
+    folder = os.path.join(output_folder, SEARCH_INDEX_FOLDER)
+    segments = {}
+    for path in sorted(glob.glob(os.path.join(folder, "*", ""))):
+        documents = pd.read_parquet(os.path.join(path, "documents.parquet"))
+        if len(documents):
+            segments[documents["product_name"].iloc[0]] = Segment(
+                documents, pq.read_table(os.path.join(path, "postings.parquet"))
+            )
+    return SearchIndex(segments)
@@ -0,0 +1,248 @@
+"""Mergeable sketches of grouped columns, for aggregating in bounded memory.
+
+Each sketch summarizes a column per group (e.g. per category) in a state
+whose size does not grow with the rows, and two sketches of different chunks
+merge into the sketch of both, so a table can be aggregated one chunk at a
+time:
+
+- ``HyperLogLog``: distinct counts, with a standard error of
+  ``1.04 / sqrt(2 ** precision)`` (0.8% at the default precision) or less at
+  any count;
+- ``QuantileSketch``: quantiles of non-negative values, as counts of
+  logarithmic buckets (as in DDSketch). Every estimate is within
+  ``relative_accuracy`` of the value of the rank it estimates;
+- ``HeavyHitters``: the groups with the largest sums of a weight (the
+  mergeable Misra-Gries summary), keeping at most ``capacity`` items per
+  partition. Each kept item's sum is underestimated by at most the
+  partition's total weight divided by ``capacity + 1``, and items whose sum
+  is above that bound are always kept.
+
+The quantile and heavy hitter states are Series indexed by the group keys
+(plus the ``bucket`` of a quantile sketch), so updates and merges are
+vectorized groupbys.
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+HLL_PRECISION = 14
+RELATIVE_ACCURACY = 0.01
+CAPACITY = 1000
+
+# Bucket of the values <= 0 in a QuantileSketch
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+
+# Set bits of every byte, for numpy < 2 which has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    octets = np.ascontiguousarray(values, dtype=np.uint64).view(np.uint8)
+    return _BYTE_POPCOUNT[octets].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """The bit length of each uint64, exactly (float log2 rounds above 2**53)."""
+    for shift in (1, 2, 4, 8, 16, 32):
+        values = values | (values >> np.uint64(shift))
+    return _popcount(values)
+
+
+def _merge(states: List[pd.Series], how: str) -> pd.Series:
+    states = [state for state in states if len(state)]
+    if not states:
+        return pd.Series(dtype=float)
+    if len(states) == 1:
+        return states[0]
+    merged = pd.concat(states)
+    return merged.groupby(level=list(range(merged.index.nlevels))).agg(how)
+
+
+class HyperLogLog:
+    """Distinct counts of a column per group.
+
+    Each group has a dense array of ``2 ** precision`` registers, so the
+    number of groups should stay small (e.g. categories, not stores).
+    """
+
+    def __init__(self, keys: List[str], precision: int = HLL_PRECISION):
+        self.keys = keys
+        self.precision = precision
+        self.registers: Dict[Tuple, np.ndarray] = {}
+
+    def update(self, groups: pd.DataFrame, values: pd.Series):
+        """Add the values of a chunk, with their group keys in ``groups``."""
+        present = values.notna().to_numpy()
+        if not present.any():
+            return
+        hashes = pd.util.hash_pandas_object(values[present], index=False).to_numpy()
+        width = np.uint64(64 - self.precision)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        register = (hashes >> width).astype(np.int64)
+        rank = (int(width) - _bit_length(rest) + 1).astype(np.uint8)
+        codes, uniques = pd.MultiIndex.from_frame(
+            groups[present][self.keys]
+        ).factorize()
+        block = np.zeros((len(uniques), 1 << self.precision), dtype=np.uint8)
+        np.maximum.at(block, (codes, register), rank)
+        for key, registers in zip(uniques, block):
+            if key in self.registers:
+                np.maximum(self.registers[key], registers, out=self.registers[key])
+            else:
+                self.registers[key] = registers
+
+    def merge(self, other: "HyperLogLog"):
+        for key, registers in other.registers.items():
+            if key in self.registers:
+                np.maximum(self.registers[key], registers, out=self.registers[key])
+            else:
+                self.registers[key] = registers.copy()
+
+    def estimate(self) -> pd.Series:
+        """The estimated number of distinct values of each group."""
+        if not self.registers:
+            return pd.Series(dtype=float)
+        q = 64 - self.precision
+        estimates = [
+            _ertl_estimate(np.bincount(registers, minlength=q + 2), q)
+            for registers in self.registers.values()
+        ]
+        index = pd.MultiIndex.from_tuples(list(self.registers), names=self.keys)
+        return pd.Series(estimates, index)
+
+
+def _sigma(x: float) -> float:
+    if x == 1:
+        return np.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x in (0, 1):
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = np.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def _ertl_estimate(histogram: np.ndarray, q: int) -> float:
+    """Ertl's improved HyperLogLog estimator, from the register histogram.
+
+    Unlike the original estimator with its switch to linear counting, it has
+    no bias at any cardinality, so no empirical correction tables are needed.
+    """
+    m = histogram.sum()
+    z = m * _tau(1 - histogram[q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + histogram[k])
+    z += m * _sigma(histogram[0] / m)
+    return m * m / (2 * np.log(2)) / z
+
+
+class QuantileSketch:
+    """Quantiles of a non-negative column per group."""
+
+    def __init__(self, keys: List[str], relative_accuracy: float = RELATIVE_ACCURACY):
+        self.keys = keys
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.counts = pd.Series(dtype=np.int64)
+
+    def update(self, groups: pd.DataFrame, values: pd.Series):
+        """Add the values of a chunk, with their group keys in ``groups``."""
+        present = values.notna().to_numpy()
+        values = values[present].to_numpy(dtype=float)
+        with np.errstate(divide="ignore"):
+            buckets = np.ceil(np.log(values) / np.log(self.gamma))
+        buckets = np.where(values > 0, buckets, ZERO_BUCKET).astype(np.int32)
+        chunk = groups[present].assign(bucket=buckets)
+        counts = chunk.groupby(self.keys + ["bucket"], sort=False).size()
+        self.counts = _merge([self.counts, counts], "sum")
+
+    def merge(self, other: "QuantileSketch"):
+        self.counts = _merge([self.counts, other.counts], "sum")
+
+    def bucket_values(self, buckets: pd.Series) -> pd.Series:
+        """The value each bucket stands for, within relative_accuracy of its values."""
+        values = 2 * self.gamma ** buckets.astype(float) / (self.gamma + 1)
+        return values.where(buckets != ZERO_BUCKET, 0.0)
+
+    def quantile(self, q: float = 0.5) -> pd.Series:
+        """Each group's q-quantile, interpolated between ranks like pandas."""
+        if not len(self.counts):
+            return pd.Series(dtype=float)
+        counts = self.counts.sort_index()
+        buckets = pd.Series(counts.index.get_level_values("bucket"), counts.index)
+        grouped = counts.groupby(level=self.keys)
+        seen = grouped.cumsum()
+        position = q * (grouped.transform("sum") - 1)
+        lower, upper = np.floor(position), np.ceil(position)
+
+        def value_at(rank: pd.Series) -> pd.Series:
+            # The value of a rank is in the first bucket that reaches past it
+            first = buckets[seen > rank].groupby(level=self.keys).first()
+            return self.bucket_values(first)
+
+        fraction = (position - lower).groupby(level=self.keys).first()
+        low, high = value_at(lower), value_at(upper)
+        return low + (high - low) * fraction
+
+
+class HeavyHitters:
+    """The items with the largest summed weight in each partition.
+
+    ``keys`` are the partition key (e.g. the category) then the item key
+    (e.g. the store). ``totals`` holds the exact total weight per partition.
+    """
+
+    def __init__(self, keys: List[str], capacity: int = CAPACITY):
+        self.keys = keys
+        self.capacity = capacity
+        self.weights = pd.Series(dtype=float)
+        self.totals = pd.Series(dtype=float)
+
+    def update(self, groups: pd.DataFrame, weights: pd.Series):
+        """Add the weights of a chunk, with their keys in ``groups``."""
+        chunk = groups.assign(weight=weights.to_numpy())
+        self._combine(
+            chunk.groupby(self.keys, sort=False)["weight"].sum(),
+            chunk.groupby(self.keys[0], sort=False)["weight"].sum(),
+        )
+
+    def merge(self, other: "HeavyHitters"):
+        self._combine(other.weights, other.totals)
+
+    def _combine(self, weights: pd.Series, totals: pd.Series):
+        self.totals = _merge([self.totals, totals], "sum")
+        weights = _merge([self.weights, weights], "sum")
+        weights = weights[weights > 0]
+        partition = weights.index.get_level_values(0)
+        rank = weights.groupby(level=0).rank(method="first", ascending=False)
+        if (rank > self.capacity).any():
+            # Take the (capacity + 1)-th largest weight off every item of the
+            # partition, which leaves at most capacity items above zero
+            threshold = weights[rank == self.capacity + 1].droplevel(1)
+            weights = weights - threshold.reindex(partition).fillna(0).to_numpy()
+            weights = weights[weights > 0]
+        self.weights = weights
+
+    def error_bound(self) -> pd.Series:
+        """The most each item's weight of a partition may be underestimated by."""
+        return self.totals / (self.capacity + 1)
@@ -0,0 +1,197 @@
+"""Append-only time series of listing metrics across scrapes.
+
+Every export is a snapshot of its listings' sales, reviews and favorites at
+scrape time. Ingest appends the listings of new or changed exports here, with
+the export's modification time as the scrape timestamp, instead of
+overwriting the previous scrape.
+
+A listing found in several categories has a series in each of them, so the
+snapshots are keyed by ``(listing_id, product_name)``.
+
+Snapshots are delta encoded: a listing is only written again when one of its
+metrics changed since its last stored snapshot in that category, so re-scraping unchanged
+listings costs nothing. Each append is one Parquet chunk sorted by listing,
+and queries read only the columns and rows they need through predicate
+pushdown.
+"""
+
+import glob
+import os
+from datetime import datetime
+from typing import List, Optional, Union
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+SNAPSHOTS_FOLDER = "snapshots"
+LATEST_FILE = "latest.parquet"
+LISTING_ID = "listing_id"
+SCRAPED_AT = "scraped_at"
+KEY = [LISTING_ID, "product_name"]
+
+metric_columns = [
+    "7-day sales",
+    "Total Sales",
+    "Total Reviews",
+    "7-day Reviews",
+    "Total Favorites",
+    "7-day Favorites",
+    "price",
+]
+snapshot_columns = [LISTING_ID, SCRAPED_AT, "product_name"] + metric_columns
+
+Timestamp = Union[str, datetime, pd.Timestamp, None]
+
+
+def _folder(output_folder: str) -> str:
+    return os.path.join(output_folder, SNAPSHOTS_FOLDER)
+
+
+def to_snapshot(df: pd.DataFrame, scraped_at: Timestamp) -> pd.DataFrame:
+    """Select and type the snapshot columns of parsed export rows."""
+    snapshot = df[[LISTING_ID, "product_name"] + metric_columns].copy()
+    for col in metric_columns:
+        # in2csv turns all-0/1 columns into True/False
+        snapshot[col] = snapshot[col].astype("float64")
+    snapshot[LISTING_ID] = snapshot[LISTING_ID].astype("int64")
+    # Second resolution, so every chunk has the same timestamp type
+    snapshot[SCRAPED_AT] = pd.Timestamp(scraped_at).floor("s")
+    snapshot[SCRAPED_AT] = snapshot[SCRAPED_AT].astype("datetime64[s]")
+    return snapshot[snapshot_columns]
+
+
+def load_latest(output_folder: str = output_folder) -> pd.DataFrame:
+    """The last stored snapshot of every listing in each of its categories."""
+    path = os.path.join(_folder(output_folder), LATEST_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=snapshot_columns)
+    return pd.read_parquet(path)
+
+
+def append_snapshot(snapshot: pd.DataFrame, output_folder: str = output_folder) -> int:
+    """Append the rows of a snapshot whose metrics changed, returning how many.
+
+    ``snapshot`` has the columns of ``to_snapshot``; rows may come from several
+    exports with different scrape times.
+    """
+    folder = _folder(output_folder)
+    os.makedirs(folder, exist_ok=True)
+    latest = load_latest(output_folder)
+
+    # Within a snapshot keep the last row per key and timestamp, then compare
+    # each row against the previous one of its key, stored or new
+    snapshot = snapshot.drop_duplicates(subset=KEY + [SCRAPED_AT], keep="last")
+    combined = pd.concat(
+        [latest.assign(_stored=True), snapshot.assign(_stored=False)],
+        ignore_index=True,
+    ).sort_values(KEY + [SCRAPED_AT, "_stored"], ascending=[True, True, True, False])
+    previous = combined.groupby(KEY)[metric_columns].shift()
+    changed = (combined[metric_columns] != previous).any(axis=1)
+    # A key's first row ever has no previous row and counts as changed
+    new_rows = combined[~combined["_stored"] & changed].drop(columns="_stored")
+    if new_rows.empty:
+        return 0
+
+    new_rows = new_rows.sort_values(KEY + [SCRAPED_AT]).astype(
+        {LISTING_ID: "int64", SCRAPED_AT: "datetime64[s]"}
+    )
+    chunk = pd.Timestamp.now().strftime("%Y%m%dT%H%M%S%f")
+    new_rows.to_parquet(
+        os.path.join(folder, f"chunk_{chunk}.parquet"),
+        compression="zstd",
+        index=False,
+    )
+    latest = (
+        pd.concat([latest, new_rows], ignore_index=True)
+        .sort_values(KEY + [SCRAPED_AT])
+        .drop_duplicates(subset=KEY, keep="last")
+    )
+    tmp_path = os.path.join(folder, LATEST_FILE + ".tmp")
+    latest.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(folder, LATEST_FILE))
+    return len(new_rows)
+
+
+def load_history(
+    listing_ids: Optional[List[int]] = None,
+    product_names: Optional[List[str]] = None,
+    start: Timestamp = None,
+    end: Timestamp = None,
+    columns: Optional[List[str]] = None,
+    output_folder: str = output_folder,
+) -> pd.DataFrame:
+    """Read the stored snapshots matching the filters, sorted by listing, category and time."""
+    chunks = sorted(glob.glob(os.path.join(_folder(output_folder), "chunk_*.parquet")))
+    if not chunks:
+        return pd.DataFrame(columns=columns or snapshot_columns)
+    if columns is not None:
+        columns = list(dict.fromkeys(KEY + [SCRAPED_AT] + columns))
+
+    dataset = ds.dataset(chunks, format="parquet")
+    condition = None
+    filters = []
+    if listing_ids is not None:
+        filters.append(ds.field(LISTING_ID).isin(list(listing_ids)))
+    if product_names is not None:
+        filters.append(ds.field("product_name").isin(list(product_names)))
+    if start is not None:
+        filters.append(ds.field(SCRAPED_AT) >= pd.Timestamp(start))
+    if end is not None:
+        filters.append(ds.field(SCRAPED_AT) <= pd.Timestamp(end))
+    for expression in filters:
+        condition = expression if condition is None else condition & expression
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return df.sort_values(KEY + [SCRAPED_AT]).reset_index(drop=True)
+
+
+def listing_history(
+    listing_id: int,
+    start: Timestamp = None,
+    end: Timestamp = None,
+    output_folder: str = output_folder,
+) -> pd.DataFrame:
+    """The snapshots of one listing, with its sales velocity between them.
+
+    A listing found in several categories has one series per ``product_name``.
+    """
+    history = load_history(
+        [listing_id], start=start, end=end, output_folder=output_folder
+    )
+    grouped = history.groupby("product_name")
+    days = grouped[SCRAPED_AT].diff().dt.total_seconds() / 86400
+    history["sales_per_day"] = grouped["Total Sales"].diff() / days
+    return history
+
+
+def category_history(
+    product_name: str,
+    metric: str = "7-day sales",
+    start: Timestamp = None,
+    end: Timestamp = None,
+    output_folder: str = output_folder,
+) -> pd.Series:
+    """The total of a metric over a category's listings at each snapshot time.
+
+    Listings keep their last value until they change, so the total is the
+    running sum of each listing's changes. Snapshots before ``start`` are read
+    (only the listing, time and metric columns) to get the starting total.
+    """
+    history = load_history(
+        product_names=[product_name],
+        end=end,
+        columns=[metric],
+        output_folder=output_folder,
+    ).sort_values(SCRAPED_AT, kind="stable")
+    delta = history.groupby(KEY)[metric].diff().fillna(history[metric])
+    total = delta.groupby(history[SCRAPED_AT]).sum().cumsum().rename(metric)
+    if start is not None:
+        start = pd.Timestamp(start)
+        before = total[total.index < start]
+        total = total[total.index >= start]
+        if len(before) and start not in total.index:
+            baseline = pd.Series({start: before.iloc[-1]}, name=metric)
+            total = pd.concat([baseline, total])
+    return total
@@ -0,0 +1,219 @@
+"""Profiles of the stores behind the listings.
+
+Ingest rolls the product table up per ``Store Name``, each listing counted
+once even when it was found in several categories:
+
+- ``stores``: one row per store with its listing count, the categories it
+  sells in, price quantiles, total and 7-day sales, proceeds, Best Seller /
+  Etsy Pick / Raving counts and where it ships from (the most common
+  ``Ship From``);
+- ``category_stores``: the same rollups per category and store, over the
+  listings found in that category, sorted by category;
+- ``listings``: the listings sorted by store, with each store's rows at
+  ``start:stop`` in the stores table.
+
+``StoreIndex`` answers the dashboard's questions without scanning the
+product table: a store's profile and listings are a dict lookup and a
+slice, and the top stores by any metric, overall or in a category, an
+argpartition over one column.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregates import STORE_COLUMN
+from listing_index import LISTING_ID
+from product_store import load_product_data, to_store_types
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+STORE_INDEX_FOLDER = "store_index"
+PRICE_QUANTILES = [0.25, 0.5, 0.75]
+
+# Listing columns shown when drilling into a store
+listing_columns = [
+    LISTING_ID,
+    "Title",
+    "price",
+    "Total Sales",
+    "7-day sales",
+    "proceeds",
+    "Best Seller",
+    "Etsy Pick",
+    "Raving",
+    "Ship From",
+    "Product URL",
+]
+
+# Rollups the top stores can be ranked by
+metrics = [
+    "total_sales",
+    "sales_7d",
+    "proceeds",
+    "listings",
+    "categories",
+    "median_price",
+    "best_sellers",
+    "etsy_picks",
+    "raving",
+]
+
+
+def _rollup(listings: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """The rollups of the listings per ``keys``."""
+    grouped = listings.groupby(keys, sort=True)
+    rollup = grouped.agg(
+        listings=(LISTING_ID, "size"),
+        total_sales=("Total Sales", "sum"),
+        sales_7d=("7-day sales", "sum"),
+        proceeds=("proceeds", "sum"),
+        best_sellers=("Best Seller", "sum"),
+        etsy_picks=("Etsy Pick", "sum"),
+        raving=("Raving", "sum"),
+    )
+    prices = grouped["price"].quantile(PRICE_QUANTILES).unstack()
+    for q in PRICE_QUANTILES:
+        name = "median_price" if q == 0.5 else f"price_p{int(q * 100)}"
+        rollup[name] = prices[q]
+    rollup["min_price"] = grouped["price"].min()
+    rollup["max_price"] = grouped["price"].max()
+    ship_from = listings.groupby(keys + ["Ship From"]).size()
+    most_common = ship_from.sort_values(kind="stable").groupby(level=keys).tail(1)
+    rollup["ship_from"] = most_common.reset_index(level=-1)["Ship From"]
+    return rollup
+
+
+def build_store_index(all_product_data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Build the store rollups, overall and per category, and the listings."""
+    df = all_product_data[all_product_data[STORE_COLUMN].notna()]
+    listings = (
+        df.drop_duplicates(subset=[LISTING_ID])
+        .sort_values([STORE_COLUMN, "Total Sales"], ascending=[True, False])
+        .reset_index(drop=True)
+    )
+    stores = _rollup(listings, [STORE_COLUMN])
+    stores["product_names"] = (
+        df.groupby(STORE_COLUMN)["product_name"]
+        .agg(lambda names: sorted(set(names)))
+        .reindex(stores.index)
+    )
+    stores["categories"] = stores["product_names"].str.len()
+    # The listings are sorted by store, so each store's rows are contiguous
+    stores["stop"] = stores["listings"].cumsum()
+    stores["start"] = stores["stop"] - stores["listings"]
+
+    # Sorted by category, so each category's stores are contiguous
+    category_stores = _rollup(
+        df.drop_duplicates(subset=[LISTING_ID, "product_name"]),
+        ["product_name", STORE_COLUMN],
+    ).reset_index()
+    category_stores["categories"] = category_stores[STORE_COLUMN].map(
+        stores["categories"]
+    )
+    return {
+        "stores": stores.reset_index(),
+        "category_stores": category_stores,
+        "listings": listings[[STORE_COLUMN] + listing_columns],
+    }
+
+
+def write_store_index(index: Dict[str, pd.DataFrame], output_folder: str):
+    """Persist the store index as Parquet."""
+    folder = os.path.join(output_folder, STORE_INDEX_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    for name, df in index.items():
+        df.to_parquet(
+            os.path.join(folder, f"{name}.parquet"), compression="zstd", index=False
+        )
+
+
+class StoreIndex:
+    """The loaded store index, see the module docstring for the queries."""
+
+    def __init__(
+        self,
+        stores: pd.DataFrame,
+        category_stores: pd.DataFrame,
+        listings: pd.DataFrame,
+    ):
+        self.stores = stores
+        self.category_stores = category_stores
+        self.listing_table = listings
+        self.names = stores[STORE_COLUMN].astype(str).to_numpy()
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._starts = stores["start"].to_numpy()
+        self._stops = stores["stop"].to_numpy()
+        # Rows of each category in category_stores
+        product_names = category_stores["product_name"].astype(str)
+        bounds = pd.Series(range(len(product_names))).groupby(product_names.to_numpy())
+        self._categories = {
+            name: slice(rows.min(), rows.max() + 1) for name, rows in bounds
+        }
+        self.product_names = sorted(self._categories)
+
+    def __contains__(self, store: str) -> bool:
+        return store in self._positions
+
+    def profile(self, store: str) -> pd.Series:
+        """The rollups of a store, KeyError if it is unknown."""
+        return self.stores.iloc[self._positions[store]]
+
+    def listings(self, store: str) -> pd.DataFrame:
+        """A store's listings, best selling first."""
+        i = self._positions[store]
+        return self.listing_table.iloc[self._starts[i] : self._stops[i]]
+
+    def top(
+        self,
+        metric: str = "total_sales",
+        k: int = 20,
+        product_name: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """The k stores with the highest value of a rollup.
+
+        With ``product_name``, the stores selling in that category ranked by
+        their rollups of its listings only (``categories`` stays the number of
+        categories the store sells in).
+        """
+        if product_name is None:
+            table = self.stores.drop(columns=["start", "stop"])
+        else:
+            rows = self._categories.get(product_name, slice(0, 0))
+            table = self.category_stores.iloc[rows]
+        values = table[metric].to_numpy(dtype=np.float64)
+        values = np.nan_to_num(values, nan=-np.inf)
+        rows = np.arange(len(table))
+        if k < len(rows):
+            rows = np.argpartition(-values, k - 1)[:k]
+        rows = rows[np.argsort(-values[rows], kind="stable")]
+        return table.iloc[rows]
+
+
+def load_store_index(
+    output_folder: str = output_folder, columns: Optional[List[str]] = None
+) -> StoreIndex:
+    """Load the store index, building it from the product table if missing.
+
+    ``columns`` optionally selects the listing columns read.
+    """
+    folder = os.path.join(output_folder, STORE_INDEX_FOLDER)
+    if columns is not None:
+        columns = [STORE_COLUMN] + [col for col in columns if col != STORE_COLUMN]
+    if not os.path.exists(folder):
+        logging.warning("No store index found, building it from the product table")
+        index = build_store_index(
+            to_store_types(load_product_data(output_folder=output_folder))
+        )
+        if columns is not None:
+            index["listings"] = index["listings"][columns]
+        return StoreIndex(**index)
+    return StoreIndex(
+        pd.read_parquet(os.path.join(folder, "stores.parquet")),
+        pd.read_parquet(os.path.join(folder, "category_stores.parquet")),
+        pd.read_parquet(os.path.join(folder, "listings.parquet"), columns=columns),
+    )
@@ -0,0 +1,329 @@
+"""Build the aggregate cube in one pass over bounded-size chunks.
+
+``aggregates.build_aggregates`` needs the whole product table in memory. This
+module computes the same tables chunk by chunk, keeping exact sums and counts
+and the mergeable sketches of ``sketches.py`` for the rest:
+
+- ``Product URL|nunique``: HyperLogLog, with a standard error of 0.8%;
+- the medians: quantile sketches, within 1% (``RELATIVE_ACCURACY``) of the
+  exact median;
+- the category x store table: the stores with the largest ``Total Sales`` of
+  each category, at most ``STORE_CAPACITY`` of them. Categories with fewer
+  stores are exact, otherwise a store's sales share is underestimated by at
+  most ``1 / (STORE_CAPACITY + 1)``, and the sales of the stores dropped are
+  kept in one "Other" row per category. Only the ``total_sales`` and
+  ``sales_share`` columns the figures read are computed.
+
+Counts, sums, means and ``has_sales`` are exact. The memory held is the chunk
+being read plus the sketches, which depend on the number of categories and
+``STORE_CAPACITY``, not on the number of rows.
+
+Chunks are read from the product store, the consolidated CSV or, one
+category at a time, straight from the exports in data/products (so that
+source needs the memory of the largest category).
+
+Example usage:
+    $ python stream_aggregates.py --check
+    $ python stream_aggregates.py --source csv --chunk-rows 50000 --write
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from aggregates import (
+    CATEGORY_COLUMN,
+    OTHER_STORES,
+    STORE_COLUMN,
+    _metric_name,
+    build_aggregates,
+    source_columns,
+    value_columns,
+    write_aggregates,
+)
+from dashboard_data import publish_dataset_version
+from product_store import CSV_FILE, STORE_FOLDER, load_product_data
+from sketches import (
+    HLL_PRECISION,
+    RELATIVE_ACCURACY,
+    HeavyHitters,
+    HyperLogLog,
+    QuantileSketch,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+data_folder = os.path.join(current_directory, "../data/products/")
+output_folder = os.path.join(current_directory, "../output/")
+
+CHUNK_ROWS = 100_000
+STORE_CAPACITY = 1000
+SOURCES = ["store", "csv", "exports"]
+
+category_keys = ["subset", CATEGORY_COLUMN]
+store_keys = [CATEGORY_COLUMN, STORE_COLUMN]
+
+
+def store_chunks(
+    output_folder: str = output_folder, chunk_rows: int = CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """The product store, in chunks of at most chunk_rows rows."""
+    dataset = ds.dataset(
+        os.path.join(output_folder, STORE_FOLDER), format="parquet", partitioning="hive"
+    )
+    # The scanner yields batches of a few thousand rows whatever batch_size is,
+    # and every chunk pays a fixed cost in the sketches, so batch them up
+    batches, rows = [], 0
+    for batch in dataset.to_batches(columns=source_columns, batch_size=chunk_rows):
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunk_rows:
+            yield pa.Table.from_batches(batches).to_pandas()
+            batches, rows = [], 0
+    if rows:
+        yield pa.Table.from_batches(batches).to_pandas()
+
+
+def csv_chunks(
+    output_folder: str = output_folder, chunk_rows: int = CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """The consolidated CSV, in chunks of chunk_rows rows."""
+    yield from pd.read_csv(
+        os.path.join(output_folder, CSV_FILE),
+        usecols=source_columns,
+        chunksize=chunk_rows,
+    )
+
+
+def export_chunks(
+    data_folder: str = data_folder, chunk_rows: int = CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """Each category parsed and merged from its exports, as ingest does.
+
+    Listings are deduplicated within a category, so a whole category is held
+    at once before it is cut into chunks.
+    """
+    from ingest import get_product_names, merge_category, parse_export
+
+    for folder, product_name in get_product_names(data_folder):
+        paths = sorted(
+            os.path.join(folder, name)
+            for name in os.listdir(folder)
+            if name.endswith("_product_detail.csv")
+        )
+        if not paths:
+            continue
+        frames = [parse_export(path, product_name)[0] for path in paths]
+        category, _ = merge_category(frames, product_name)
+        category = category[source_columns]
+        for start in range(0, len(category), chunk_rows):
+            yield category.iloc[start : start + chunk_rows]
+
+
+class StreamingAggregates:
+    """The aggregate cube of ``aggregates.py``, updated one chunk at a time."""
+
+    def __init__(
+        self,
+        precision: int = HLL_PRECISION,
+        relative_accuracy: float = RELATIVE_ACCURACY,
+        store_capacity: int = STORE_CAPACITY,
+    ):
+        # Per (subset, category): row counts, sums and non-null counts
+        self.sums = pd.DataFrame()
+        self.unique = HyperLogLog(category_keys, precision)
+        self.quantiles = {
+            col: QuantileSketch(category_keys, relative_accuracy)
+            for col in value_columns
+        }
+        self.stores = HeavyHitters(store_keys, store_capacity)
+        self.integer_columns = set()
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame):
+        chunk = chunk[chunk[CATEGORY_COLUMN].notna()]
+        self.rows += len(chunk)
+        self.integer_columns.update(
+            col for col in value_columns if pd.api.types.is_integer_dtype(chunk[col])
+        )
+        has_sales = chunk["has_sales"].fillna(False).astype(bool)
+        for subset, rows in [("all", chunk), ("with_sales", chunk[has_sales])]:
+            groups = rows[[CATEGORY_COLUMN]].assign(subset=subset)[category_keys]
+            self._update_sums(groups, rows)
+            self.unique.update(groups, rows["Product URL"])
+            for col, sketch in self.quantiles.items():
+                sketch.update(groups, rows[col])
+
+        stores = chunk[chunk[STORE_COLUMN].notna()]
+        self.stores.update(stores[store_keys], stores["Total Sales"].fillna(0))
+
+    def _update_sums(self, groups: pd.DataFrame, rows: pd.DataFrame):
+        values = pd.DataFrame(
+            {
+                "rows": 1,
+                "has_sales": rows["has_sales"].fillna(False).astype(float),
+                **{f"{col}|sum": rows[col] for col in value_columns},
+                **{f"{col}|n": rows[col].notna() for col in value_columns},
+            },
+            index=rows.index,
+        )
+        sums = values.groupby([groups[key] for key in category_keys]).sum()
+        self.sums = sums if self.sums.empty else self.sums.add(sums, fill_value=0)
+
+    def merge(self, other: "StreamingAggregates"):
+        """Add the chunks another instance has seen, e.g. from another process."""
+        if not other.sums.empty:
+            self.sums = (
+                other.sums
+                if self.sums.empty
+                else self.sums.add(other.sums, fill_value=0)
+            )
+        self.unique.merge(other.unique)
+        for col, sketch in self.quantiles.items():
+            sketch.merge(other.quantiles[col])
+        self.stores.merge(other.stores)
+        self.integer_columns |= other.integer_columns
+        self.rows += other.rows
+
+    def category_aggregates(self) -> pd.DataFrame:
+        """The per-category table of ``build_category_aggregates``."""
+        sums = self.sums.sort_index()
+        category = pd.DataFrame(index=sums.index)
+        category[_metric_name("Product URL", "count")] = sums["rows"].astype("int64")
+        category[_metric_name("Product URL", "nunique")] = (
+            self.unique.estimate().reindex(sums.index).fillna(0).round().astype("int64")
+        )
+        category[_metric_name("has_sales", "mean")] = sums["has_sales"] / sums["rows"]
+        for col in value_columns:
+            total = sums[f"{col}|sum"]
+            if col in self.integer_columns:
+                total = total.astype("int64")
+            category[_metric_name(col, "sum")] = total
+            category[_metric_name(col, "median")] = (
+                self.quantiles[col].quantile(0.5).reindex(sums.index)
+            )
+            category[_metric_name(col, "mean")] = sums[f"{col}|sum"] / sums[
+                f"{col}|n"
+            ].where(sums[f"{col}|n"] > 0)
+        return category
+
+    def category_store_aggregates(self) -> pd.DataFrame:
+        """The leading stores of ``build_category_store_aggregates``, plus Other."""
+        weights = self.stores.weights
+        totals = self.stores.totals
+        kept = weights.groupby(level=CATEGORY_COLUMN).sum()
+        other = (totals - kept.reindex(totals.index).fillna(0)).round(6)
+        other = other[other > 0]
+        other.index = pd.MultiIndex.from_arrays(
+            [other.index, [OTHER_STORES] * len(other)], names=store_keys
+        )
+        category_store = pd.concat([weights, other]).rename("total_sales")
+        category_store = category_store.reset_index().sort_values(store_keys)
+        if "Total Sales" in self.integer_columns:
+            category_store["total_sales"] = (
+                category_store["total_sales"].round().astype("int64")
+            )
+        category_total = category_store[CATEGORY_COLUMN].map(totals)
+        category_store["sales_share"] = (
+            category_store["total_sales"] / category_total.where(category_total > 0)
+        ).fillna(0.0)
+        return category_store.reset_index(drop=True)
+
+    def result(self) -> Dict[str, pd.DataFrame]:
+        """The tables ``aggregates.build_aggregates`` returns."""
+        return {
+            "category": self.category_aggregates(),
+            "category_store": self.category_store_aggregates(),
+        }
+
+
+def stream_aggregates(
+    chunks: Iterator[pd.DataFrame], **kwargs
+) -> Dict[str, pd.DataFrame]:
+    """Aggregate the chunks in one pass, see ``StreamingAggregates``."""
+    aggregates = StreamingAggregates(**kwargs)
+    for chunk in chunks:
+        aggregates.update(chunk)
+    logging.info("Aggregated %d rows", aggregates.rows)
+    return aggregates.result()
+
+
+def relative_errors(
+    streamed: Dict[str, pd.DataFrame], exact: Dict[str, pd.DataFrame]
+) -> pd.Series:
+    """The largest relative error of each streamed metric against the exact one."""
+    errors = {}
+    category = streamed["category"]
+    expected = exact["category"].reindex(category.index)
+    for col in category.columns:
+        scale = expected[col].abs().where(expected[col] != 0)
+        errors[col] = ((category[col] - expected[col]).abs() / scale).max()
+
+    keys = store_keys
+    shares = streamed["category_store"].set_index(keys)["sales_share"]
+    shares = shares.drop(OTHER_STORES, level=STORE_COLUMN, errors="ignore")
+    expected = exact["category_store"].set_index(keys)["sales_share"]
+    # Shares are fractions already, so their error is absolute
+    errors["sales_share (absolute)"] = (
+        (shares - expected.reindex(shares.index)).abs().max()
+    )
+    return pd.Series(errors).fillna(0.0)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=SOURCES, default="store")
+    parser.add_argument("--data-folder", default=data_folder)
+    parser.add_argument("--output-folder", default=output_folder)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--store-capacity", type=int, default=STORE_CAPACITY)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Also build the exact aggregates in memory and print the errors.",
+    )
+    parser.add_argument(
+        "--write", action="store_true", help="Replace the aggregates in the output."
+    )
+    args = parser.parse_args(argv)
+
+    if args.source == "exports":
+        chunks = export_chunks(args.data_folder, args.chunk_rows)
+    elif args.source == "csv":
+        chunks = csv_chunks(args.output_folder, args.chunk_rows)
+    else:
+        chunks = store_chunks(args.output_folder, args.chunk_rows)
+    # tracemalloc slows the pass down about threefold, the time is only a guide
+    tracemalloc.start()
+    start = time.perf_counter()
+    streamed = stream_aggregates(chunks, store_capacity=args.store_capacity)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logging.info("Streamed in %.2fs, peak memory %.1f MB", seconds, peak / 2**20)
+
+    if args.check:
+        exact = build_aggregates(
+            load_product_data(source_columns, output_folder=args.output_folder)
+        )
+        print(relative_errors(streamed, exact).to_string(float_format="{:.4%}".format))
+    if args.write:
+        write_aggregates(streamed, args.output_folder)
+        digest = hashlib.sha256()
+        for table in streamed.values():
+            digest.update(pd.util.hash_pandas_object(table).to_numpy().tobytes())
+        publish_dataset_version(args.output_folder, digest.hexdigest())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,349 +1,38 @@
-import streamlit as st
-
-import glob
-import io
-import logging
-import random
-import os
-import time
-from typing import Dict, List
-
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-import requests
-import seaborn
-from IPython.display import HTML, Image, display
-from PIL import Image
-from plotly.io import to_image
-from plotly.offline import plot
-from plotly.subplots import make_subplots
-from tenacity import retry, stop_after_attempt, wait_fixed, wait_random
-from tqdm import tqdm
-import os
-
-current_file_path = os.path.abspath(__file__)
-current_directory = os.path.dirname(current_file_path)
-data_folder = os.path.join(current_directory, "../data/products/")
-output_folder = os.path.join(current_directory, "../output/")
-
-# Load the data
-all_product_data = pd.read_csv(os.path.join(output_folder, "all_product_data.csv"))
-
-
-def to_html(fig, file_name: str):
-    """Save a Plotly figure to an HTML file."""
-    plot(fig, filename=file_name)
-
-
-def format_col_for_title(col: str) -> str:
-    """Format a column name for a title."""
-    return " ".join(col.split("_")).title()
-
-
-def plot_bar_chart_plotly(
-    data, x, y, sorted=True, title=None, x_label=None, y_label=None
-):
-    if sorted:
-        data = data.sort_values(by=y, ascending=False)
-    fig = go.Figure(
-        go.Bar(
-            x=data[x],
-            y=data[y],
-            name=format_col_for_title(y),
-            text=data[y],
-            textposition="auto",
-        )
-    )
-    fig.update_layout(
-        title=f"Bar Chart of {format_col_for_title(y)} by {format_col_for_title(x)}",
-        xaxis_title=format_col_for_title(x) if x_label is None else x_label,
-        yaxis_title=format_col_for_title(y) if y_label is None else y_label,
-        template="simple_white",
-    )
-    if title:
-        fig.update_layout(title=title)
-
-    fig.update_traces(texttemplate="%{text:.2f}")
-    return fig
-
-
-def plot_bar_chart_plotly_with_dropdown(
-    data_list, x, y, labels, sorted=True, title=None, x_label=None, y_label=None
-):
-    traces = []
-    for data, label in zip(data_list, labels):
-        if sorted:
-            data = data.sort_values(by=y, ascending=False)
-        trace = go.Bar(
-            x=data[x],
-            y=data[y],
-            name=label,
-            text=data[y],
-            textposition="auto",
-            visible=True if label == labels[0] else False,
-        )
-        traces.append(trace)
-
-    fig = go.Figure(data=traces)
-
-    # Add the dropdown menu
-    fig.update_layout(
-        updatemenus=[
-            dict(
-                buttons=[
-                    dict(
-                        args=[{"visible": [label == selected for label in labels]}],
-                        label=selected,
-                        method="update",
-                    )
-                    for selected in labels
-                ],
-                direction="down",
-                pad={"r": 2, "t": 12},
-                showactive=True,
-                x=0,
-                xanchor="left",
-                y=1.3,
-                yanchor="top",
-            )
-        ]
-    )
-
-    fig.update_layout(
-        title=(
-            f"Bar Chart of {format_col_for_title(y)} by {format_col_for_title(x)}"
-            if title is None
-            else title
-        ),
-        xaxis_title=format_col_for_title(x) if x_label is None else x_label,
-        yaxis_title=format_col_for_title(y) if y_label is None else y_label,
-        template="simple_white",
-    )
-
-    fig.update_traces(texttemplate="%{text:.2f}")
-
-    return fig
-
-
-def plot_median_price_by_product(data):
-    fig = plot_bar_chart_plotly(
-        data.groupby("product_name_chinese_name")
-        .agg({"price": "median"})
-        .reset_index(),
-        x="product_name_chinese_name",
-        y="price",
-        title="Median Price by Product （产品价格中位数）",
-        x_label="Product Name",
-        y_label="Median Price ($)",
-    )
-    return fig
-
-
-def plot_unique_products(all_product_data):
-    data_list = [
-        all_product_data.groupby("product_name_chinese_name")["Product URL"]
-        .nunique()
-        .reset_index(),
-        all_product_data[all_product_data["has_sales"] == True]
-        .groupby("product_name_chinese_name")["Product URL"]
-        .nunique()
-        .reset_index(),
-    ]
-
-    fig = plot_bar_chart_plotly_with_dropdown(
-        data_list,
-        labels=["All Products", "Products with Sales"],
-        x="product_name_chinese_name",
-        y="Product URL",
-        title="Number of Unique Products （产品数目）",
-        x_label="Product Name",
-        y_label="Number of Unique Products",
-    )
-    return fig
-
-
-def plot_percentage_of_products_with_sales(all_product_data):
-    fig = plot_bar_chart_plotly(
-        all_product_data.groupby("product_name_chinese_name")["has_sales"]
-        .mean()
-        .reset_index(),
-        x="product_name_chinese_name",
-        y="has_sales",
-        title="Percentage of Products with Sales （有销售量的产品的百分比）",
-        x_label="Product Name",
-        y_label="Percentage of Products with Sales (%)",
-    )
-    return fig
-
-
-def plot_total_sales_by_product(data):
-    fig = plot_bar_chart_plotly(
-        data.groupby("product_name_chinese_name")["Total Sales"].sum().reset_index(),
-        x="product_name_chinese_name",
-        y="Total Sales",
-        title="Total Sales by Product（产品总销售量）",
-        x_label="Product Name",
-        y_label="Total Sales",
-    )
-    return fig
-
-
-def generate_median_sales_figure(all_product_data):
-    data_list = [
-        all_product_data.groupby("product_name_chinese_name")["Total Sales"]
-        .median()
-        .reset_index(),
-        all_product_data[all_product_data["has_sales"] == True]
-        .groupby("product_name_chinese_name")["Total Sales"]
-        .median()
-        .reset_index(),
-    ]
-
-    # Median total sales by product
-    fig = plot_bar_chart_plotly_with_dropdown(
-        data_list,
-        labels=["All Products", "Products with Sales"],
-        x="product_name_chinese_name",
-        y="Total Sales",
-        title="Median Total Sales by Product（产品平均销售量）",
-        x_label="Product Name",
-        y_label="Median Total Sales",
-    )
-    return fig
-
-
-def plot_total_revenue_by_product(all_product_data):
-    data_list = [
-        all_product_data.groupby("product_name_chinese_name")["proceeds"]
-        .sum()
-        .reset_index()
-    ]
-
-    fig = plot_bar_chart_plotly(
-        data_list[0],
-        x="product_name_chinese_name",
-        y="proceeds",
-        title="Total Revenue by Product（产品总销售额）",
-        x_label="Product Name",
-        y_label="Total Revenue",
-    )
+"""Streamlit slides of the Etsy product research.
 
-    return fig
-
-
-def generate_median_revenue_figure(all_product_data):
-    data_list = [
-        all_product_data.groupby("product_name_chinese_name")["proceeds"]
-        .median()
-        .reset_index(),
-        all_product_data[all_product_data["has_sales"] == True]
-        .groupby("product_name_chinese_name")["proceeds"]
-        .median()
-        .reset_index(),
-    ]
-
-    labels = ["All Products", "Products with Sales"]
-
-    fig = plot_bar_chart_plotly_with_dropdown(
-        data_list=data_list,
-        x="product_name_chinese_name",
-        y="proceeds",
-        labels=labels,
-        title="Median Revenue by Product（产品销售额中位数）",
-        x_label="Product Name",
-        y_label="Median Revenue ($)",
-    )
-    return fig
-
-
-def plot_heatmap_plotly(
-    data,
-    x,
-    y,
-    z,
-    title=None,
-    x_label=None,
-    y_label=None,
-    log_scale=False,
-    colorbar_title=None,
-):
-    if log_scale:
-        data[z] = np.log(data[z] + 1)
-    fig = go.Figure(
-        data=go.Heatmap(
-            x=data[x],
-            y=data[y],
-            z=data[z],
-            colorscale="blues_r",
-            hoverongaps=False,
-            colorbar_title=colorbar_title,
-        )
-    )
+Only the selected slide runs on each rerun. Data comes from the cached
+loaders in ``dashboard_data.py`` and figures from ``figures.py``, both
+imported by the slides that need them, so starting the app does not pay for
+plotting or index loading. Built figures are shared by all sessions until
+ingest publishes a new dataset version. Set ``TRACE_FILE`` to record the time of every
+slide, data load and figure (see ``tracing.py``).
 
-    fig.update_layout(
-        title=title,
-        xaxis_title=x_label,
-        yaxis_title=y_label,
-        template="plotly_dark",
-        width=1000,
-        height=1000,
-    )
+    $ streamlit run streamlitapp.py
+"""
 
-    return fig
+import os
+import time
 
+import streamlit as st
 
-def calculate_sales_heatmap(all_product_data):
-    product_store_sales = (
-        all_product_data[all_product_data["has_sales"] == True]
-        .groupby(["product_name_chinese_name", "Store Name"])["Total Sales"]
-        .sum()
-        .reset_index()
-    )
+import dashboard_data
+import tracing
 
-    # Calculate the total sales for each product
-    product_total_revenue = (
-        all_product_data[all_product_data["has_sales"] == True]
-        .groupby("product_name_chinese_name")["Total Sales"]
-        .sum()
-    )
+current_file_path = os.path.abspath(__file__)
+current_directory = os.path.dirname(current_file_path)
 
-    # Calculate the percentage of total sales for each product in each store
-    product_store_sales["Percentage of Total Sales"] = product_store_sales.apply(
-        lambda row: row["Total Sales"]
-        / product_total_revenue[row["product_name_chinese_name"]],
-        axis=1,
-    )
 
-    # Create the heatmap
-    fig = plot_heatmap_plotly(
-        data=product_store_sales,
-        x="product_name_chinese_name",
-        y="Store Name",
-        z="Percentage of Total Sales",
-        title="Percentage of Total Sales by Product and Store (With Sales)",
-        x_label="Product Name",
-        y_label="Store Name",
-        colorbar_title="%",
+def show_figure(build, *args, **kwargs):
+    """Render a figure, built once for all sessions (see dashboard_data.py)."""
+    fig = dashboard_data.figure_cache.get(
+        dashboard_data.dataset_version(), build, *args, **kwargs
     )
-
-    return fig
+    # Includes serializing the figure to JSON for the browser
+    with tracing.span("plotly_chart", figure=build.__name__):
+        st.plotly_chart(fig)
 
 
-# Navigation via sidebar for a more slide-show feel
-slide = st.sidebar.selectbox(
-    "Go to Slide",
-    [
-        "Intro",
-        "Overview of Search Results",
-        "Product Pricing",
-        "Product Sales",
-        "Product Revenue",
-        "Competitor Analysis",
-    ],
-)
-if slide == "Intro":
+def intro_slide():
     st.header("Etsy Product Research")
     st.image(
         "https://cdn.shopify.com/s/files/1/0643/9262/6408/files/image1_7be85aec-6deb-413b-ba96-c23fa38dec3e.png?v=1701654032"
@@ -370,9 +59,13 @@ if slide == "Intro":
         """
     )
 
-elif slide == "Overview of Search Results":
+
+def overview_slide():
+    from figures import plot_unique_products
+
+    cube = dashboard_data.load_cube()
     st.header("Overview of Search Results")
-    st.plotly_chart(plot_unique_products(all_product_data))
+    show_figure(plot_unique_products, cube)
     # Let's add some bullet points
     st.markdown(
         """
@@ -381,12 +74,28 @@ elif slide == "Overview of Search Results":
         ## Top 10 products for each category
         """
     )
-    st.image(os.path.join(current_directory, "top_products_1.png"))
-    st.image(os.path.join(current_directory, "top_products_2.png"))
+    collages = dashboard_data.load_collages()
+    if collages is None:
+        # Run thumbnails.py to build the collages from the current scrape
+        st.image(os.path.join(current_directory, "top_products_1.png"))
+        st.image(os.path.join(current_directory, "top_products_2.png"))
+    elif not collages:
+        st.info(
+            "No listing in the scrape has an image URL: the exports only have "
+            "the \"Upgrade Pro to Unlock\" placeholder, so there are no top "
+            "products to show."
+        )
+    for category, path in (collages or {}).items():
+        st.markdown(f"**{category}**")
+        st.image(path)
+
+
+def pricing_slide():
+    from figures import plot_median_price_by_product
 
-elif slide == "Product Pricing":
+    cube = dashboard_data.load_cube()
     st.header("Evaluating Product Pricing")
-    st.plotly_chart(plot_median_price_by_product(all_product_data))
+    show_figure(plot_median_price_by_product, cube)
     st.markdown(
         """
             - We can see that the price of products varies significantly between categories.
@@ -394,7 +103,15 @@ elif slide == "Product Pricing":
         """
     )
 
-elif slide == "Product Sales":
+
+def sales_slide():
+    from figures import (
+        generate_median_sales_figure,
+        plot_percentage_of_products_with_sales,
+        plot_total_sales_by_product,
+    )
+
+    cube = dashboard_data.load_cube()
     st.header("Product Sales")
     st.markdown(
         """
@@ -402,9 +119,9 @@ elif slide == "Product Sales":
         - It is important to consider that the number of search results for each product varies, so we also calculate the median sales.
         """
     )
-    st.plotly_chart(plot_total_sales_by_product(all_product_data))
-    st.plotly_chart(generate_median_sales_figure(all_product_data))
-    st.plotly_chart(plot_percentage_of_products_with_sales(all_product_data))
+    show_figure(plot_total_sales_by_product, cube)
+    show_figure(generate_median_sales_figure, cube)
+    show_figure(plot_percentage_of_products_with_sales, cube)
     st.markdown(
         """
         - Items with a high percentage of sales (over 50%) may be worth exploring further.
@@ -413,7 +130,10 @@ elif slide == "Product Sales":
     )
 
 
-elif slide == "Product Revenue":
+def revenue_slide():
+    from figures import generate_median_revenue_figure, plot_total_revenue_by_product
+
+    cube = dashboard_data.load_cube()
     st.header("Product Revenue")
     st.markdown(
         """
@@ -422,8 +142,8 @@ elif slide == "Product Revenue":
         - Therefore, it is important to also consider the median revenue, which is less affected by the number of search results.
         """
     )
-    st.plotly_chart(plot_total_revenue_by_product(all_product_data))
-    st.plotly_chart(generate_median_revenue_figure(all_product_data))
+    show_figure(plot_total_revenue_by_product, cube)
+    show_figure(generate_median_revenue_figure, cube)
 
     st.markdown(
         """
@@ -433,12 +153,245 @@ elif slide == "Product Revenue":
         """
     )
 
-elif slide == "Competitor Analysis":
+
+def competitor_slide():
+    from figures import calculate_sales_heatmap
+
+    cube = dashboard_data.load_cube()
     st.header("Competitor Analysis")
     st.markdown(
         """
         - We can also analyze the percentage of total sales for each product in each store. This can help us identify which stores are selling the most of each product.
         - In this plot, we show the percentage of product sold in each store for products that have sales.
+        - Only the leading stores of each product are shown, the remaining stores are grouped as "Other".
+        - The Store Profiles slide drills into any of these stores.
+        """
+    )
+    cutoff = st.radio(
+        "Stores shown per product", ["Top K", "Cumulative share"], horizontal=True
+    )
+    if cutoff == "Top K":
+        top_k = st.slider("Number of stores per product", 1, 50, 10)
+        cumulative_share = None
+    else:
+        top_k = None
+        cumulative_share = st.slider("Share of product sales", 0.1, 1.0, 0.8, 0.05)
+    show_figure(
+        calculate_sales_heatmap, cube, top_k=top_k, cumulative_share=cumulative_share
+    )
+
+
+def store_profile_slide():
+    from aggregates import STORE_COLUMN
+    from figures import format_col_for_title, plot_bar_chart_plotly
+    from store_index import metrics
+
+    st.header("Store Profiles")
+    st.markdown(
+        """
+        - The competitor heatmap shows which stores lead each product. Here we look at the stores themselves: how many listings they have, what they sell, at which prices and how well.
+        - Each listing is counted once per store, even when it was found for several products.
+        - With a product selected, stores are ranked by their listings of that product only.
+        """
+    )
+    stores = dashboard_data.load_stores()
+    category = st.selectbox("Product", ["All"] + stores.product_names)
+    product_name = None if category == "All" else category
+    metric = st.selectbox("Rank stores by", metrics, format_func=format_col_for_title)
+    top_k = st.slider("Number of stores", 5, 50, 20)
+
+    top_stores = stores.top(metric, top_k, product_name)
+    show_figure(
+        plot_bar_chart_plotly,
+        top_stores[[STORE_COLUMN, metric]],
+        STORE_COLUMN,
+        metric,
+        title=f"Top Stores by {format_col_for_title(metric)} ({category})",
+        x_label="Store",
+    )
+    st.dataframe(top_stores, hide_index=True)
+
+    if len(top_stores):
+        store = st.selectbox("Store", top_stores[STORE_COLUMN])
+        profile = stores.profile(store)
+        columns = st.columns(4)
+        columns[0].metric("Listings", int(profile["listings"]))
+        columns[1].metric("Total sales", int(profile["total_sales"]))
+        columns[2].metric("7-day sales", int(profile["sales_7d"]))
+        columns[3].metric("Revenue", f"${profile['proceeds']:,.0f}")
+        columns = st.columns(4)
+        columns[0].metric("Median price", f"${profile['median_price']:,.2f}")
+        columns[1].metric(
+            "Price range (p25-p75)",
+            f"${profile['price_p25']:,.2f}-{profile['price_p75']:,.2f}",
+        )
+        columns[2].metric(
+            "Best Seller / Etsy Pick / Raving",
+            f"{profile['best_sellers']} / {profile['etsy_picks']} / {profile['raving']}",
+        )
+        ship_from = profile["ship_from"]
+        columns[3].metric(
+            "Ships from", ship_from if isinstance(ship_from, str) else "Unknown"
+        )
+        st.write("Products: " + ", ".join(profile["product_names"]))
+        st.dataframe(
+            stores.listings(store).drop(columns=[STORE_COLUMN]),
+            hide_index=True,
+            column_config={"Product URL": st.column_config.LinkColumn()},
+        )
+
+
+def opportunity_slide():
+    from aggregates import CATEGORY_COLUMN
+    from figures import plot_bar_chart_plotly
+    from opportunity import default_weights, features, min_listings
+
+    st.header("Opportunity Scores")
+    st.markdown(
+        """
+        - Instead of reading each metric off its own chart, we rank products and search terms by all of them at once.
+        - Demand: the share of listings with sales, the median revenue and the median price. Competition: the number of listings and how concentrated the sales are in a few stores.
+        - Each metric is turned into a percentile, and the score is their weighted average. Move the sliders to weigh them differently.
+        - A search term's share of listings with sales and its medians are pulled toward its product's, the more the fewer listings it has, so a term with one lucky listing does not come out on top.
         """
     )
-    st.plotly_chart(calculate_sales_heatmap(all_product_data))
+    scores = dashboard_data.load_opportunities()
+    level = st.radio("Rank", ["Products", "Search terms"], horizontal=True)
+    key = "category" if level == "Products" else "term"
+    table = scores[key]
+    group = None
+    if level == "Search terms":
+        product = st.selectbox("Product", ["All"] + sorted(set(table.groups)))
+        group = None if product == "All" else product
+
+    weights = {}
+    columns = st.columns(len(features))
+    for column, (name, (description, _)) in zip(columns, features.items()):
+        with column:
+            weights[name] = st.slider(
+                description, 0.0, 1.0, default_weights[name], 0.05
+            )
+    min_sales_rate = st.slider(
+        "Minimum share of listings with sales", 0.0, 1.0, 0.0, 0.05
+    )
+    minimum = st.number_input("Minimum listings", 0, value=min_listings[key])
+    top_k = st.slider("Number shown", 5, 50, 15)
+
+    ranked = table.rank(weights, top_k, min_sales_rate, minimum, group)
+    label = CATEGORY_COLUMN if level == "Products" else "search_term"
+    show_figure(
+        plot_bar_chart_plotly,
+        ranked,
+        label,
+        "score",
+        title=f"Opportunity Score of {level}",
+        x_label=level,
+        y_label="Score",
+    )
+    st.dataframe(ranked, hide_index=True)
+
+
+def tag_demand_slide():
+    from figures import format_col_for_title, plot_bar_chart_plotly
+    from tag_index import LISTINGS_WEIGHT
+
+    st.header("Tag Demand")
+    st.markdown(
+        """
+        - Sellers tag listings with the searches they want to rank for, so the tags of the best selling listings point at what buyers look for.
+        - Tags are compared case-insensitively.
+        """
+    )
+    tags, listings = dashboard_data.load_tags()
+    categories = ["All"] + sorted(tags.categories.cat.categories)
+    category = st.selectbox("Product", categories)
+    product_name = None if category == "All" else category
+    weight = st.radio(
+        "Rank tags by", ["Total Sales", "proceeds", LISTINGS_WEIGHT], horizontal=True
+    )
+    top_k = st.slider("Number of tags", 5, 50, 20)
+
+    top_tags = tags.top_tags(product_name, weight=weight, k=top_k)
+    show_figure(
+        plot_bar_chart_plotly,
+        top_tags,
+        "tag",
+        weight,
+        title=f"Top Tags by {format_col_for_title(weight)} ({category})",
+        x_label="Tag",
+    )
+
+    if len(top_tags):
+        tag = st.selectbox("Tags used together with", top_tags["tag"])
+        show_figure(
+            plot_bar_chart_plotly,
+            tags.co_occurring(tag, product_name, weight=weight, k=top_k),
+            "tag",
+            weight,
+            title=f"Tags Used Together with '{tag}' by {format_col_for_title(weight)}",
+            x_label="Tag",
+        )
+
+    selected = st.multiselect(
+        "Listings with all of these tags", tags.labels, default=top_tags["tag"][:2]
+    )
+    if selected:
+        matches = tags.match_all(selected, product_name)[["listing_id", "product_name"]]
+        matches = matches.merge(listings, on="listing_id", how="left")
+        st.write(f"{len(matches)} listings")
+        st.dataframe(
+            matches.sort_values("Total Sales", ascending=False),
+            hide_index=True,
+            column_config={"Product URL": st.column_config.LinkColumn()},
+        )
+
+
+def search_slide():
+    st.header("Search Listings")
+    search = dashboard_data.load_search()
+    if not search.segments:
+        st.info("No search index yet, run ingest.py to build it.")
+        return
+    query = st.text_input("Search titles, tags and stores", "jade bangle")
+    product_names = st.multiselect("Products", sorted(search.segments))
+    max_listing_price = max(float(s.prices.max()) for s in search.segments.values())
+    min_price, max_price = st.slider(
+        "Price ($)", 0.0, max_listing_price, (0.0, max_listing_price)
+    )
+    only_with_sales = st.checkbox("Only listings with sales")
+
+    start = time.perf_counter()
+    with tracing.span("search_listings"):
+        results = search.search(
+            query,
+            product_names=product_names or None,
+            min_price=min_price,
+            max_price=max_price,
+            has_sales=True if only_with_sales else None,
+        )
+    elapsed = time.perf_counter() - start
+    st.write(f"{len(results)} listings in {elapsed * 1000:.0f} ms")
+    st.dataframe(
+        results,
+        hide_index=True,
+        column_config={"Product URL": st.column_config.LinkColumn()},
+    )
+
+
+slides = {
+    "Intro": intro_slide,
+    "Overview of Search Results": overview_slide,
+    "Product Pricing": pricing_slide,
+    "Product Sales": sales_slide,
+    "Product Revenue": revenue_slide,
+    "Competitor Analysis": competitor_slide,
+    "Store Profiles": store_profile_slide,
+    "Opportunity Scores": opportunity_slide,
+    "Tag Demand": tag_demand_slide,
+    "Search Listings": search_slide,
+}
+
+# Navigation via sidebar for a more slide-show feel
+slide = st.sidebar.selectbox("Go to Slide", list(slides))
+with tracing.span("slide", slide=slide):
+    slides[slide]()
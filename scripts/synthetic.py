@@ -0,0 +1,208 @@
+"""Synthetic product tables for benchmarking.
+
+``generate_product_data`` returns a frame with the columns and types of the
+product table that ingest builds. The distributions follow the real scrape:
+
+- about half the listings have sales, and those that do have heavy-tailed
+  (log-normal) Total Sales;
+- the number of stores grows with the rows, and a few stores hold most of
+  the listings (Zipf);
+- each listing has around 15 tags drawn from a Zipf-weighted vocabulary, and
+  the title is built from its first tags;
+- like the real exports, ``Image URL`` is the "Upgrade Pro to Unlock"
+  placeholder. The real exports have no image URL at all, so with an
+  ``image_base_url`` a made-up share of the listings point to the images
+  served by mock_etsyhunt.py instead, to exercise thumbnails.py.
+
+To write a product store at 10x the current scrape:
+    $ python synthetic.py --rows 35780 --output-folder /tmp/synthetic
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ingest import chinese_translations
+from product_store import write_product_store
+
+logging.basicConfig(level=logging.INFO)
+
+# Rows of the real scrape, benchmarks scale from it
+BASE_ROWS = 3578
+STORES_PER_ROW = 0.3
+MEAN_TAGS = 15
+# Share of the listings given a mock image URL with an image_base_url. Not
+# taken from the real exports: their Image URL is the placeholder (92.4% of
+# the 3578 rows) or empty (7.6%), never a URL
+IMAGE_SHARE = 0.08
+PLACEHOLDER = "Upgrade Pro to Unlock"
+
+tag_words = (
+    "chinese calligraphy jade bamboo silk lantern red gold vintage handmade custom "
+    "name seal stamp art print wall decor gift tea incense pottery ceramic bead "
+    "bracelet necklace magnet washi tape sticker bookmark brush ink paper moon "
+    "festival dragon lucky zen asian"
+).split()
+
+categories = [
+    "Craft Supplies & Tools",
+    "Art & Collectibles > Prints > Digital Prints",
+    "Art & Collectibles > Painting > Ink",
+    "Home & Living > Home Decor > Wall Decor",
+    "Jewelry > Bracelets > Beaded Bracelets",
+    "Paper & Party Supplies > Paper > Stickers",
+]
+ship_from = {
+    "United States": 0.61,
+    "China": 0.08,
+    "British": 0.05,
+    "Canada": 0.04,
+    "Japan": 0.04,
+    "Taiwan": 0.03,
+    "Germany": 0.03,
+    "France": 0.02,
+    "Vietnam": 0.02,
+    "Australia": 0.08,
+}
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    """Probabilities of ``n`` ranks falling off as ``rank ** -exponent``."""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    return weights / weights.sum()
+
+
+def tag_vocabulary(n_tags: int, rng: np.random.Generator) -> np.ndarray:
+    """``n_tags`` distinct two- and three-word tags."""
+    words = np.array(tag_words)
+    tags = np.array([], dtype=object)
+    while len(tags) < n_tags:
+        length = rng.integers(2, 4, size=n_tags)
+        picks = rng.choice(words, size=(n_tags, 3))
+        candidates = [" ".join(pick[:k]) for pick, k in zip(picks, length)]
+        tags = pd.unique(np.concatenate([tags, candidates]))
+    return tags[:n_tags]
+
+
+def generate_tags(n_rows: int, rng: np.random.Generator) -> pa.ListArray:
+    """A list of tags per row, with a vocabulary that grows with the rows."""
+    vocabulary = tag_vocabulary(max(500, int(np.sqrt(n_rows) * 40)), rng)
+    counts = np.clip(rng.normal(MEAN_TAGS, 6.5, n_rows).round(), 0, 40)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    ids = rng.choice(len(vocabulary), size=offsets[-1], p=zipf_weights(len(vocabulary)))
+    return pa.LargeListArray.from_arrays(
+        pa.array(offsets), pa.array(vocabulary).take(pa.array(ids))
+    )
+
+
+def generate_product_data(
+    n_rows: int = BASE_ROWS, seed: int = 0, image_base_url: Optional[str] = None
+) -> pd.DataFrame:
+    """Generate a product table of ``n_rows`` listings, see the module docstring."""
+    rng = np.random.default_rng(seed)
+    product_names = np.array(list(chinese_translations))
+    product_name = rng.choice(
+        product_names, size=n_rows, p=rng.dirichlet(np.full(len(product_names), 4))
+    )
+
+    n_stores = max(1, int(n_rows * STORES_PER_ROW))
+    store_ids = rng.choice(n_stores, size=n_rows, p=zipf_weights(n_stores, 0.8))
+    store_name = pd.Series(store_ids).map("Store{:07d}".format)
+
+    has_sales = rng.random(n_rows) < 0.48
+    total_sales = np.where(
+        has_sales,
+        np.ceil(rng.lognormal(1.2, 1.6, n_rows)).clip(1, 100_000),
+        0,
+    ).astype(np.int64)
+    price = rng.lognormal(np.log(30), 1.0, n_rows).clip(0.18, 20_000).round(2)
+
+    tags = generate_tags(n_rows, rng)
+    title = pc.binary_join(pc.list_slice(tags, 0, 4), " ").to_pandas().str.title()
+    listing_id = (
+        100_000_000 + rng.permutation(n_rows) * 397 + rng.integers(0, 397, n_rows)
+    )
+    slug = title.str.lower().str.replace(" ", "-")
+    product_url = (
+        "https://www.etsy.com/listing/" + pd.Series(listing_id).astype(str) + "/" + slug
+    )
+    release_time = pd.Series(
+        pd.to_datetime("2015-01-01")
+        + pd.to_timedelta(rng.integers(0, 3200, n_rows), unit="D")
+    ).where(rng.random(n_rows) > 0.4)
+    favorites = np.round(total_sales * rng.lognormal(0.5, 1.0, n_rows)).astype(np.int64)
+    favorites += rng.poisson(2, n_rows)
+    reviews = rng.binomial(total_sales, 0.3)
+
+    df = pd.DataFrame(
+        {
+            "Title": title,
+            "Category": rng.choice(categories, size=n_rows),
+            'Price("$")': pd.Series(price).map("{:g}".format),
+            "7-day sales": rng.binomial(total_sales, 0.02),
+            "Total Sales": total_sales,
+            "Total Reviews": reviews,
+            "7-day Reviews": rng.binomial(reviews, 0.02),
+            "Total Favorites": favorites,
+            "7-day Favorites": rng.binomial(favorites, 0.02),
+            "Tags": tags.to_pylist(),
+            "Ship From": rng.choice(
+                list(ship_from), size=n_rows, p=list(ship_from.values())
+            ),
+            "Release Time": release_time,
+            "Best Seller": rng.random(n_rows) < 0.001,
+            "Etsy Pick": rng.random(n_rows) < 0.006,
+            "Raving": np.zeros(n_rows, dtype=bool),
+            "Store Name": store_name,
+            "Product URL": product_url,
+            "Image URL": PLACEHOLDER,
+            "search_term": pd.Series(product_name) + rng.choice(["", " gift"], n_rows),
+            "product_name": product_name,
+            "listing_id": listing_id,
+            "price": price,
+            "proceeds": price * total_sales,
+            "has_sales": total_sales > 0,
+        }
+    )
+    df["product_name_chinese_name"] = (
+        df["product_name"] + " (" + df["product_name"].map(chinese_translations) + ")"
+    )
+    df["true_magnet"] = (df["product_name"] == "chinese magnets") & df[
+        "Product URL"
+    ].str.contains("magnet")
+    if image_base_url:
+        unlocked = rng.random(n_rows) < IMAGE_SHARE
+        df.loc[unlocked, "Image URL"] = (
+            image_base_url.rstrip("/")
+            + "/images/"
+            + df.loc[unlocked, "listing_id"].astype(str)
+            + ".jpg"
+        )
+    return df
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=BASE_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-folder", required=True)
+    parser.add_argument(
+        "--image-base-url",
+        help="Server of the listing images, e.g. the mock at http://localhost:8000.",
+    )
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_folder, exist_ok=True)
+    df = generate_product_data(args.rows, args.seed, args.image_base_url)
+    write_product_store(df, args.output_folder)
+    logging.info("Wrote %d synthetic listings to %s", len(df), args.output_folder)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,221 @@
+"""Inverted index from normalized tags to the listings that use them.
+
+Ingest builds the index from the product table: every row (a listing within a
+category) is a document, and each normalized tag has a posting list of the
+sorted document IDs using it. Posting lists are stored delta encoded in
+Parquet, with zstd on top.
+
+Loading decodes all posting lists into one flat array, so the queries are
+vectorized numpy over it instead of parsing tag lists per row:
+
+- ``top_tags``: the tags with the most sales, proceeds or listings, overall or
+  per category;
+- ``co_occurring``: the tags most often used together with a tag;
+- ``match_all``: the listings with all of several tags.
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from product_store import load_product_data, to_store_types
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+TAG_INDEX_FOLDER = "tag_index"
+LISTINGS_WEIGHT = "listings"
+
+# Per-document columns kept to filter and weight queries by
+document_columns = ["listing_id", "product_name", "Total Sales", "proceeds"]
+
+
+def normalize_tags(tags: pd.Series) -> pd.Series:
+    """Lowercase tags and collapse their whitespace."""
+    return tags.str.lower().str.split().str.join(" ")
+
+
+def build_tag_index(all_product_data: pd.DataFrame) -> dict:
+    """Build the documents and posting lists from a product table with tag lists."""
+    documents = all_product_data[document_columns].reset_index(drop=True)
+    tags = all_product_data["Tags"].reset_index(drop=True).explode()
+    tags = tags[tags.notna() & (tags.str.strip() != "")]
+    entries = pd.DataFrame(
+        {"doc": tags.index.to_numpy(np.uint32), "label": tags.to_numpy()}
+    )
+    entries["tag"] = normalize_tags(entries["label"])
+    # Show each tag as its most common spelling
+    labels = (
+        entries.groupby(["tag", "label"])
+        .size()
+        .sort_values(ascending=False)
+        .reset_index()
+    )
+    labels = labels.drop_duplicates("tag").set_index("tag")["label"]
+
+    entries = entries.drop_duplicates(["tag", "doc"]).sort_values(["tag", "doc"])
+    tag_codes, tag_names = pd.factorize(entries["tag"], sort=True)
+    docs = entries["doc"].to_numpy(np.int64)
+    # Delta encode each posting list: gaps between document IDs, starting over
+    # from the first ID at every new tag
+    first = np.flatnonzero(np.diff(tag_codes, prepend=-1))
+    gaps = np.diff(docs, prepend=0)
+    gaps[first] = docs[first]
+    offsets = np.append(first, len(docs)).astype(np.int32)
+    postings = pa.table(
+        {
+            "tag": pa.array(tag_names),
+            "label": pa.array(labels.loc[tag_names].to_numpy()),
+            "gaps": pa.ListArray.from_arrays(
+                pa.array(offsets), pa.array(gaps.astype(np.uint32))
+            ),
+        }
+    )
+    return {"documents": documents, "postings": postings}
+
+
+def write_tag_index(index: dict, output_folder: str):
+    """Persist the tag index as Parquet."""
+    folder = os.path.join(output_folder, TAG_INDEX_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    index["documents"].to_parquet(
+        os.path.join(folder, "documents.parquet"), compression="zstd", index=False
+    )
+    pq.write_table(
+        index["postings"],
+        os.path.join(folder, "postings.parquet"),
+        compression="zstd",
+    )
+
+
+class TagIndex:
+    """The decoded tag index, see the module docstring for the queries."""
+
+    def __init__(self, documents: pd.DataFrame, postings: pa.Table):
+        self.documents = documents
+        self.categories = documents["product_name"].astype("category")
+        self.tags = postings.column("tag").to_pandas()
+        self.labels = postings.column("label").to_pandas()
+        self._tag_ids = {tag: i for i, tag in enumerate(self.tags)}
+
+        gaps = postings.column("gaps").combine_chunks()
+        self.offsets = gaps.offsets.to_numpy().astype(np.int64)
+        self.offsets -= self.offsets[0]
+        # Undo the delta encoding of all lists at once: a global cumulative sum,
+        # minus the running total reached before each list started
+        flat = gaps.flatten().to_numpy().astype(np.int64)
+        totals = np.cumsum(flat)
+        before = np.concatenate([[0], totals])[self.offsets[:-1]]
+        lengths = np.diff(self.offsets)
+        self.docs = (totals - np.repeat(before, lengths)).astype(np.int32)
+        self.entry_tags = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+
+    def _tag_id(self, tag: str) -> Optional[int]:
+        return self._tag_ids.get(" ".join(tag.lower().split()))
+
+    def postings(self, tag: str) -> np.ndarray:
+        """The sorted document IDs of a tag, empty if it is unknown."""
+        tag_id = self._tag_id(tag)
+        if tag_id is None:
+            return np.array([], dtype=np.int32)
+        return self.docs[self.offsets[tag_id] : self.offsets[tag_id + 1]]
+
+    def _weights(self, weight: str) -> Optional[np.ndarray]:
+        if weight == LISTINGS_WEIGHT:
+            return None
+        return self.documents[weight].to_numpy(dtype=np.float64)
+
+    def _category_mask(self, product_name: Optional[str]) -> Optional[np.ndarray]:
+        if product_name is None:
+            return None
+        return (self.categories == product_name).to_numpy()
+
+    def _rank(self, entries: np.ndarray, weight: str, k: int) -> pd.DataFrame:
+        docs = self.docs[entries]
+        tags = self.entry_tags[entries]
+        weights = self._weights(weight)
+        totals = np.bincount(
+            tags,
+            weights=None if weights is None else weights[docs],
+            minlength=len(self.tags),
+        )
+        counts = np.bincount(tags, minlength=len(self.tags))
+        top = np.argsort(-totals, kind="stable")[:k]
+        top = top[totals[top] > 0]
+        return pd.DataFrame(
+            {
+                "tag": self.labels.to_numpy()[top],
+                weight: totals[top],
+                LISTINGS_WEIGHT: counts[top],
+            }
+        )
+
+    def top_tags(
+        self,
+        product_name: Optional[str] = None,
+        weight: str = "Total Sales",
+        k: int = 20,
+    ) -> pd.DataFrame:
+        """The k tags with the highest total weight, optionally in one category.
+
+        ``weight`` is a document column (``Total Sales`` or ``proceeds``), or
+        ``listings`` to count listings.
+        """
+        mask = self._category_mask(product_name)
+        entries = (
+            np.arange(len(self.docs))
+            if mask is None
+            else np.flatnonzero(mask[self.docs])
+        )
+        return self._rank(entries, weight, k)
+
+    def co_occurring(
+        self,
+        tag: str,
+        product_name: Optional[str] = None,
+        weight: str = LISTINGS_WEIGHT,
+        k: int = 20,
+    ) -> pd.DataFrame:
+        """The k tags used most together with ``tag``, weighted like ``top_tags``."""
+        selected = np.zeros(len(self.documents), dtype=bool)
+        selected[self.postings(tag)] = True
+        category = self._category_mask(product_name)
+        if category is not None:
+            selected &= category
+        entries = np.flatnonzero(selected[self.docs])
+        entries = entries[self.entry_tags[entries] != self._tag_id(tag)]
+        return self._rank(entries, weight, k)
+
+    def match_all(
+        self, tags: List[str], product_name: Optional[str] = None
+    ) -> pd.DataFrame:
+        """The documents having every one of ``tags``."""
+        postings = sorted((self.postings(tag) for tag in tags), key=len)
+        if not postings:
+            return self.documents.iloc[:0]
+        docs = postings[0]
+        # Intersect from the shortest list, so every step is at most that long
+        for other in postings[1:]:
+            docs = np.intersect1d(docs, other, assume_unique=True)
+        matches = self.documents.iloc[docs]
+        if product_name is not None:
+            matches = matches[matches["product_name"] == product_name]
+        return matches
+
+
+def load_tag_index(output_folder: str = output_folder) -> TagIndex:
+    """Load and decode the tag index, building it from the product table if missing."""
+    folder = os.path.join(output_folder, TAG_INDEX_FOLDER)
+    if not os.path.exists(folder):
+        logging.warning("No tag index found, building it from the product table")
+        df = to_store_types(load_product_data(output_folder=output_folder))
+        return TagIndex(**build_tag_index(df))
+    return TagIndex(
+        pd.read_parquet(os.path.join(folder, "documents.parquet")),
+        pq.read_table(os.path.join(folder, "postings.parquet")),
+    )
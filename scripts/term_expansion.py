@@ -0,0 +1,227 @@
+"""Expand a seed category into synonymous EtsyHunt search terms.
+
+Expansions are cached on disk, keyed by the normalized seed and the prompt
+version, and expire after a TTL. Seeds missing from the cache are expanded
+together in a single chat-completion request. Without an OpenAI key (or with
+TERM_EXPANDER=offline) terms are picked from the search_term vocabulary of
+all_product_data.csv instead, so reruns and tests need no network.
+"""
+
+import ast
+import json
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+import tracing
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+# Bump when the prompt changes, so cached expansions of the old prompt are ignored
+PROMPT_VERSION = "2"
+CACHE_FILE = os.getenv(
+    "TERM_EXPANSION_CACHE", os.path.join(output_folder, "term_expansion_cache.json")
+)
+CACHE_TTL = 30 * 24 * 3600
+N_TERMS = 10
+
+PROMPT = """
+    Input: a JSON list of product categories
+    Output: A JSON object with each input category as a key and, as its value, a
+      list of 10 search terms.
+      Ensure that the search terms are closely related to the category but vary
+      in their phrasing and word choice to capture a wide range of relevant
+      searches. The first search term is the category itself.
+      Try to keep each search term to four or less words.
+    Example:
+    Input: ["Chinese name seals"]
+    Output:
+    {"Chinese name seals": ["Chinese name seals", "Chinese chops", "Hanko seals",
+    "Chinese seal carving", "Chinese signature stamps", "Asian name seals",
+    "Chinese calligraphy seals", "Traditional Chinese seals",
+    "Chinese seal engraving", "Chinese name stamps"]}
+"""
+
+# Interchangeable words for the offline expander
+synonyms = [
+    {"chinese", "asian", "oriental", "traditional", "china", "eastern"},
+    {"seal", "seals", "stamp", "stamps", "chop", "chops", "hanko"},
+    {"print", "prints", "art", "decor", "wall"},
+    {"lantern", "lanterns", "lamp", "lamps"},
+    {"bracelet", "bracelets", "necklace", "necklaces", "jewelry", "bead", "beads"},
+    {"sticker", "stickers", "decal", "decals"},
+    {"bookmark", "bookmarks"},
+    {"brush", "brushes", "tools", "supplies"},
+    {"pottery", "ceramic", "ceramics", "porcelain", "clay", "earthenware"},
+    {"tape", "washi", "masking"},
+    {"magnet", "magnets", "fridge", "magnetic"},
+    {"gift", "gifts", "set", "sets", "box", "boxes"},
+]
+
+
+def normalize_term(term: str) -> str:
+    """Lowercase a term and collapse its whitespace."""
+    return " ".join(term.lower().split())
+
+
+def _cache_key(term: str) -> str:
+    return f"v{PROMPT_VERSION}:{normalize_term(term)}"
+
+
+def load_cache(path: str = CACHE_FILE, ttl: float = CACHE_TTL) -> Dict:
+    """Load the expansion cache, dropping expired entries."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    now = time.time()
+    return {key: entry for key, entry in cache.items() if now - entry["time"] < ttl}
+
+
+def save_cache(cache: Dict, path: str = CACHE_FILE):
+    """Atomically write the expansion cache."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_expansion(message: str) -> Dict:
+    """Parse the JSON object in a chat reply.
+
+    Falls back to a Python literal for replies with single-quoted strings, which
+    unlike swapping the quotes copes with apostrophes inside terms.
+    """
+    match = re.search(r"\{.*\}", message, re.DOTALL)
+    text = match.group(0) if match else message
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return ast.literal_eval(text)
+
+
+def openai_expander(seeds: List[str]) -> Dict[str, List[str]]:
+    """Expand several seeds with one chat-completion request."""
+    from openai import OpenAI
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": PROMPT},
+            {"role": "user", "content": json.dumps(seeds)},
+        ],
+    )
+    expansions = parse_expansion(response.choices[0].message.content)
+    by_normalized = {normalize_term(key): value for key, value in expansions.items()}
+    return {seed: by_normalized.get(normalize_term(seed), [seed]) for seed in seeds}
+
+
+def load_vocabulary(output_folder: str = output_folder) -> List[str]:
+    """The search terms used so far, from all_product_data.csv."""
+    path = os.path.join(output_folder, "all_product_data.csv")
+    if not os.path.exists(path):
+        return []
+    return sorted(pd.read_csv(path, usecols=["search_term"])["search_term"].unique())
+
+
+def _concepts(term: str) -> set:
+    """Map each word of a term to its synonym group, so synonyms compare equal."""
+    concepts = set()
+    for word in normalize_term(term).split():
+        group = next((i for i, words in enumerate(synonyms) if word in words), None)
+        concepts.add(word if group is None else group)
+    return concepts
+
+
+def offline_expander(
+    seeds: List[str], vocabulary: Optional[List[str]] = None
+) -> Dict[str, List[str]]:
+    """Expand seeds with the most similar search terms used before.
+
+    Similarity is the Jaccard overlap of the terms' words, with synonyms
+    counted as the same word.
+    """
+    if vocabulary is None:
+        vocabulary = load_vocabulary()
+    vocabulary_concepts = [(term, _concepts(term)) for term in vocabulary]
+    expansions = {}
+    for seed in seeds:
+        seed_concepts = _concepts(seed)
+        scored = sorted(
+            (
+                (len(seed_concepts & concepts) / len(seed_concepts | concepts), term)
+                for term, concepts in vocabulary_concepts
+                if normalize_term(term) != normalize_term(seed)
+            ),
+            key=lambda item: (-item[0], item[1]),
+        )
+        expansions[seed] = [seed] + [
+            term for score, term in scored[: N_TERMS - 1] if score > 0
+        ]
+    return expansions
+
+
+def default_expander() -> Callable[[List[str]], Dict[str, List[str]]]:
+    """The OpenAI expander, or the offline one without a key or if requested."""
+    if os.getenv("TERM_EXPANDER") == "offline" or not os.getenv("OPENAI_API_KEY"):
+        return offline_expander
+    return openai_expander
+
+
+def expand_many(
+    seeds: List[str],
+    expander: Optional[Callable] = None,
+    cache_file: str = CACHE_FILE,
+) -> Dict[str, List[str]]:
+    """Expand several seeds, requesting only the ones not in the cache."""
+    cache = load_cache(cache_file)
+    expansions = {
+        seed: cache[_cache_key(seed)]["terms"]
+        for seed in seeds
+        if _cache_key(seed) in cache
+    }
+    missing = [seed for seed in seeds if seed not in expansions]
+    tracing.count("term_expansion_cache", len(expansions), result="hit")
+    tracing.count("term_expansion_cache", len(missing), result="miss")
+    if not missing:
+        return expansions
+
+    expander = expander or default_expander()
+    # Offline expansions are cheap and would shadow better ones, so skip the cache
+    cacheable = expander is not offline_expander
+    try:
+        with tracing.span(
+            "term_expander", expander=getattr(expander, "__name__", "custom")
+        ):
+            fetched = expander(missing)
+    except Exception:
+        if not cacheable:
+            raise
+        logging.exception("Term expansion failed, using the offline expander")
+        with tracing.span("term_expander", expander=offline_expander.__name__):
+            fetched = offline_expander(missing)
+        cacheable = False
+    if cacheable:
+        now = time.time()
+        for seed in missing:
+            cache[_cache_key(seed)] = {"terms": fetched[seed], "time": now}
+        save_cache(cache, cache_file)
+    expansions.update(fetched)
+    return {seed: expansions[seed] for seed in seeds}
+
+
+def expand_search_terms(search_terms: str, expander=None) -> List[str]:
+    """Expand a seed category into search terms."""
+    expanded_terms = expand_many([search_terms], expander)[search_terms]
+    logging.info("Expanded search terms:")
+    for idx, term in enumerate(expanded_terms, 1):
+        logging.info(f"{idx}: {term}")
+    return expanded_terms
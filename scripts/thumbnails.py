@@ -0,0 +1,407 @@
+"""Thumbnails of the best-selling listings and the collages shown on the slides.
+
+For every category (``product_name_chinese_name``), the top listings by
+``Total Sales`` that have an image are picked; listings whose ``Image URL`` is
+the "Upgrade Pro to Unlock" placeholder are skipped. Their images are fetched
+concurrently over one pooled aiohttp session, shrunk to thumbnails and kept in
+a content-addressed cache in ``output/thumbnails/``:
+
+- ``objects/ab/abcd....jpg``: each thumbnail, named by the hash of its bytes,
+  so listings sharing an image store it once;
+- ``index.json``: the URL each thumbnail came from and when it was last used.
+  The least recently used thumbnails are evicted once the cache grows over
+  ``MAX_CACHE_BYTES``.
+
+Each category's thumbnails are pasted into one grid in ``collages/``, named by
+the thumbnails it holds, and ``collages.json`` maps the categories to their
+collage in sales order. A rerun only downloads images it has not seen and only
+redraws the collages whose listings changed, so it takes seconds after a
+scrape.
+
+Example usage:
+    $ python thumbnails.py
+    $ python thumbnails.py --top 10 --columns 5 --concurrency 16
+
+Against the local stand-in (see mock_etsyhunt.py and synthetic.py):
+    $ python mock_etsyhunt.py --port 8000 &
+    $ python synthetic.py --output-folder /tmp/synthetic \\
+        --image-base-url http://localhost:8000
+    $ python thumbnails.py --output-folder /tmp/synthetic
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+import pandas as pd
+import tenacity
+from PIL import Image
+
+import tracing
+from aggregates import CATEGORY_COLUMN
+from listing_index import LISTING_ID
+from product_store import load_product_data
+
+logging.basicConfig(level=logging.INFO)
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+output_folder = os.path.join(current_directory, "../output/")
+
+THUMBNAILS_FOLDER = "thumbnails"
+COLLAGES_FOLDER = "collages"
+INDEX_FILE = "index.json"
+COLLAGES_FILE = "collages.json"
+
+TOP_N = 10
+COLUMNS = 5
+THUMBNAIL_SIZE = 240
+PADDING = 8
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+CONCURRENCY = 16
+TIMEOUT = 30
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+)
+
+image_columns = [CATEGORY_COLUMN, LISTING_ID, "Title", "Total Sales", "Image URL"]
+
+
+def has_image(urls: pd.Series) -> pd.Series:
+    """Whether each Image URL is a real URL rather than a placeholder."""
+    return urls.fillna("").astype(str).str.match(r"https?://")
+
+
+def top_listings(df: pd.DataFrame, n: int = TOP_N) -> pd.DataFrame:
+    """The n best-selling listings with an image in each category."""
+    df = df[has_image(df["Image URL"])]
+    df = df.drop_duplicates(subset=[CATEGORY_COLUMN, LISTING_ID])
+    df = df.sort_values([CATEGORY_COLUMN, "Total Sales"], ascending=[True, False])
+    return df.groupby(CATEGORY_COLUMN, sort=False).head(n).reset_index(drop=True)
+
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_SIZE) -> bytes:
+    """Shrink an image to fit a size x size square, as JPEG bytes."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class ThumbnailCache:
+    """Content-addressed thumbnails with a size-bounded LRU index.
+
+    Safe to use from the threads of one process. The index is only written by
+    ``save``, other processes should not share the folder at the same time.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = MAX_CACHE_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        path = os.path.join(folder, INDEX_FILE)
+        index = {"urls": {}, "objects": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                index = json.load(f)
+        # URL -> digest, and digest -> {"size", "used"}
+        self.urls: Dict[str, str] = index["urls"]
+        self.objects: Dict[str, Dict] = index["objects"]
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.folder, "objects", digest[:2], f"{digest}.jpg")
+
+    def get(self, url: str) -> Optional[str]:
+        """The digest of a URL's thumbnail, if it is cached."""
+        with self._lock:
+            digest = self.urls.get(url)
+            if digest is None or not os.path.exists(self.path(digest)):
+                tracing.count("thumbnail_cache", result="miss")
+                return None
+            self.objects[digest]["used"] = time.time()
+        tracing.count("thumbnail_cache", result="hit")
+        return digest
+
+    def put(self, url: str, thumbnail: bytes) -> str:
+        """Store a thumbnail for a URL, returning its digest."""
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self.urls[url] = digest
+            self.objects[digest] = {"size": len(thumbnail), "used": time.time()}
+        return digest
+
+    def evict(self, keep: frozenset = frozenset()) -> int:
+        """Drop the least recently used thumbnails until the cache fits.
+
+        Thumbnails in ``keep`` are not evicted. Returns the number evicted.
+        """
+        with self._lock:
+            total = sum(entry["size"] for entry in self.objects.values())
+            evicted = set()
+            by_use = sorted(self.objects.items(), key=lambda item: item[1]["used"])
+            for digest, entry in by_use:
+                if total <= self.max_bytes:
+                    break
+                if digest in keep:
+                    continue
+                total -= entry["size"]
+                evicted.add(digest)
+                del self.objects[digest]
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+            self.urls = {
+                url: digest
+                for url, digest in self.urls.items()
+                if digest not in evicted
+            }
+        if evicted:
+            tracing.count("thumbnail_evictions", len(evicted))
+        return len(evicted)
+
+    def save(self):
+        path = os.path.join(self.folder, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            index = {"urls": self.urls, "objects": self.objects}
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+        os.replace(tmp_path, path)
+
+
+def _retryable(error: BaseException) -> bool:
+    """Whether a failed download may succeed on a retry.
+
+    A 404 or other client error will not, only 429 and server errors are
+    retried along with connection errors and timeouts.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+@tenacity.retry(
+    wait=tenacity.wait_random_exponential(multiplier=0.5, max=10),
+    stop=tenacity.stop_after_attempt(3),
+    retry=tenacity.retry_if_exception(_retryable),
+    before_sleep=tracing.count_retry,
+)
+async def download_image(session: aiohttp.ClientSession, url: str) -> bytes:
+    with tracing.span("fetch_image"):
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+async def fetch_thumbnail(
+    session: aiohttp.ClientSession, cache: ThumbnailCache, url: str
+) -> Optional[str]:
+    """The digest of a URL's thumbnail, downloaded if needed, None on failure."""
+    digest = cache.get(url)
+    if digest:
+        return digest
+    try:
+        data = await download_image(session, url)
+    except tenacity.RetryError as error:
+        logging.warning("Failed to fetch %s: %s", url, error.last_attempt.exception())
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        logging.warning("Failed to fetch %s: %s", url, error)
+        return None
+    try:
+        # Decoding and resizing hold the GIL only in parts, keep them off the loop
+        thumbnail = await asyncio.to_thread(make_thumbnail, data)
+    except Exception as error:
+        # Pillow raises more than OSError, e.g. DecompressionBombError, and one
+        # bad image must not fail the other downloads in the gather
+        logging.warning("Failed to read the image at %s: %r", url, error)
+        return None
+    return cache.put(url, thumbnail)
+
+
+async def fetch_thumbnails(
+    urls: List[str], cache: ThumbnailCache, concurrency: int = CONCURRENCY
+) -> Dict[str, Optional[str]]:
+    """Fetch the thumbnails of all URLs concurrently, returning their digests."""
+    urls = list(dict.fromkeys(urls))
+    async with aiohttp.ClientSession(
+        headers={"User-Agent": USER_AGENT},
+        connector=aiohttp.TCPConnector(limit=concurrency),
+        timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+    ) as session:
+        digests = await asyncio.gather(
+            *(fetch_thumbnail(session, cache, url) for url in urls)
+        )
+    return dict(zip(urls, digests))
+
+
+def build_collage(
+    paths: List[str],
+    columns: int = COLUMNS,
+    size: int = THUMBNAIL_SIZE,
+    padding: int = PADDING,
+) -> Image.Image:
+    """Paste thumbnails into a grid, centred in size x size cells."""
+    rows = -(-len(paths) // columns)
+    cell = size + padding
+    collage = Image.new(
+        "RGB",
+        (min(len(paths), columns) * cell + padding, rows * cell + padding),
+        "white",
+    )
+    for i, path in enumerate(paths):
+        with Image.open(path) as thumbnail:
+            row, col = divmod(i, columns)
+            x = padding + col * cell + (size - thumbnail.width) // 2
+            y = padding + row * cell + (size - thumbnail.height) // 2
+            collage.paste(thumbnail, (x, y))
+    return collage
+
+
+def write_collages(
+    listings: pd.DataFrame,
+    cache: ThumbnailCache,
+    folder: str,
+    columns: int = COLUMNS,
+) -> Dict[str, str]:
+    """Draw each category's collage unless it already exists.
+
+    A collage is named by a hash of its thumbnails, so an unchanged category
+    finds its file and is skipped. Returns each category's collage path,
+    relative to the thumbnails folder.
+    """
+    collages_folder = os.path.join(folder, COLLAGES_FOLDER)
+    os.makedirs(collages_folder, exist_ok=True)
+    collages = {}
+    for category, rows in listings.groupby(CATEGORY_COLUMN, sort=False):
+        digests = rows["digest"].tolist()
+        name = hashlib.sha256(f"{columns}:{','.join(digests)}".encode()).hexdigest()
+        path = os.path.join(COLLAGES_FOLDER, f"{name[:16]}.png")
+        if not os.path.exists(os.path.join(folder, path)):
+            with tracing.span("build_collage", category=category):
+                collage = build_collage([cache.path(d) for d in digests], columns)
+                tmp_path = os.path.join(folder, path + ".tmp")
+                collage.save(tmp_path, format="PNG", optimize=True)
+                os.replace(tmp_path, os.path.join(folder, path))
+        collages[category] = path
+
+    # Collages of listings that dropped out of the top
+    live = {os.path.basename(path) for path in collages.values()}
+    for file_name in os.listdir(collages_folder):
+        if file_name not in live:
+            os.remove(os.path.join(collages_folder, file_name))
+    return collages
+
+
+def load_collages(output_folder: str = output_folder) -> Optional[Dict[str, str]]:
+    """Each category's collage path, in the order they were written.
+
+    None if the collages have not been built, empty if no listing had an image.
+    """
+    folder = os.path.join(output_folder, THUMBNAILS_FOLDER)
+    path = os.path.join(folder, COLLAGES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        collages = json.load(f)
+    return {
+        category: os.path.join(folder, collage)
+        for category, collage in collages.items()
+    }
+
+
+def update_thumbnails(
+    output_folder: str = output_folder,
+    n: int = TOP_N,
+    columns: int = COLUMNS,
+    concurrency: int = CONCURRENCY,
+    max_bytes: int = MAX_CACHE_BYTES,
+) -> Dict[str, str]:
+    """Fetch the top listings' thumbnails and redraw the stale collages."""
+    folder = os.path.join(output_folder, THUMBNAILS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    cache = ThumbnailCache(folder, max_bytes)
+    # Fetch a few spares, to fill in for images that fail to download
+    candidates = top_listings(
+        load_product_data(image_columns, None, output_folder), 2 * n
+    )
+    if candidates.empty:
+        logging.warning(
+            "No listing has an image URL, the exports only have the "
+            "'Upgrade Pro to Unlock' placeholder: there are no collages to draw"
+        )
+    logging.info(
+        "Fetching %d thumbnails for %d categories",
+        len(candidates),
+        candidates[CATEGORY_COLUMN].nunique(),
+    )
+    with tracing.span("fetch_thumbnails", listings=len(candidates)):
+        digests = asyncio.run(
+            fetch_thumbnails(candidates["Image URL"].tolist(), cache, concurrency)
+        )
+    candidates["digest"] = candidates["Image URL"].map(digests)
+    listings = (
+        candidates.dropna(subset=["digest"])
+        .groupby(CATEGORY_COLUMN, sort=False)
+        .head(n)
+    )
+    evicted = cache.evict(keep=frozenset(candidates["digest"].dropna()))
+    cache.save()
+    if evicted:
+        logging.info("Evicted %d thumbnails", evicted)
+
+    collages = write_collages(listings, cache, folder, columns)
+    path = os.path.join(folder, COLLAGES_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(collages, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    missing = len(candidates) - candidates["digest"].notna().sum()
+    logging.info("Wrote %d collages, %d images failed", len(collages), missing)
+    return collages
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output-folder", default=output_folder)
+    parser.add_argument("--top", type=int, default=TOP_N, help="Listings per category.")
+    parser.add_argument(
+        "--columns", type=int, default=COLUMNS, help="Thumbnails per collage row."
+    )
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument(
+        "--max-cache-mb",
+        type=float,
+        default=MAX_CACHE_BYTES / 1024 / 1024,
+        help="Size of the thumbnail cache before old thumbnails are evicted.",
+    )
+    args = parser.parse_args(argv)
+    update_thumbnails(
+        args.output_folder,
+        args.top,
+        args.columns,
+        args.concurrency,
+        int(args.max_cache_mb * 1024 * 1024),
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+"""Summarize a trace file written by ``tracing.py``.
+
+Prints the count, total, mean, median, p95 and max of every span and
+histogram and the totals of the counters, slowest total first. The labels
+given to ``--group-by`` break each row down further, e.g. ``term`` for the
+time of each search term or ``slide`` for each dashboard slide.
+
+Example usage:
+    $ python trace_summary.py ../output/trace.jsonl
+    $ python trace_summary.py ../output/trace.jsonl --group-by term
+    $ python trace_summary.py ../output/trace.jsonl --prometheus ../output/metrics.prom
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from tracing import COUNTER, SPAN
+
+# Histogram bucket bounds in seconds, up to the scraper's minute-long waits
+buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+event_columns = ["type", "name", "time", "pid", "value", "error"]
+
+
+def load_events(path: str) -> pd.DataFrame:
+    """Read a trace file into one row per event, with a column per label.
+
+    The ``value`` of a span is its duration in seconds.
+    """
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    df = pd.json_normalize(events) if events else pd.DataFrame()
+    df.columns = [col.removeprefix("labels.") for col in df.columns]
+    for col in event_columns + ["seconds"]:
+        if col not in df:
+            df[col] = None
+    spans = df["type"] == SPAN
+    df["value"] = df["value"].where(~spans, df["seconds"]).astype(float)
+    return df.drop(columns="seconds")
+
+
+def label_columns(events: pd.DataFrame) -> List[str]:
+    return [col for col in events.columns if col not in event_columns]
+
+
+def summarize(
+    events: pd.DataFrame, group_by: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Aggregate the events per type, name and ``group_by`` labels."""
+    keys = ["type", "name"] + [col for col in group_by or [] if col in events]
+    grouped = events.assign(failed=events["error"].notna()).groupby(keys, dropna=False)
+    summary = grouped["value"].agg(
+        count="size",
+        total="sum",
+        mean="mean",
+        p50="median",
+        p95=lambda values: values.quantile(0.95),
+        max="max",
+    )
+    summary["errors"] = grouped["failed"].sum()
+    # A counter's events are increments, only their total means anything
+    counters = summary.index.get_level_values("type") == COUNTER
+    summary.loc[counters, ["mean", "p50", "p95", "max"]] = float("nan")
+    return summary.sort_values("total", ascending=False)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prometheus_labels(labels: Dict) -> str:
+    pairs = [
+        f'{key}="{_escape(str(value))}"'
+        for key, value in labels.items()
+        if pd.notna(value)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def to_prometheus(events: pd.DataFrame) -> str:
+    """Render the events in the Prometheus text format.
+
+    Counters become ``<name>_total``, spans ``<name>_seconds`` histograms and
+    observations ``<name>`` histograms, with a series per label combination.
+    """
+    labels = label_columns(events)
+    lines = []
+    for (kind, name), rows in events.groupby(["type", "name"]):
+        metric = "".join(c if c.isalnum() else "_" for c in name)
+        if kind == COUNTER:
+            metric += "_total"
+        elif kind == SPAN:
+            metric += "_seconds"
+        lines.append(f"# TYPE {metric} {'counter' if kind == COUNTER else 'histogram'}")
+        used = [col for col in labels if rows[col].notna().any()]
+        series = rows.groupby(used, dropna=False) if used else [((), rows)]
+        for key, values in series:
+            key = key if isinstance(key, tuple) else (key,)
+            series_labels = dict(zip(used, key))
+            value = values["value"]
+            if kind == COUNTER:
+                lines.append(
+                    f"{metric}{_prometheus_labels(series_labels)} {value.sum():g}"
+                )
+                continue
+            for bound in buckets + [float("inf")]:
+                bucket = dict(series_labels, le=f"{bound:g}".replace("inf", "+Inf"))
+                lines.append(
+                    f"{metric}_bucket{_prometheus_labels(bucket)} "
+                    f"{(value <= bound).sum()}"
+                )
+            lines.append(
+                f"{metric}_sum{_prometheus_labels(series_labels)} {value.sum():g}"
+            )
+            lines.append(
+                f"{metric}_count{_prometheus_labels(series_labels)} {len(value)}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace_file")
+    parser.add_argument(
+        "--group-by", nargs="+", default=[], help="Labels to break the rows down by."
+    )
+    parser.add_argument(
+        "--prometheus", help="Also write the metrics in the Prometheus text format."
+    )
+    args = parser.parse_args(argv)
+    events = load_events(args.trace_file)
+    if args.prometheus:
+        tmp_path = args.prometheus + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(to_prometheus(events))
+        os.replace(tmp_path, args.prometheus)
+    with pd.option_context(
+        "display.width",
+        200,
+        "display.max_rows",
+        None,
+        "display.max_columns",
+        None,
+        "display.float_format",
+        "{:.3f}".format,
+    ):
+        print(summarize(events, args.group_by))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,97 @@
+"""Lightweight spans, counters and histograms for the scraper and dashboard.
+
+Instrumented code records three kinds of events:
+
+- ``span(name, **labels)``: times a block, e.g. one search or one slide;
+- ``count(name, value, **labels)``: increments a counter, e.g. retries;
+- ``observe(name, value, **labels)``: adds a value to a histogram.
+
+Tracing is off unless ``TRACE_FILE`` is set (or ``configure`` is called), and
+then every event is appended as one JSON line to that file. Lines are written
+with a single ``O_APPEND`` write, so the scrape pool's workers and the
+dashboard can share a file. With tracing off, a span costs a few microseconds.
+
+To trace a scrape (``trace_summary.py`` reports where the time went):
+    $ TRACE_FILE=../output/trace.jsonl python etsyhunt_bot.py chinese name seals
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+SPAN = "span"
+COUNTER = "counter"
+OBSERVATION = "observation"
+
+_path = os.getenv("TRACE_FILE")
+_fd: Optional[int] = None
+_fd_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def configure(path: Optional[str]):
+    """Append events to ``path`` from now on, or stop tracing if None."""
+    global _path, _fd
+    with _lock:
+        if _fd is not None and _fd_pid == os.getpid():
+            os.close(_fd)
+        _path, _fd = path, None
+
+
+def _write(event: Dict):
+    global _fd, _fd_pid
+    line = (json.dumps(event, ensure_ascii=False) + "\n").encode()
+    with _lock:
+        # Reopen after a fork, so workers do not share the parent's descriptor
+        if _fd is None or _fd_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(_path)), exist_ok=True)
+            _fd = os.open(_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            _fd_pid = os.getpid()
+        os.write(_fd, line)
+
+
+def _record(kind: str, name: str, labels: Dict, **fields):
+    if _path is None:
+        return
+    labels = {key: str(value) for key, value in labels.items()}
+    event = {"type": kind, "name": name, "labels": labels, "time": time.time()}
+    event.update(fields, pid=os.getpid())
+    _write(event)
+
+
+@contextlib.contextmanager
+def span(name: str, **labels) -> Iterator[Dict]:
+    """Time the block as a span. Yields its labels, so the block can add some.
+
+    A span that raises is recorded with the exception type as ``error``.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield labels
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        if _path is not None:
+            _record(
+                SPAN, name, labels, seconds=time.perf_counter() - start, error=error
+            )
+
+
+def count(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+    _record(COUNTER, name, labels, value=value)
+
+
+def observe(name: str, value: float, **labels):
+    """Add a value to a histogram."""
+    _record(OBSERVATION, name, labels, value=value)
+
+
+def count_retry(retry_state):
+    """A tenacity ``before_sleep`` callback counting retries per function."""
+    count("retries", function=retry_state.fn.__name__)
@@ -0,0 +1,221 @@
+"""Validate and repair raw EtsyHunt exports against a declared schema.
+
+The exports are not always well formed:
+
+- in2csv writes count columns holding only 0 and 1 as ``True``/``False``
+  (e.g. ``7-day Reviews`` in ``ancient_chinese_pottery``);
+- the flag columns of some exports say ``no`` instead of ``False``;
+- an unquoted comma in a title spills it into the next fields, shifting the
+  rest of the row right;
+- titles are cut at the inch symbol (e.g. "Free Shipping 6 ").
+
+Every column is read as text and parsed according to ``schema``, one column
+at a time. Shifted rows are realigned, rows that still fail a check are
+quarantined with the reasons, and per-file quality stats are returned, so bad
+rows are dealt with once at ingest instead of in every downstream groupby.
+The columns are read by position, so a file whose header does not name the
+schema's columns in order has all its rows quarantined.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from product_store import count_columns
+
+# How many extra fields a shifted row may have before it is quarantined
+MAX_EXTRA_FIELDS = 5
+MAX_PRICE = 100_000
+LISTING_URL = r"^https?://(?:www\.)?etsy\.com/listing/\d+"
+
+schema = {
+    "Title": "text",
+    "Category": "text",
+    'Price("$")': "price",
+    **{col: "count" for col in count_columns},
+    "Tags": "text",
+    "Ship From": "text",
+    "Release Time": "date",
+    "Best Seller": "flag",
+    "Etsy Pick": "flag",
+    "Raving": "flag",
+    "Store Name": "text",
+    "Product URL": "url",
+    "Image URL": "text",
+}
+
+true_values = ["true", "yes", "1"]
+false_values = ["false", "no", "0"]
+
+
+def read_raw(path: str) -> Tuple[pd.DataFrame, pd.DataFrame, List[str]]:
+    """Read an export as text, with room for rows that have extra fields.
+
+    Also returns the rows with more extra fields than that, as their line in
+    ``Title``, so they are quarantined instead of dropped by the reader, and
+    the file's header.
+    """
+    extra = [f"_extra_{i}" for i in range(MAX_EXTRA_FIELDS)]
+    overflow = []
+    raw = pd.read_csv(
+        path,
+        header=None,
+        names=list(schema) + extra,
+        dtype=str,
+        # The C parser only skips bad lines, the python one hands them over
+        engine="python",
+        on_bad_lines=lambda fields: overflow.append(",".join(fields)),
+    )
+    # The header is read as a row: the parser would take the extra fields of
+    # an overlong first row as an index instead of reporting them
+    header = (
+        raw.iloc[0].dropna().str.strip().str.lstrip("\ufeff").tolist()
+        if len(raw)
+        else []
+    )
+    raw = raw.iloc[1:].reset_index(drop=True)
+    overflow = pd.DataFrame({"Title": overflow}, columns=list(schema), dtype=str)
+    return raw, overflow, header
+
+
+def header_problem(header: List[str]) -> Optional[str]:
+    """What is wrong with an export's header, None if it names the schema."""
+    expected = list(schema)
+    if header == expected:
+        return None
+    missing = [col for col in expected if col not in header]
+    unexpected = [col for col in header if col not in expected]
+    if not missing and not unexpected:
+        return "columns out of order"
+    problems = []
+    if missing:
+        problems.append("missing " + ", ".join(missing))
+    if unexpected:
+        problems.append("unexpected " + ", ".join(unexpected))
+    return "; ".join(problems)
+
+
+def realign_rows(raw: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """Merge titles that spilled into the following fields back together.
+
+    A row with k extra fields is taken to have a title containing k unquoted
+    commas: its first k + 1 fields are joined into the title and the rest are
+    shifted left. Returns the realigned frame and the number of rows fixed.
+    """
+    columns = list(schema)
+    extra = raw.columns[len(columns) :]
+    values = raw.to_numpy(dtype=object)
+    present = raw[extra].notna().to_numpy()
+    # The number of extra fields is the position of the last one present
+    n_extra = (present * np.arange(1, len(extra) + 1)).max(axis=1)
+    for k in np.unique(n_extra[n_extra > 0]):
+        rows = n_extra == k
+        spilled = pd.DataFrame(values[rows, : k + 1]).fillna("")
+        title = spilled.astype(str).agg(",".join, axis=1).to_numpy()
+        values[rows, 0] = title
+        values[rows, 1 : len(columns)] = values[rows, k + 1 : len(columns) + k]
+    realigned = pd.DataFrame(values[:, : len(columns)], columns=columns)
+    return realigned, int((n_extra > 0).sum())
+
+
+def parse_counts(values: pd.Series) -> pd.Series:
+    """Parse a count column, reading the True/False of in2csv as 1/0."""
+    lowered = values.str.strip().str.lower()
+    lowered = lowered.replace({"true": "1", "false": "0"})
+    return pd.to_numeric(lowered, errors="coerce")
+
+
+def parse_flags(values: pd.Series) -> pd.Series:
+    """Parse a flag column to a nullable boolean, NA for unknown values."""
+    lowered = values.fillna("false").str.strip().str.lower()
+    flags = pd.Series(pd.NA, index=values.index, dtype="boolean")
+    flags[lowered.isin(true_values)] = True
+    flags[lowered.isin(false_values)] = False
+    return flags
+
+
+def validate_export(path: str) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
+    """Read, repair and check an export.
+
+    Returns the valid rows with typed columns, the quarantined raw rows with a
+    ``reasons`` column, and the file's quality stats.
+    """
+    raw, overflow, header = read_raw(path)
+    raw, realigned = realign_rows(raw)
+    df = raw.copy()
+    invalid = {}
+    repaired = {}
+    problem = header_problem(header)
+    if problem is not None:
+        logging.warning("Quarantining %s, its header has %s", path, problem)
+    invalid["unexpected header"] = pd.Series(problem is not None, index=raw.index)
+
+    for col, kind in schema.items():
+        values = raw[col]
+        if kind == "count":
+            parsed = parse_counts(values)
+            invalid[f"bad {col}"] = parsed.isna() | (parsed < 0)
+            booleans = values.str.lower().isin(["true", "false"])
+            if booleans.any():
+                repaired[col] = int(booleans.sum())
+            df[col] = parsed
+        elif kind == "flag":
+            parsed = parse_flags(values)
+            invalid[f"bad {col}"] = parsed.isna()
+            aliases = values.str.lower().isin(["yes", "no"])
+            if aliases.any():
+                repaired[col] = int(aliases.sum())
+            df[col] = parsed
+        elif kind == "price":
+            parsed = pd.to_numeric(values.str.replace(",", ""), errors="coerce")
+            invalid["bad price"] = parsed.isna() | (parsed <= 0) | (parsed > MAX_PRICE)
+            df[col] = values
+        elif kind == "date":
+            parsed = pd.to_datetime(values, errors="coerce")
+            # Missing release times are common, unparseable ones are not
+            invalid[f"bad {col}"] = parsed.isna() & values.notna()
+            df[col] = parsed
+        elif kind == "url":
+            invalid["bad URL"] = ~values.fillna("").str.match(LISTING_URL)
+
+    invalid["7-day sales above total"] = df["7-day sales"] > df["Total Sales"]
+    invalid = pd.DataFrame(invalid).fillna(False)
+    bad = invalid.any(axis=1)
+
+    quarantined = raw[bad].copy()
+    if bad.any():
+        reasons = invalid[bad]
+        # Each reason's name where its flag is set, concatenated along the row
+        quarantined["reasons"] = reasons.dot(reasons.columns + "; ").str[:-2]
+    if len(overflow):
+        quarantined = pd.concat(
+            [quarantined, overflow.assign(reasons="too many fields")],
+            ignore_index=True,
+        )
+    df = df[~bad].reset_index(drop=True)
+    for col in count_columns:
+        df[col] = df[col].astype("int64")
+    for col, kind in schema.items():
+        if kind == "flag":
+            df[col] = df[col].astype(bool)
+
+    invalid_values = {
+        reason: int(count) for reason, count in invalid.sum().items() if count
+    }
+    if len(overflow):
+        invalid_values["too many fields"] = len(overflow)
+    stats = {
+        "rows": len(raw) + len(overflow),
+        "valid_rows": len(df),
+        "quarantined_rows": len(quarantined),
+        "realigned_rows": realigned,
+        "repaired_values": repaired,
+        "invalid_values": invalid_values,
+        # Cut at the inch symbol, the rest of the title is lost
+        "truncated_titles": int(df["Title"].str.contains(r"\d\s*$").sum()),
+        "missing_release_time": int(df["Release Time"].isna().sum()),
+        "duplicate_urls": int(df["Product URL"].duplicated().sum()),
+    }
+    return df, quarantined, stats
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts import each other by module name, as when run from scripts/
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../scripts")
+)
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard_data
+from dashboard_data import FigureCache, MtimeCache, _arg_key
+
+
+class Unhashable:
+    __hash__ = None
+
+
+def test_mtime_cache_reloads_changed_files(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("one")
+    cache = MtimeCache()
+    loads = []
+
+    def load():
+        loads.append(path.read_text())
+        return loads[-1]
+
+    assert cache.get("data", load, [str(path)]) == "one"
+    assert cache.get("data", load, [str(path)]) == "one"
+    time.sleep(0.01)
+    path.write_text("two")
+    assert cache.get("data", load, [str(path)]) == "two"
+    assert loads == ["one", "two"]
+
+
+def test_mtime_cache_loads_each_value_once_and_values_in_parallel():
+    cache = MtimeCache()
+    loads = {"a": 0, "b": 0}
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def loader(name):
+        def load():
+            with lock:
+                loads[name] += 1
+                running.add(name)
+                if running == {"a", "b"}:
+                    overlapped.set()
+            # The other value's load starts while this one runs
+            overlapped.wait(timeout=2)
+            with lock:
+                running.discard(name)
+            return name
+
+        return load
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(lambda name: cache.get(name, loader(name), []), ["a", "b"] * 4)
+        )
+    assert results == ["a", "b"] * 4
+    assert loads == {"a": 1, "b": 1}
+    assert overlapped.is_set()
+
+
+def test_arg_key_hashes_unhashable_arguments_by_content():
+    assert _arg_key(["a", "b"]) != _arg_key(["a", "c"])
+    assert _arg_key({"x": [1], "y": 2}) == _arg_key({"y": 2, "x": [1]})
+    assert _arg_key({"x": [1]}) != _arg_key({"x": [2]})
+    assert _arg_key((1, [2])) != _arg_key((1, [3]))
+    frame = pd.DataFrame({"a": [1, 2]})
+    assert _arg_key(frame) == _arg_key(frame.copy())
+    assert _arg_key(frame) != _arg_key(frame.rename(columns={"a": "b"}))
+    assert _arg_key(np.arange(3)) != _arg_key(np.arange(4))
+    assert _arg_key("all") == "all"
+    with pytest.raises(TypeError):
+        _arg_key(Unhashable())
+
+
+def test_arg_key_names_cached_values(monkeypatch):
+    cache = MtimeCache()
+    monkeypatch.setattr(dashboard_data, "cache", cache)
+    cube = cache.get("cube:/output", lambda: {"metrics": {}}, [])
+    assert _arg_key(cube) == ("cached", "cube:/output")
+    # An equal dict that is not the cached one is keyed on its content
+    assert _arg_key({"metrics": {}}) != _arg_key(cube)
+
+
+def test_figure_cache_keys_on_list_arguments():
+    figures = FigureCache()
+
+    def build(values):
+        return list(values)
+
+    assert figures.get("v1", build, ["a"]) == ["a"]
+    assert figures.get("v1", build, ["b"]) == ["b"]
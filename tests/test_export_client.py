@@ -0,0 +1,126 @@
+import json
+import urllib.request
+from http.cookies import SimpleCookie
+
+import pytest
+import tenacity
+
+import export_client
+import mock_etsyhunt
+import scrape_journal
+from export_client import DOWNLOADED, FAILED, NO_RESULTS, SESSION_EXPIRED
+
+TERMS = ["asian calligraphy wall art", "chinese character prints"]
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**kwargs):
+        server = mock_etsyhunt.serve(0, **kwargs)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def export_settings(monkeypatch):
+    monkeypatch.setattr(export_client, "EXPORT_PATH", "/export")
+    monkeypatch.setattr(
+        export_client.ExportClient.download.retry, "wait", tenacity.wait_none()
+    )
+
+
+def login(base_url):
+    with urllib.request.urlopen(f"{base_url}/dashboard?email=a&password=b") as r:
+        cookie = SimpleCookie(r.headers["Set-Cookie"])
+    return {name: morsel.value for name, morsel in cookie.items()}
+
+
+def exports_served(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats") as r:
+        return len(json.load(r).get("/export", []))
+
+
+def run(base_url, terms, tmp_path, cookies=None, concurrency=1):
+    journal = str(tmp_path / "job.journal.jsonl")
+    scrape_journal.start_job(journal, terms)
+    statuses = export_client.run_exports(
+        terms,
+        login(base_url) if cookies is None else cookies,
+        str(tmp_path / "exports"),
+        base_url,
+        concurrency=concurrency,
+        journal=journal,
+    )
+    return statuses, scrape_journal.load_journal(journal)
+
+
+def states(job):
+    return {term: event["state"] for term, event in job["states"].items()}
+
+
+def test_success(mock_server, tmp_path):
+    base_url = mock_server()
+    statuses, job = run(base_url, TERMS, tmp_path)
+    assert statuses == {term: DOWNLOADED for term in TERMS}
+    assert states(job) == {term: scrape_journal.RENAMED for term in TERMS}
+    assert scrape_journal.remaining_terms(job) == []
+
+
+def test_header_only_export_is_no_results(mock_server, tmp_path):
+    base_url = mock_server()
+    statuses, job = run(base_url, ["no such term"], tmp_path)
+    assert statuses == {"no such term": NO_RESULTS}
+    assert states(job) == {"no such term": scrape_journal.NO_RESULTS}
+    assert not (tmp_path / "exports").exists()
+
+
+def test_404_fails_without_retrying(mock_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_client, "EXPORT_PATH", "/no-such-export")
+    base_url = mock_server()
+    statuses, job = run(base_url, TERMS[:1], tmp_path)
+    assert statuses == {TERMS[0]: FAILED}
+    assert states(job) == {TERMS[0]: scrape_journal.FAILED}
+    assert scrape_journal.remaining_terms(job) == TERMS[:1]
+    with urllib.request.urlopen(f"{base_url}/stats") as r:
+        assert len(json.load(r)["/no-such-export"]) == 1
+
+
+def test_throttled_export_is_retried(mock_server, tmp_path):
+    # The second export is answered with 429, its retry goes through
+    base_url = mock_server(throttle_every=2)
+    statuses, job = run(base_url, TERMS, tmp_path)
+    assert statuses == {term: DOWNLOADED for term in TERMS}
+    assert states(job) == {term: scrape_journal.RENAMED for term in TERMS}
+    assert exports_served(base_url) == 3
+
+
+def test_always_throttled_export_fails(mock_server, tmp_path):
+    base_url = mock_server(throttle_every=1)
+    statuses, job = run(base_url, TERMS[:1], tmp_path)
+    assert statuses == {TERMS[0]: FAILED}
+    assert states(job) == {TERMS[0]: scrape_journal.FAILED}
+    assert exports_served(base_url) == 4
+
+
+def test_login_redirect_expires_the_session(mock_server, tmp_path):
+    base_url = mock_server()
+    statuses, job = run(base_url, TERMS, tmp_path, cookies={"session": "stale"})
+    assert statuses == {term: SESSION_EXPIRED for term in TERMS}
+    # Nothing is journaled, so the terms stay pending for the next login
+    assert states(job) == {term: scrape_journal.PENDING for term in TERMS}
+    assert scrape_journal.remaining_terms(job) == TERMS
+    # The first redirect stops the run, the other term is not requested
+    assert exports_served(base_url) == 1
+
+
+def test_export_path_is_required(monkeypatch):
+    monkeypatch.setattr(export_client, "EXPORT_PATH", None)
+    with pytest.raises(RuntimeError, match="ETSYHUNT_EXPORT_PATH"):
+        export_client.ExportClient("http://127.0.0.1", {})
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from opportunity import PRIOR_LISTINGS, OpportunityScores, features, term_features
+
+
+def feature_table():
+    return pd.DataFrame(
+        {
+            "sales_rate": [0.9, 0.5, 0.1, 0.5],
+            "median_proceeds": [100.0, 50.0, 10.0, np.nan],
+            "median_price": [30.0, 20.0, 10.0, 20.0],
+            "listings": [50, 20, 5, 100],
+            "store_concentration": [0.1, 0.5, 0.9, np.nan],
+        },
+        index=pd.MultiIndex.from_tuples(
+            [("seals", "a"), ("seals", "b"), ("prints", "c"), ("prints", "d")],
+            names=["product_name", "search_term"],
+        ),
+    )
+
+
+def test_rank_orders_by_weighted_percentiles():
+    scores = OpportunityScores(feature_table())
+    ranked = scores.rank({"sales_rate": 1.0})
+    assert ranked["search_term"].tolist()[0] == "a"
+    assert ranked["search_term"].tolist()[-1] == "c"
+    assert ranked["score"].is_monotonic_decreasing
+
+    # Competition features rank the other way round, fewer listings is better
+    ranked = scores.rank({"listings": 1.0})
+    assert ranked["search_term"].tolist() == ["c", "b", "a", "d"]
+    # A missing feature ranks in the middle
+    ranked = scores.rank({"store_concentration": 1.0}).set_index("search_term")
+    assert ranked.loc["d", "score"] == 0.5
+    assert scores.rank({name: 0.0 for name in features})["score"].eq(0).all()
+
+
+def test_rank_filters():
+    scores = OpportunityScores(feature_table())
+    assert (
+        scores.rank(k=2)["search_term"].tolist()
+        == scores.rank()["search_term"].tolist()[:2]
+    )
+    assert set(scores.rank(min_sales_rate=0.5)["search_term"]) == {"a", "b", "d"}
+    assert set(scores.rank(min_listings=20)["search_term"]) == {"a", "b", "d"}
+    assert set(scores.rank(group="prints")["search_term"]) == {"c", "d"}
+    assert scores.rank(group="prints", min_listings=200).empty
+
+
+def test_few_listings_are_shrunk_toward_the_product():
+    listings = pd.DataFrame(
+        {
+            "listing_id": range(21),
+            "has_sales": [True] + [True] * 10 + [False] * 10,
+            "proceeds": 10.0,
+            "price": 10.0,
+            "Total Sales": 1,
+            "Store Name": "store",
+        }
+    )
+    listing_terms = pd.DataFrame(
+        {
+            "listing_id": range(21),
+            "product_name": "seals",
+            "search_term": ["lucky"] + ["broad"] * 20,
+        }
+    )
+    table = term_features({"listings": listings, "listing_terms": listing_terms})
+    product_rate = 11 / 21
+    lucky = table.loc[("seals", "lucky")]
+    assert lucky["listings"] == 1
+    assert lucky["sales_rate"] == pytest.approx(
+        (1 + PRIOR_LISTINGS * product_rate) / (1 + PRIOR_LISTINGS)
+    )
+    broad = table.loc[("seals", "broad")]
+    assert broad["sales_rate"] == pytest.approx(
+        (10 + PRIOR_LISTINGS * product_rate) / (20 + PRIOR_LISTINGS)
+    )
+    # One listing with sales no longer beats the product by much
+    assert lucky["sales_rate"] < 0.6
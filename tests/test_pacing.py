@@ -0,0 +1,58 @@
+import json
+import multiprocessing as mp
+import urllib.request
+
+import pytest
+
+import mock_etsyhunt
+import pacing
+
+REQUESTS_PER_MINUTE = 600
+BURST = 2
+
+
+@pytest.fixture
+def base_url():
+    server = mock_etsyhunt.serve(0)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def search_worker(pacer, base_url, requests):
+    for i in range(requests):
+        pacer.acquire()
+        urllib.request.urlopen(f"{base_url}/product?keyword=term+{i}").close()
+
+
+def test_workers_share_the_request_budget(base_url):
+    # One pacer for all worker processes, as scrape_pool.run_pool creates it
+    pacer = pacing.Pacer(REQUESTS_PER_MINUTE, BURST, jitter=0)
+    workers = [
+        mp.Process(target=search_worker, args=(pacer, base_url, 5)) for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    with urllib.request.urlopen(f"{base_url}/stats") as r:
+        times = sorted(json.load(r)["/product"])
+    assert len(times) == 15
+    rate = REQUESTS_PER_MINUTE / 60
+    # No window holds more requests than the bucket allows, give or take one
+    # for the time between taking a token and the request reaching the mock
+    for i in range(len(times)):
+        for j in range(i + 1, len(times)):
+            assert j - i + 1 <= BURST + rate * (times[j] - times[i]) + 1
+
+
+def test_backoff_is_shared():
+    pacer = pacing.Pacer(REQUESTS_PER_MINUTE, BURST, jitter=0, backoff=0.5)
+    worker = mp.Process(target=pacer.throttled, args=(pacing.RATE_LIMITED,))
+    worker.start()
+    worker.join()
+    assert pacer.penalty == 0.5
+    pacer.succeeded()
+    assert pacer.penalty == 0.0
@@ -0,0 +1,61 @@
+from scrape_journal import (
+    FAILED,
+    GIVEN_UP,
+    NO_RESULTS,
+    RENAMED,
+    file_checksum,
+    give_up_failing,
+    load_journal,
+    record,
+    remaining_terms,
+    start_job,
+)
+
+
+def test_resume_skips_completed_terms(tmp_path):
+    journal = str(tmp_path / "job.journal.jsonl")
+    export = tmp_path / "seals.csv"
+    export.write_text("Title\n")
+    start_job(journal, ["seals", "stamps", "chops", "gone"])
+    record(
+        journal,
+        "seals",
+        RENAMED,
+        path=str(export),
+        sha256=file_checksum(str(export)),
+    )
+    record(journal, "stamps", NO_RESULTS)
+    record(journal, "gone", RENAMED, path=str(tmp_path / "missing.csv"))
+    # A crash can leave a partial last line
+    with open(journal, "a") as f:
+        f.write('{"term": "cho')
+    assert remaining_terms(load_journal(journal)) == ["chops", "gone"]
+
+    # An export changed since it was renamed is scraped again
+    export.write_text("Title\nchanged\n")
+    assert remaining_terms(load_journal(journal)) == ["seals", "chops", "gone"]
+
+
+def test_terms_are_given_up_after_max_attempts(tmp_path):
+    journal = str(tmp_path / "job.journal.jsonl")
+    start_job(journal, ["seals", "stamps"])
+    for _ in range(3):
+        record(journal, "seals", FAILED, error="timeout")
+    record(journal, "stamps", FAILED, error="timeout")
+
+    job = load_journal(journal)
+    assert job["states"]["seals"]["attempts"] == 3
+    assert give_up_failing(journal, job, max_attempts=3) == ["seals"]
+    assert remaining_terms(job) == ["stamps"]
+
+    # The give up is journaled, a resume does not try the term again
+    job = load_journal(journal)
+    assert job["states"]["seals"]["state"] == GIVEN_UP
+    assert give_up_failing(journal, job, max_attempts=3) == []
+    assert remaining_terms(job) == ["stamps"]
+
+    # Starting the job again resets the attempts
+    start_job(journal, ["seals", "stamps"])
+    job = load_journal(journal)
+    assert job["states"]["seals"]["attempts"] == 0
+    assert remaining_terms(job) == ["seals", "stamps"]
@@ -0,0 +1,86 @@
+import math
+
+import pandas as pd
+
+from search_index import B, K1, load_search_index, update_search_index
+
+TITLES = [
+    "jade bangle bracelet",
+    "jade jade jade pendant with a long description of the pendant",
+    "silver bangles",
+    "ink brush painting",
+    "bamboo brush set",
+]
+
+
+def product_table(product_names):
+    return pd.DataFrame(
+        {
+            "listing_id": range(len(TITLES)),
+            "product_name": product_names,
+            "Title": TITLES,
+            "Tags": [[] for _ in TITLES],
+            "Store Name": None,
+            "price": [20.0, 80.0, 15.0, 40.0, 10.0],
+            "Total Sales": [3, 0, 9, 1, 4],
+            "has_sales": [True, False, True, True, True],
+            "Product URL": "",
+        }
+    )
+
+
+def bm25(query, titles):
+    """Reference scores, straight from the BM25 formula.
+
+    The plural stripping is only as thorough as these titles need.
+    """
+    docs = [
+        [w[:-1] if w.endswith("s") and len(w) > 4 else w for w in t.split()]
+        for t in titles
+    ]
+    average = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in query.split():
+            df = sum(term in d for d in docs)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            tf = doc.count(term)
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(doc) / average))
+        scores.append(score)
+    return scores
+
+
+def search_index(tmp_path, product_names):
+    update_search_index(product_table(product_names), str(tmp_path))
+    return load_search_index(str(tmp_path))
+
+
+def test_bm25_ranking(tmp_path):
+    index = search_index(tmp_path, ["jade", "jade", "jade", "ink", "ink"])
+    results = index.search("jade bangle")
+    expected = bm25("jade bangle", TITLES)
+    assert results["listing_id"].tolist() == [0, 2, 1]
+    for listing_id, score in zip(results["listing_id"], results["score"]):
+        assert math.isclose(score, expected[listing_id])
+
+
+def scores(index, query):
+    return index.search(query).set_index("listing_id")["score"].sort_index()
+
+
+def test_scores_do_not_depend_on_the_segments(tmp_path):
+    split = search_index(tmp_path / "split", ["a", "b", "a", "b", "a"])
+    single = search_index(tmp_path / "single", ["a"] * 5)
+    for query in ["brush", "jade pendant", "bangles"]:
+        pd.testing.assert_series_equal(scores(split, query), scores(single, query))
+
+
+def test_filters(tmp_path):
+    index = search_index(tmp_path, ["jade", "jade", "jade", "ink", "ink"])
+    assert index.search("brush", max_price=20)["listing_id"].tolist() == [4]
+    assert index.search("jade", has_sales=True)["listing_id"].tolist() == [0]
+    assert index.search("bangle", product_names=["ink"]).empty
+    assert index.search("unknown").empty
+    # Without query terms, the filtered listings are ranked by sales
+    assert index.search("", min_price=12)["listing_id"].tolist() == [2, 0, 3, 1]
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from snapshots import (
+    append_snapshot,
+    category_history,
+    load_history,
+    load_latest,
+    metric_columns,
+    to_snapshot,
+)
+
+
+def export_rows(rows):
+    df = pd.DataFrame(rows, columns=["listing_id", "product_name", "Total Sales"])
+    for col in metric_columns:
+        if col != "Total Sales":
+            df[col] = 0
+    return df
+
+
+def test_listing_shared_across_categories(tmp_path):
+    output_folder = str(tmp_path)
+    first = export_rows(
+        [(1, "name seals", 10), (1, "calligraphy prints", 10), (2, "name seals", 5)]
+    )
+    assert append_snapshot(to_snapshot(first, "2024-01-01"), output_folder) == 3
+
+    # Listing 1 sold in between, it is rescraped in both categories
+    second = export_rows(
+        [(1, "name seals", 12), (1, "calligraphy prints", 12), (2, "name seals", 5)]
+    )
+    assert append_snapshot(to_snapshot(second, "2024-01-02"), output_folder) == 2
+
+    latest = load_latest(output_folder)
+    assert len(latest) == 3
+    assert set(latest["product_name"]) == {"name seals", "calligraphy prints"}
+    assert (latest.loc[latest["listing_id"] == 1, "Total Sales"] == 12).all()
+
+    prints = load_history(
+        product_names=["calligraphy prints"], output_folder=output_folder
+    )
+    assert prints["listing_id"].tolist() == [1, 1]
+    for product_name, totals in [
+        ("name seals", [15, 17]),
+        ("calligraphy prints", [10, 12]),
+    ]:
+        history = category_history(
+            product_name, "Total Sales", output_folder=output_folder
+        )
+        assert history.tolist() == totals
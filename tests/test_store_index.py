@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+import synthetic
+from aggregates import STORE_COLUMN
+from store_index import build_store_index, load_store_index, write_store_index
+
+
+@pytest.fixture(scope="module")
+def product_table():
+    df = synthetic.generate_product_data(3000, seed=2)
+    # Some listings are found again in another category
+    again = df.iloc[:200].assign(product_name="chinese magnets")
+    return pd.concat([df, again], ignore_index=True)
+
+
+@pytest.fixture(scope="module")
+def index(product_table, tmp_path_factory):
+    output_folder = str(tmp_path_factory.mktemp("output"))
+    write_store_index(build_store_index(product_table), output_folder)
+    return load_store_index(output_folder)
+
+
+def test_profile(index, product_table):
+    listings = product_table.drop_duplicates("listing_id")
+    store = listings[STORE_COLUMN].value_counts().index[0]
+    rows = listings[listings[STORE_COLUMN] == store]
+    profile = index.profile(store)
+    assert profile["listings"] == len(rows)
+    assert profile["total_sales"] == rows["Total Sales"].sum()
+    assert profile["median_price"] == pytest.approx(rows["price"].median())
+    assert profile["product_names"].tolist() == sorted(
+        product_table.loc[product_table[STORE_COLUMN] == store, "product_name"].unique()
+    )
+    assert store in index and "no such store" not in index
+    with pytest.raises(KeyError):
+        index.profile("no such store")
+
+
+def test_listings_slices(index, product_table):
+    listings = product_table.drop_duplicates("listing_id")
+    for store in index.names[::50]:
+        expected = listings[listings[STORE_COLUMN] == store]
+        sliced = index.listings(store)
+        assert set(sliced["listing_id"]) == set(expected["listing_id"])
+        assert sliced["Total Sales"].is_monotonic_decreasing
+
+
+def test_top(index, product_table):
+    listings = product_table.drop_duplicates("listing_id")
+    sales = listings.groupby(STORE_COLUMN)["Total Sales"].sum()
+    top = index.top("total_sales", k=10)
+    assert top["total_sales"].tolist() == sales.nlargest(10).tolist()
+    assert "start" not in top
+    assert len(index.top("median_price", k=len(index.names) + 5)) == len(index.names)
+
+
+def test_top_in_a_category(index, product_table):
+    for product_name in ["chinese magnets", index.product_names[0]]:
+        rows = product_table[product_table["product_name"] == product_name]
+        sales = rows.drop_duplicates("listing_id").groupby(STORE_COLUMN)["Total Sales"]
+        top = index.top("total_sales", k=5, product_name=product_name)
+        assert len(top) == 5
+        assert top["total_sales"].tolist() == sales.sum().nlargest(5).tolist()
+        assert (top["product_name"] == product_name).all()
+    assert index.top(product_name="no such category").empty
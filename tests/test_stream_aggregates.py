@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+import synthetic
+from aggregates import CATEGORY_COLUMN, build_aggregates, source_columns
+from sketches import RELATIVE_ACCURACY
+from stream_aggregates import StreamingAggregates, relative_errors, stream_aggregates
+
+STORE_CAPACITY = 20
+# Standard error of the HyperLogLog, allowed three times over
+HLL_ERROR = 3 * 0.008
+
+
+@pytest.fixture(scope="module")
+def product_table():
+    return synthetic.generate_product_data(20_000, seed=1)[source_columns]
+
+
+def chunks(df, rows=3000):
+    for start in range(0, len(df), rows):
+        yield df.iloc[start : start + rows]
+
+
+def test_within_the_documented_bounds(product_table):
+    streamed = stream_aggregates(chunks(product_table), store_capacity=STORE_CAPACITY)
+    errors = relative_errors(streamed, build_aggregates(product_table))
+    assert errors["Product URL|nunique"] <= HLL_ERROR
+    medians = errors[errors.index.str.endswith("|median")]
+    assert (medians <= RELATIVE_ACCURACY + 1e-9).all()
+    assert errors["sales_share (absolute)"] <= 1 / (STORE_CAPACITY + 1)
+    exact = errors.drop(
+        ["Product URL|nunique", "sales_share (absolute)", *medians.index]
+    )
+    assert (exact < 1e-9).all()
+
+
+def test_other_stores_complete_the_shares(product_table):
+    streamed = stream_aggregates(chunks(product_table), store_capacity=STORE_CAPACITY)
+    category_store = streamed["category_store"]
+    shares = category_store.groupby(CATEGORY_COLUMN)["sales_share"].sum()
+    assert shares.to_numpy() == pytest.approx(1.0)
+    assert (category_store.groupby(CATEGORY_COLUMN).size() <= STORE_CAPACITY + 1).all()
+
+
+def test_merged_parts_match_one_pass(product_table):
+    one_pass = stream_aggregates(chunks(product_table))
+    parts = []
+    for half in (product_table.iloc[:7000], product_table.iloc[7000:]):
+        part = StreamingAggregates()
+        for chunk in chunks(half):
+            part.update(chunk)
+        parts.append(part)
+    parts[0].merge(parts[1])
+    merged = parts[0].result()
+    pd.testing.assert_frame_equal(merged["category"], one_pass["category"])
+    pd.testing.assert_frame_equal(merged["category_store"], one_pass["category_store"])
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from tag_index import TagIndex, build_tag_index, load_tag_index, write_tag_index
+
+
+def product_table():
+    return pd.DataFrame(
+        {
+            "listing_id": [10, 11, 12, 13, 10],
+            "product_name": ["seals", "seals", "seals", "prints", "prints"],
+            "Total Sales": [5, 0, 7, 3, 5],
+            "proceeds": [50.0, 0.0, 70.0, 30.0, 50.0],
+            "Tags": [
+                ["Name Seal", "gift", "chinese"],
+                ["name  seal", "Stamp"],
+                ["Chinese", "name seal", "gift", "gift"],
+                ["wall art", "chinese"],
+                ["Name Seal", None, " ", "wall art"],
+            ],
+        }
+    )
+
+
+def test_postings_round_trip(tmp_path):
+    write_tag_index(build_tag_index(product_table()), str(tmp_path))
+    index = load_tag_index(str(tmp_path))
+    # Tags are normalized, duplicates within a listing are posted once
+    assert index.postings("name seal").tolist() == [0, 1, 2, 4]
+    assert index.postings("NAME SEAL").tolist() == [0, 1, 2, 4]
+    assert index.postings("chinese").tolist() == [0, 2, 3]
+    assert index.postings("gift").tolist() == [0, 2]
+    assert index.postings("unknown").tolist() == []
+    assert list(index.tags) == ["chinese", "gift", "name seal", "stamp", "wall art"]
+    # Labels keep the most common spelling
+    assert index.labels[list(index.tags).index("name seal")] == "Name Seal"
+    pd.testing.assert_frame_equal(index.documents, product_table().drop(columns="Tags"))
+
+
+def test_decoding_matches_a_direct_scan():
+    rng = np.random.default_rng(0)
+    vocabulary = [f"tag {i}" for i in range(40)]
+    df = pd.DataFrame(
+        {
+            "listing_id": np.arange(300),
+            "product_name": rng.choice(["a", "b"], 300),
+            "Total Sales": rng.integers(0, 50, 300),
+            "proceeds": rng.random(300),
+            "Tags": [
+                list(rng.choice(vocabulary, rng.integers(0, 8))) for _ in range(300)
+            ],
+        }
+    )
+    index = TagIndex(**build_tag_index(df))
+    for tag in vocabulary:
+        expected = [doc for doc, tags in enumerate(df["Tags"]) if tag in tags]
+        assert index.postings(tag).tolist() == expected
+
+
+def test_match_all():
+    index = TagIndex(**build_tag_index(product_table()))
+    assert index.match_all(["name seal", "chinese"])["listing_id"].tolist() == [10, 12]
+    assert index.match_all(["gift", "Name Seal", "chinese"]).index.tolist() == [0, 2]
+    assert index.match_all(["name seal"], "prints").index.tolist() == [4]
+    assert index.match_all(["name seal", "unknown"]).empty
+    assert index.match_all([]).empty
+
+
+def test_top_tags_and_co_occurring():
+    index = TagIndex(**build_tag_index(product_table()))
+    top = index.top_tags()
+    assert top["tag"].tolist()[:2] == ["Name Seal", "chinese"]
+    assert top["Total Sales"].tolist()[:2] == [17, 15]
+    # Tags without sales are left out
+    assert "Stamp" not in top["tag"].tolist()
+    assert index.top_tags("prints", weight="listings")["listings"].tolist() == [2, 1, 1]
+    co = index.co_occurring("gift")
+    assert dict(zip(co["tag"], co["listings"])) == {"chinese": 2, "Name Seal": 2}
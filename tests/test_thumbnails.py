@@ -0,0 +1,82 @@
+import asyncio
+import json
+import urllib.request
+
+import pytest
+from PIL import Image
+
+import mock_etsyhunt
+import thumbnails
+from thumbnails import ThumbnailCache
+
+
+@pytest.fixture
+def base_url():
+    server = mock_etsyhunt.serve(0)
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def image_urls(base_url, names):
+    return [f"{base_url}/images/{name}.jpg" for name in names]
+
+
+def images_served(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats") as r:
+        stats = json.load(r)
+    return sum(
+        len(times) for path, times in stats.items() if path.startswith("/images/")
+    )
+
+
+def fetch(urls, cache):
+    return asyncio.run(thumbnails.fetch_thumbnails(urls, cache, concurrency=4))
+
+
+def test_cold_then_warm(base_url, tmp_path):
+    urls = image_urls(base_url, range(6))
+    cache = ThumbnailCache(str(tmp_path))
+    digests = fetch(urls, cache)
+    assert all(digests.values())
+    assert images_served(base_url) == 6
+
+    # A new cache on the same folder finds them all, without downloading
+    cache.save()
+    cache = ThumbnailCache(str(tmp_path))
+    assert fetch(urls, cache) == digests
+    assert images_served(base_url) == 6
+
+
+def test_evicts_least_recently_used(base_url, tmp_path):
+    urls = image_urls(base_url, range(4))
+    cache = ThumbnailCache(str(tmp_path))
+    digests = fetch(urls, cache)
+    size = max(entry["size"] for entry in cache.objects.values())
+    # Use the first thumbnail again, it becomes the most recently used
+    for url in urls[1:]:
+        cache.objects[digests[url]]["used"] = 0
+    cache.get(urls[0])
+
+    cache.max_bytes = 2 * size
+    keep = frozenset([digests[urls[3]]])
+    assert cache.evict(keep) == 2
+    assert set(cache.objects) == {digests[urls[0]], digests[urls[3]]}
+    assert set(cache.urls) == {urls[0], urls[3]}
+    assert cache.get(urls[1]) is None
+
+
+def test_failures_are_per_image(base_url, tmp_path, monkeypatch):
+    urls = image_urls(base_url, ["a", "b"])
+    missing = f"{base_url}/images/removed"
+    cache = ThumbnailCache(str(tmp_path))
+    digests = fetch(urls + [missing], cache)
+    assert digests[missing] is None
+    assert all(digests[url] for url in urls)
+    # A 404 is not retried
+    assert images_served(base_url) == 3
+
+    # Decoding errors other than OSError only fail their own image
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    urls = image_urls(base_url, ["c", "d"])
+    assert fetch(urls, cache) == {url: None for url in urls}
@@ -0,0 +1,113 @@
+import csv
+
+import pandas as pd
+
+from validation import MAX_EXTRA_FIELDS, realign_rows, schema, validate_export
+
+
+def row(title="Jade bangle", listing=1, **values):
+    fields = {
+        "Title": title,
+        "Category": "Jewelry",
+        'Price("$")': "25.00",
+        "7-day sales": "1",
+        "Total Sales": "10",
+        "Total Reviews": "3",
+        "7-day Reviews": "False",
+        "Total Favorites": "7",
+        "7-day Favorites": "0",
+        "Tags": "jade,bangle",
+        "Ship From": "China",
+        "Release Time": "2023-05-01",
+        "Best Seller": "no",
+        "Etsy Pick": "False",
+        "Raving": "True",
+        "Store Name": "JadeStore",
+        "Product URL": f"https://www.etsy.com/listing/{listing}/jade",
+        "Image URL": "Upgrade Pro to Unlock",
+    }
+    fields.update(values)
+    return list(fields.values())
+
+
+def shifted(title_parts, listing):
+    """A row whose title had unquoted commas, spilling into the next fields."""
+    return title_parts + row(listing=listing)[1:]
+
+
+def write_export(path, rows, header=None):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(schema) if header is None else header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_realign_rows():
+    columns = list(schema) + [f"_extra_{i}" for i in range(MAX_EXTRA_FIELDS)]
+    rows = [row(listing=1), shifted(["Jade", " green", " 6 mm"], 2)]
+    raw = pd.DataFrame(
+        [fields + [None] * (len(columns) - len(fields)) for fields in rows],
+        columns=columns,
+    )
+    realigned, fixed = realign_rows(raw)
+    assert fixed == 1
+    assert list(realigned.columns) == list(schema)
+    assert realigned["Title"].tolist() == ["Jade bangle", "Jade, green, 6 mm"]
+    assert realigned.iloc[1, 1:].tolist() == row(listing=2)[1:]
+
+
+def test_short_long_and_shifted_rows(tmp_path):
+    too_long = shifted(["a"] * (MAX_EXTRA_FIELDS + 2), 4)
+    path = write_export(
+        tmp_path / "export.csv",
+        [
+            too_long,
+            row(listing=1),
+            shifted(["Jade", " green"], 2),
+            row(listing=3)[:10],
+            row(listing=5, **{"7-day sales": "11"}),
+            too_long,
+        ],
+    )
+    df, quarantined, stats = validate_export(path)
+    assert df["Title"].tolist() == ["Jade bangle", "Jade, green"]
+    # Repaired values: in2csv booleans in counts, no/yes flags
+    assert df["7-day Reviews"].tolist() == [0, 0]
+    assert not df["Best Seller"].any() and df["Raving"].all()
+
+    reasons = quarantined["reasons"].tolist()
+    assert "bad URL" in reasons[0] and "bad Store Name" not in reasons[0]
+    assert reasons[1] == "7-day sales above total"
+    assert reasons[2:] == ["too many fields", "too many fields"]
+    assert quarantined["Title"].iloc[2].startswith("a,a,a")
+    assert stats["rows"] == 6
+    assert stats["valid_rows"] == 2
+    assert stats["quarantined_rows"] == 4
+    assert stats["realigned_rows"] == 1
+    assert stats["invalid_values"]["too many fields"] == 2
+    # The short row ends before the flags
+    assert stats["repaired_values"] == {"7-day Reviews": 4, "Best Seller": 3}
+
+
+def test_unexpected_header_quarantines_the_file(tmp_path):
+    header = list(schema)
+    header[3], header[4] = header[4], header[3]
+    path = write_export(tmp_path / "swapped.csv", [row(listing=1)], header)
+    df, quarantined, stats = validate_export(path)
+    assert df.empty
+    assert quarantined["reasons"].tolist() == ["unexpected header"]
+    assert stats["invalid_values"] == {"unexpected header": 1}
+
+    header = list(schema)[:-1] + ["Image"]
+    path = write_export(tmp_path / "renamed.csv", [row(listing=1)], header)
+    df, quarantined, _ = validate_export(path)
+    assert df.empty and len(quarantined) == 1
+
+
+def test_header_with_byte_order_mark(tmp_path):
+    path = tmp_path / "bom.csv"
+    write_export(path, [row(listing=1)])
+    path.write_bytes(b"\xef\xbb\xbf" + path.read_bytes())
+    df, quarantined, _ = validate_export(str(path))
+    assert len(df) == 1 and quarantined.empty